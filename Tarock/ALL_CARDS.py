@@ -1,6 +1,7 @@
 from dataclasses import dataclass
 from typing import List
-from game import Direction
+from direction import Direction
+
 
 class CardInfo:
     '''
@@ -14,7 +15,9 @@ class CardInfo:
             When attacking: the card ignores the defense of the cards in these directions. If the card being attacked doesn't have a defense in the opposite direction, the attack is automatically successful. Otherwise, the outcome depends on a coin toss.
             When defending: the card ignores the attack of the cards in these directions. If the card being attacked doesn't have an attack in the opposite direction, the attack is automatically failed. Otherwise, the outcome depends on a coin toss.
     '''
-    def __init__(self, name: str = "Unknown", attack: int = -1, defense: int = -1, directions: List[Direction] = []):
+
+    def __init__(self, name: str = "Unknown", attack: int = -1,
+                 defense: int = -1, directions: List[Direction] = []):
         self.name = name
         self.attack = attack
         self.defense = defense
@@ -136,11 +139,13 @@ ALL_CARDS = [
     CardInfo(name="Spiderbot", attack=3, defense=7),
     CardInfo(name="Kaktos", attack=5, defense=4, directions=[Direction.UP]),
     CardInfo(name="Gillman Warriors", attack=4, defense=7),
-    CardInfo(name="Galactoss", attack=6, defense=4, directions=[Direction.DOWN]),
+    CardInfo(name="Galactoss", attack=6, defense=4,
+             directions=[Direction.DOWN]),
     CardInfo(name="Arcadian Soldiers", attack=5, defense=6),
     CardInfo(name="Owru Bandit", attack=6, defense=5),
     CardInfo(name="Security Drone", attack=7, defense=4),
     CardInfo(name="Ghost", attack=6, defense=7),
 ]
 
-name_to_cardinfo = {card.name: card for card in ALL_CARDS}
\ No newline at end of file
+name_to_cardinfo = {card.name: card for card in ALL_CARDS}
+name_to_card_id = {card.name: i for i, card in enumerate(ALL_CARDS)}
@@ -1,112 +1,134 @@
 from game import *
 from tarock_player import TarockBasePlayer
+from ai.endgame_solver import EndgameSolver, EndgameTimeout
+from fast_state import FastGameState
+from opening_book import OpeningBook
 import copy
 
+
 class TarockBaseAi(TarockBasePlayer):
+    # the exact solver used instead of the AI's own logic once few cells are
+    # empty, see enable_endgame_solver
+    endgame_solver: Optional[EndgameSolver] = None
+
+    # the precomputed first moves played instead of the AI's own logic, see
+    # set_opening_book
+    opening_book: Optional[OpeningBook] = None
+
+    def set_opening_book(self, opening_book: Optional[OpeningBook]):
+        '''
+        Makes the AI play the book move whenever the position is an opening found in the book. None turns the book off.
+        '''
+        self.opening_book = opening_book
+
+    def _get_book_move(
+            self,
+            game_state: GameState
+    ) -> Optional[Tuple[Tuple[int, int], Card]]:
+        '''
+        Returns the book move if an opening book is set and has the position, None otherwise.
+        '''
+        if self.opening_book is None:
+            return None
+        return self.opening_book.lookup_game_state(game_state)
+
+    def enable_endgame_solver(self, max_empty_cells: int = 4):
+        '''
+        Makes the AI play perfectly, using an EndgameSolver, once at most max_empty_cells cells are empty.
+        '''
+        self.endgame_solver = EndgameSolver(max_empty_cells)
+
+    def _get_endgame_move(
+            self,
+            game_state: GameState,
+            deadline: Optional[float] = None
+    ) -> Optional[Tuple[Tuple[int, int], Card]]:
+        '''
+        Returns the solved move if the endgame solver is enabled and the position is within its reach, None otherwise.
+        If a deadline (a perf_counter time) is given and the solver does not finish by then, None is returned too, and the AI falls back to its own logic.
+        '''
+        if self.endgame_solver is None:
+            return None
+        state = FastGameState.from_game_state(game_state)
+        if not self.endgame_solver.can_solve(state):
+            return None
+        try:
+            _, (cell, card) = self.endgame_solver.solve(state, deadline)
+        except EndgameTimeout:
+            return None
+        return FastGameState.cell_to_coords(cell), Card.get_card_by_id(card)
+
     @staticmethod
-    def simulate_move(coords: Tuple[int, int], card: Card, current_state: GameState) -> GameState:
+    def simulate_move(coords: Tuple[int, int], card: Card,
+                      current_state: GameState) -> GameState:
         '''
         Simulates placing a card on the board. The card is placed on the given cell and the cell is marked as owned by the given player. Returns a new game state with the new board.
         '''
         temp_state = copy.copy(current_state)
 
-        # HACK: find the card in the player's hand,
-        copied_card = card
-        for c in temp_state.player_hands[temp_state.get_next_player()]:
-            if c == card:
-                copied_card = c
-                break
-
         # place the card on the board and remove it from the player's hand
-        temp_state.board.cells[coords[0]][coords[1]].card = card
-        temp_state.board.cells[coords[0]][coords[1]].owner = temp_state.get_next_player()
-        temp_state.player_hands[temp_state.get_next_player()].remove(copied_card)
+        temp_state.place_card_for_next_player(coords, card)
 
         # generate the events that this card causes
-        attack_events = TarockBaseAi._generate_attack_events_for_placement(coords, copied_card, temp_state.get_next_player(), temp_state.board)
+        attack_events = TarockBaseAi._generate_attack_events_for_placement(
+            coords, card, temp_state.get_next_player(), temp_state.board)
         for attack_event in attack_events:
-            TarockBaseAi._resolve_attack_event(attack_event, temp_state.board)
+            TarockBaseAi._resolve_attack_event(attack_event, temp_state)
 
         # change the next player
-        temp_state.next_player = 1 - temp_state.next_player
+        temp_state.switch_next_player()
 
         return temp_state
 
     @staticmethod
-    def _generate_attack_events_for_placement(coords: Tuple[int, int], card: Card, player: int, board: Board):
+    def _generate_attack_events_for_placement(
+            coords: Tuple[int, int], card: Card, player: int, board: Board):
         '''
         Generates the attack events that this card causes.
         '''
         events = []
-        for direction in Direction.all_directions():
+        cells = board.cells
+        for defense_cell_coords, direction, _ in Board.NEIGHBORS[coords]:
 
             # get the defense cell in the given direction
-            try:
-                defense_cell_coords = Board.get_adj_coord_in_direction(coords, direction)
-                defense_cell = board.get_cell_value(defense_cell_coords)
-            except ValueError:
-                continue
+            defense_cell = cells[defense_cell_coords[0]][defense_cell_coords[1]]
 
             # if the defense cell is empty, no event is generated
             if defense_cell.card is None:
                 continue
 
-            # if the defense cell is owned by the attacking player, no event is generated
+            # if the defense cell is owned by the attacking player, no event is
+            # generated
             if defense_cell.owner == player:
                 continue
 
-            # if the defense cell is owned by the other player, an event is generated
-            new_event = AttackEvent(card, defense_cell.card, coords, defense_cell_coords, player)
+            # if the defense cell is owned by the other player, an event is
+            # generated
+            new_event = AttackEvent(
+                card, defense_cell.card, coords, defense_cell_coords, player, direction)
             events.append(new_event)
 
         return events
-    
+
     @staticmethod
-    def _resolve_attack_event(event: AttackEvent, board: Board):
+    def _resolve_attack_event(event: AttackEvent, game_state: GameState):
         '''
         Resolves an event. Nothing happens if the attack is unsuccessful. If the attack is successful, the defender's ownership is transfered to the attacker.
         '''
         attack_successful = TarockBaseAi._determine_attack_event_outcome(event)
         if attack_successful:
-            defender_cell = board.get_cell_value(event.defender_coords)
-            defender_cell.owner = event.intiating_player
+            game_state.set_cell_owner(
+                event.defender_coords, event.intiating_player)
 
     @staticmethod
     def _determine_attack_event_outcome(event: AttackEvent) -> bool:
         '''
         Determines the outcome of an attack event.
         '''
-        # determine the attack and defense directions and check for overpowering
-        attack_direction = Board.get_direction_of_other_about_this(event.attacker_coords, event.defender_coords)
-        defense_direction = Board.get_direction_of_other_about_this(event.defender_coords, event.attacker_coords)
-        attack_overpower = attack_direction in event.attacker.directions
-        defense_overpower = defense_direction in event.defender.directions
-
-        # attack is unsuccessful by default
-        attack_successful = False
-
-        # if both overpower, coin flip to determine outcome
-        if attack_overpower and defense_overpower:
+        # look up the outcome of the attack, only coin flips need more work
+        outcome = ATTACK_OUTCOMES[event.attacker.id][event.defender.id][
+            event.direction.value - 1]
+        if outcome == ATTACK_COINFLIP:
             favored_player = random.randint(0, 1)
-            attack_successful = favored_player == event.intiating_player
-
-        # if only the attack overpowers, the attack is successful
-        elif attack_overpower:
-            attack_successful = True
-
-        # if only the defense overpowers, the attack is unsuccessful
-        elif defense_overpower:
-            attack_successful = False
-
-        # if neither overpower, compare the attack and defense values
-        else:
-            attack_advantage = event.attacker.attack - event.defender.defense
-            if attack_advantage > 0:
-                attack_successful = True
-            elif attack_advantage < 0:
-                attack_successful = False
-            else:
-                favored_player = random.randint(0, 1)
-                attack_successful = favored_player == event.intiating_player
-
-        return attack_successful
\ No newline at end of file
+            return favored_player == event.intiating_player
+        return outcome == ATTACK_WIN
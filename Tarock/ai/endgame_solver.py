@@ -0,0 +1,110 @@
+from game import *
+from fast_state import FastGameState, NUM_CELLS
+import time
+
+# how many positions are solved between two checks of the deadline
+DEADLINE_CHECK_INTERVAL = 64
+
+
+class EndgameTimeout(Exception):
+    '''
+    Raised inside the solver when the deadline has passed, to unwind it. The positions solved so far stay memoized.
+    '''
+
+
+class EndgameSolver:
+    '''
+    Solves positions with few empty cells exactly, by full expectiminimax over all moves and coinflip outcomes.
+
+    The value of a position is the expected final score (number of cards owned at the end) of the player to move, assuming both players play to maximize their own expected final score.
+    Results are memoized by Zobrist key, so positions are solved once per solver, across moves and games.
+    '''
+
+    def __init__(self, max_empty_cells: int = 4,
+                 max_table_size: int = 1_000_000):
+        self.max_empty_cells = max_empty_cells
+        self.max_table_size = max_table_size
+
+        # maps a zobrist key to a (value, best move) tuple
+        self.solved = {}
+
+        # the perf_counter time at which solve gives up, and the number of
+        # positions visited so far
+        self.deadline = None
+        self.nodes_solved = 0
+
+    def can_solve(self, state: FastGameState) -> bool:
+        return NUM_CELLS - \
+            bin(state.occupied).count("1") <= self.max_empty_cells
+
+    def solve(
+            self,
+            state: FastGameState,
+            deadline: Optional[float] = None
+    ) -> Tuple[float, Optional[Tuple[int, int]]]:
+        '''
+        Returns the exact value of the state for the player to move and the (cell, card) move achieving it, or None if the game is over.
+        Raises EndgameTimeout if a deadline (a perf_counter time) is given and passes first, leaving the state as it was given.
+        '''
+        if len(self.solved) > self.max_table_size:
+            self.solved.clear()
+        self.deadline = deadline
+        self.nodes_solved = 0
+        try:
+            return self._solve(state)
+        finally:
+            self.deadline = None
+
+    def solve_game_state(
+            self,
+            game_state: GameState
+    ) -> Tuple[float, Optional[Tuple[Tuple[int, int], Card]]]:
+        '''
+        Same as solve, for a GameState. The move is returned as ((row, col), card).
+        '''
+        value, move = self.solve(FastGameState.from_game_state(game_state))
+        if move is None:
+            return value, None
+        return value, (FastGameState.cell_to_coords(
+            move[0]), Card.get_card_by_id(move[1]))
+
+    def _solve(
+            self,
+            state: FastGameState
+    ) -> Tuple[float, Optional[Tuple[int, int]]]:
+        if self.deadline is not None:
+            self.nodes_solved += 1
+            if self.nodes_solved % DEADLINE_CHECK_INTERVAL == 0 and \
+                    time.perf_counter() >= self.deadline:
+                raise EndgameTimeout()
+
+        if state.is_terminal():
+            return state.get_scores()[state.next_player], None
+
+        key = state.zobrist_key
+        result = self.solved.get(key)
+        if result is not None:
+            return result
+
+        # every card ends up on the board, so the scores at the end add up to
+        # the number of cells
+        best_value = -1.0
+        best_move = None
+        for move in state.legal_moves():
+            value = 0.0
+            for probability, captures in state.get_chance_outcomes(*move):
+                # unmake the move even if the deadline passes below, so the
+                # caller gets its state back
+                state.make_move(move[0], move[1], captures)
+                try:
+                    opponent_value, _ = self._solve(state)
+                finally:
+                    state.unmake_move()
+                value += probability * (NUM_CELLS - opponent_value)
+            if value > best_value:
+                best_value = value
+                best_move = move
+
+        result = (best_value, best_move)
+        self.solved[key] = result
+        return result
@@ -0,0 +1,315 @@
+from game import *
+from ai.base_ai import TarockBaseAi
+from ai.heuristic_ai import BaseHeuristicAI, AdvancedHeuristicAI
+from ai.parallel_search import ParallelSearchMixin
+from fast_state import FastGameState, NUM_CELLS
+import time
+
+# bounds of the search values: the difference between the evaluations of
+# player 0 and player 1, where a finished game is worth 100 to its winner
+MAX_VALUE = 100.0
+MIN_VALUE = -100.0
+
+# kinds of transposition table entries
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+# how many nodes are searched between two checks of the deadline
+DEADLINE_CHECK_INTERVAL = 64
+
+
+class SearchTimeout(Exception):
+    '''
+    Raised inside the search when the deadline has passed, to unwind it.
+    '''
+
+
+class ExpectiminimaxAI(ParallelSearchMixin, TarockBaseAi):
+    '''
+    Depth-limited expectiminimax search over FastGameState, with alpha-beta pruning at the decision nodes and Star1 pruning at the coinflip (chance) nodes.
+
+    Search values are always from the point of view of player 0: player 0 maximizes, player 1 minimizes, and coinflips average. This lets the transposition table be shared across moves and games.
+    The leaves are scored with the evaluate_state function of a heuristic AI, clipped to [MIN_VALUE, MAX_VALUE] so that Star1 has bounds to work with.
+    If the heuristic AI has an incremental evaluator, the search makes its moves through it and scores the leaves without converting them to GameStates.
+
+    Given a time budget, get_move deepens iteratively from depth 1 up to max_depth, and plays the best move of the deepest search finished in time.
+
+    With workers > 1, the root moves are split round-robin (in search order) over that many worker processes, each searching its share with
+    its own alpha-beta window and transposition table, and the best of their best moves is played.
+    '''
+
+    def __init__(self, evaluator: Optional[BaseHeuristicAI] = None,
+                 max_depth: int = 3, max_table_size: int = 1_000_000,
+                 workers: int = 1):
+        self.evaluator = evaluator if evaluator is not None else AdvancedHeuristicAI()
+        self.max_depth = max_depth
+        self.max_table_size = max_table_size
+        self.workers = workers
+
+        # the perf_counter time at which a timed search stops, and the number of
+        # nodes searched so far
+        self.deadline = None
+        self.nodes_searched = 0
+
+        # the incremental evaluator following the state of the current search,
+        # if the heuristic AI has one
+        self.incremental_evaluator = None
+
+        # maps a zobrist key to a (depth, value, kind, best move) tuple
+        self.transposition_table = {}
+
+    def get_move(
+            self,
+            game_state: GameState,
+            time_budget: Optional[float] = None
+    ) -> Tuple[Tuple[int, int], Card]:
+        deadline = time.perf_counter() + time_budget if time_budget is not None else None
+
+        # play from the opening book, if one is set and has the position
+        book_move = self._get_book_move(game_state)
+        if book_move is not None:
+            return book_move
+
+        # switch to the exact solver in the endgame, if enabled
+        endgame_move = self._get_endgame_move(game_state, deadline)
+        if endgame_move is not None:
+            return endgame_move
+
+        state = FastGameState.from_game_state(game_state)
+        if self.workers > 1:
+            moves = self._get_ordered_moves(state)
+            tasks = [moves[i::self.workers]
+                     for i in range(min(self.workers, len(moves)))]
+            time_budget = deadline - time.perf_counter() if deadline is not None else None
+            cell, card = self._search_root_moves_in_parallel(
+                state, tasks, time_budget)
+        elif deadline is not None:
+            _, (cell, card) = self._search_iteratively(state, deadline)
+        else:
+            _, (cell, card) = self._search_root(state, self.max_depth)
+        return FastGameState.cell_to_coords(cell), Card.get_card_by_id(card)
+
+    def _search_root_moves(
+            self,
+            state: FastGameState,
+            moves: List[Tuple[int, int]],
+            time_budget: Optional[float]
+    ) -> List[Tuple[Tuple[int, int], float]]:
+        '''
+        The worker side of the parallel search: returns the best of the given moves with its value for the player to move.
+        '''
+        if time_budget is not None:
+            value, move = self._search_iteratively(
+                state, time.perf_counter() + time_budget, moves)
+        else:
+            value, move = self._search_root(state, self.max_depth, moves)
+        return [(move, value if state.next_player == 0 else -value)]
+
+    def _search_iteratively(
+            self,
+            state: FastGameState,
+            deadline: float,
+            moves: Optional[List[Tuple[int, int]]] = None
+    ) -> Tuple[float, Tuple[int, int]]:
+        '''
+        Searches depth 1, 2, ... up to max_depth (or the end of the game) until the deadline passes, over the given root moves or all of them.
+        Returns the result of the deepest search finished in time. If not even depth 1 finishes, the first move is returned with the worst value.
+        '''
+        if moves is None:
+            moves = self._get_ordered_moves(state)
+        empty_cells = NUM_CELLS - bin(state.occupied).count("1")
+        result = (MIN_VALUE if state.next_player == 0 else MAX_VALUE, moves[0])
+
+        self.deadline = deadline
+        self.nodes_searched = 0
+        try:
+            for depth in range(1, min(self.max_depth, empty_cells) + 1):
+                result = self._search_root(state, depth, moves)
+
+                # search the best move of this depth first at the next one
+                moves = [result[1]] + \
+                    [move for move in moves if move != result[1]]
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+        return result
+
+    def _search_root(
+            self,
+            state: FastGameState,
+            depth: int,
+            moves: Optional[List[Tuple[int, int]]] = None
+    ) -> Tuple[float, Tuple[int, int]]:
+        '''
+        Searches the given number of plies from the state, over the given root moves or all of them. Returns the value of the state and the best move for the player to move.
+        '''
+        if len(self.transposition_table) > self.max_table_size:
+            self.transposition_table.clear()
+        self.incremental_evaluator = self.evaluator.get_incremental_evaluator(
+            state)
+
+        maximizing = state.next_player == 0
+        alpha, beta = MIN_VALUE, MAX_VALUE
+        best_value = None
+        best_move = None
+        if moves is None:
+            root_moves = self._get_ordered_moves(state)
+        else:
+            root_moves = moves
+        for move in root_moves:
+            value = self._search_chance(state, move, depth, alpha, beta)
+            if best_value is None or \
+                    (value > best_value if maximizing else value < best_value):
+                best_value = value
+                best_move = move
+            if maximizing:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+
+        # a search over some of the moves only bounds the value of the state
+        if moves is None:
+            self.transposition_table[state.zobrist_key] = (
+                depth, best_value, EXACT, best_move)
+        return best_value, best_move
+
+    def _search(self, state: FastGameState, depth: int,
+                alpha: float, beta: float) -> float:
+        '''
+        Returns the value of a decision node, searched to the given depth within the (alpha, beta) window.
+        '''
+        if self.deadline is not None:
+            self.nodes_searched += 1
+            if self.nodes_searched % DEADLINE_CHECK_INTERVAL == 0 and \
+                    time.perf_counter() >= self.deadline:
+                raise SearchTimeout()
+
+        if depth == 0 or state.is_terminal():
+            return self._evaluate(state)
+
+        # probe the transposition table
+        key = state.zobrist_key
+        entry = self.transposition_table.get(key)
+        table_move = None
+        if entry is not None:
+            entry_depth, entry_value, entry_kind, table_move = entry
+            if entry_depth >= depth:
+                if entry_kind == EXACT:
+                    return entry_value
+                elif entry_kind == LOWER_BOUND and entry_value >= beta:
+                    return entry_value
+                elif entry_kind == UPPER_BOUND and entry_value <= alpha:
+                    return entry_value
+
+        original_alpha, original_beta = alpha, beta
+        maximizing = state.next_player == 0
+        best_value = MIN_VALUE if maximizing else MAX_VALUE
+        best_move = None
+        for move in self._get_ordered_moves(state, table_move):
+            value = self._search_chance(state, move, depth, alpha, beta)
+            if maximizing:
+                if best_move is None or value > best_value:
+                    best_value, best_move = value, move
+                alpha = max(alpha, value)
+            else:
+                if best_move is None or value < best_value:
+                    best_value, best_move = value, move
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+
+        # store the result, which is only a bound if it fell outside the window
+        if best_value <= original_alpha:
+            kind = UPPER_BOUND
+        elif best_value >= original_beta:
+            kind = LOWER_BOUND
+        else:
+            kind = EXACT
+        self.transposition_table[key] = (depth, best_value, kind, best_move)
+        return best_value
+
+    def _search_chance(self, state: FastGameState, move: Tuple[int, int],
+                       depth: int, alpha: float, beta: float) -> float:
+        '''
+        Returns the expected value of playing the move, averaged over its coinflip outcomes, within the (alpha, beta) window.
+        '''
+        cell, card = move
+        outcomes = state.get_chance_outcomes(cell, card)
+
+        # no coinflip, a single successor. Moves are unmade even if a
+        # SearchTimeout unwinds the search, so the caller gets its state back
+        if len(outcomes) == 1:
+            self._make_move(state, cell, card, outcomes[0][1])
+            try:
+                return self._search(state, depth - 1, alpha, beta)
+            finally:
+                self._unmake_move(state)
+
+        # Star1: since every value lies in [MIN_VALUE, MAX_VALUE], stop as soon
+        # as the outcomes seen so far put the expectation outside the window
+        expected_value = 0.0
+        remaining_probability = 1.0
+        for probability, captures in outcomes:
+            remaining_probability -= probability
+            child_alpha = (alpha - expected_value -
+                           remaining_probability * MAX_VALUE) / probability
+            child_beta = (beta - expected_value -
+                          remaining_probability * MIN_VALUE) / probability
+
+            self._make_move(state, cell, card, captures)
+            try:
+                value = self._search(state, depth - 1,
+                                     max(child_alpha, MIN_VALUE),
+                                     min(child_beta, MAX_VALUE))
+            finally:
+                self._unmake_move(state)
+
+            expected_value += probability * value
+            if value <= child_alpha:
+                return expected_value + remaining_probability * MAX_VALUE
+            if value >= child_beta:
+                return expected_value + remaining_probability * MIN_VALUE
+        return expected_value
+
+    def _get_ordered_moves(
+            self,
+            state: FastGameState,
+            first_move: Optional[Tuple[int, int]] = None
+    ) -> List[Tuple[int, int]]:
+        '''
+        Orders the moves so that the best ones are likely searched first: the given move (e.g. from the transposition table), then the moves with the most captures.
+        '''
+        def capture_score(move: Tuple[int, int]) -> float:
+            captures, coinflips = state.get_attack_outcomes(*move)
+            return -(bin(captures).count("1") + 0.5 * bin(coinflips).count("1"))
+
+        moves = list(state.legal_moves(key=capture_score))
+        if first_move is not None and first_move in moves:
+            moves.remove(first_move)
+            moves.insert(0, first_move)
+        return moves
+
+    def _make_move(self, state: FastGameState,
+                   cell: int, card: int, captures: int):
+        if self.incremental_evaluator is not None:
+            self.incremental_evaluator.make_move(cell, card, captures)
+        else:
+            state.make_move(cell, card, captures)
+
+    def _unmake_move(self, state: FastGameState):
+        if self.incremental_evaluator is not None:
+            self.incremental_evaluator.unmake_move()
+        else:
+            state.unmake_move()
+
+    def _evaluate(self, state: FastGameState) -> float:
+        '''
+        Scores a leaf from the point of view of player 0.
+        '''
+        if self.incremental_evaluator is not None:
+            scores = self.incremental_evaluator.evaluate()
+        else:
+            scores = self.evaluator.evaluate_fast_state(state)
+        return min(max(scores[0] - scores[1], MIN_VALUE), MAX_VALUE)
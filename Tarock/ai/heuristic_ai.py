@@ -1,46 +1,234 @@
 from game import *
 from ai.base_ai import TarockBaseAi
+from ai.incremental_eval import IncrementalAdvancedEvaluator
+from fast_state import FastGameState, EMPTY
+from batch_sim import BatchGameState, EDGE_CELLS, EDGE_NEIGHBORS, \
+    EDGE_DIRECTIONS, CARD_ATTACKS, CARD_DEFENSES, CARD_OVERPOWERS, \
+    CARD_OVERPOWER_COUNTS
+from collections import OrderedDict
+import numpy as np
 import copy
+import time
+
+
+# the number of coinflip outcomes get_move evaluates between two checks of
+# its deadline, rounded up to whole moves
+EVALUATION_CHUNK_SIZE = 64
 
 
 class BaseHeuristicAI(TarockBaseAi):
-    def get_move(self, game_state: GameState) -> Tuple[Tuple[int, int], Card]:
-
-        # calculate all the possible moves, each move is a tuple of ((row, col), card)
-        possible_moves = []
-        all_cards = game_state.player_hands[game_state.get_next_player()]
-        all_empty_coords = game_state.board.get_empty_coords()
-        for coord in all_empty_coords:
-            for card in all_cards:
-                possible_moves.append((coord, card))
-
-        # simulate each possible move and get the score
-        simulation_times = 10
-        scores = [0.0] * len(possible_moves)
-        for i in range(len(possible_moves)):
-            for j in range(simulation_times):
-                temp_state = self.simulate_move(
-                    possible_moves[i][0], possible_moves[i][1], game_state)
-                this_score = self.evaluate_state(temp_state)
-                my_score = this_score[game_state.get_next_player()]
-                opponent_score = this_score[1 - game_state.get_next_player()]
-                scores[i] += my_score - opponent_score
-            scores[i] /= simulation_times
+    # the cached evaluations, mapping the zobrist key of a state to its
+    # scores, in least to most recently used order, see
+    # enable_evaluation_cache
+    evaluation_cache: Optional[OrderedDict] = None
+    evaluation_cache_size: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+    def enable_evaluation_cache(self, max_size: int = 100_000):
+        '''
+        Caches the evaluations of evaluate_fast_state and evaluate_states, the entry points of the search AIs using this AI as their evaluator,
+        keeping the max_size most recently used ones. The cache must be cleared with clear_evaluation_cache if the coefficients change.
+
+        get_move does not use the cache: the successors it evaluates at one turn hold one more card than any state of a later turn,
+        and random deals rarely share positions, so over 200 games of AdvancedHeuristicAI against itself none of its lookups hit.
+        '''
+        self.evaluation_cache = OrderedDict()
+        self.evaluation_cache_size = max_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def clear_evaluation_cache(self):
+        if self.evaluation_cache is not None:
+            self.evaluation_cache.clear()
+
+    def get_move(
+            self,
+            game_state: GameState,
+            time_budget: Optional[float] = None
+    ) -> Tuple[Tuple[int, int], Card]:
+        deadline = time.perf_counter() + time_budget if time_budget is not None else None
+
+        # play from the opening book, if one is set and has the position
+        book_move = self._get_book_move(game_state)
+        if book_move is not None:
+            return book_move
+
+        # switch to the exact solver in the endgame, if enabled
+        endgame_move = self._get_endgame_move(game_state, deadline)
+        if endgame_move is not None:
+            return endgame_move
+
+        # calculate all the distinct possible moves, each move is a tuple of
+        # ((row, col), card)
+        possible_moves = list(game_state.legal_moves())
+
+        # simulate each possible move for every outcome of its coinflips,
+        # cutting them into chunks of whole moves if the time is limited
+        state = FastGameState.from_game_state(game_state)
+        move_indices = []
+        probabilities = []
+        cells, cards, captures = [], [], []
+        chunk_ends = []
+        for i, (coords, card) in enumerate(possible_moves):
+            chunk_start = chunk_ends[-1] if chunk_ends else 0
+            if deadline is not None and \
+                    len(move_indices) - chunk_start >= EVALUATION_CHUNK_SIZE:
+                chunk_ends.append(len(move_indices))
+            cell = FastGameState.coords_to_cell(coords)
+            outcomes = state.get_chance_outcomes(cell, card.id)
+            for probability, outcome in outcomes:
+                move_indices.append(i)
+                probabilities.append(probability)
+                cells.append(cell)
+                cards.append(card.id)
+                captures.append(outcome)
+
+        chunk_ends.append(len(move_indices))
+
+        # evaluate the outcomes chunk by chunk (all at once without a deadline),
+        # stopping when the time runs out after the first one
+        player = state.next_player
+        differences = []
+        evaluated = 0
+        for end in chunk_ends:
+            if deadline is not None and evaluated and time.perf_counter() >= deadline:
+                break
+            batch = BatchGameState.from_moves(
+                state, cells[evaluated:end], cards[evaluated:end],
+                captures[evaluated:end])
+            evaluations = self.evaluate_batch(batch)
+            differences.append(
+                evaluations[:, player] - evaluations[:, 1 - player])
+            evaluated = end
+
+        # get the expected score of each move evaluated
+        scores = np.bincount(move_indices[:evaluated], weights=np.array(
+            probabilities[:evaluated]) * np.concatenate(differences))
 
         # get the move with the highest score
-        max_score = max(scores)
-        max_score_index = scores.index(max_score)
+        max_score_index = int(np.argmax(scores))
 
         # return the move
         return possible_moves[max_score_index]
 
     def evaluate_state(self, game_state: GameState) -> Tuple[float, float]:
+        '''
+        Evaluates the given game state, implemented by each AI. Returns a tuple representing the score for each player.
+        '''
         raise NotImplementedError
 
+    def evaluate_fast_state(self, state: FastGameState) -> Tuple[float, float]:
+        '''
+        Same as evaluate_state for a FastGameState, through the evaluation cache if enabled. The state is only converted to a GameState if its evaluation is not cached.
+        '''
+        if self.evaluation_cache is None:
+            return self.evaluate_state(state.to_game_state())
+        return self._evaluate_key_with_cache(
+            state.zobrist_key, lambda: self.evaluate_state(state.to_game_state()))
+
+    def evaluate_states(self, states: List[FastGameState]) -> np.ndarray:
+        '''
+        Evaluates a batch of states at once, through the evaluation cache if enabled. Returns a (len(states), 2) array of the scores of each player, the same as evaluate_state.
+        '''
+        if self.evaluation_cache is None:
+            return self.evaluate_batch(BatchGameState.from_states(states))
+        return self._evaluate_with_cache(
+            [state.zobrist_key for state in states],
+            lambda misses: self.evaluate_batch(
+                BatchGameState.from_states([states[i] for i in misses]))
+        )
+
+    def _evaluate_key_with_cache(
+            self,
+            key: int,
+            evaluate: Callable[[], Tuple[float, float]]
+    ) -> Tuple[float, float]:
+        '''
+        Returns the cached scores of the state with the given key, evaluating it with evaluate if it is missing.
+        '''
+        cache = self.evaluation_cache
+        scores = cache.get(key)
+        if scores is not None:
+            cache.move_to_end(key)
+            self.cache_hits += 1
+            return scores
+        self.cache_misses += 1
+        scores = evaluate()
+        cache[key] = scores
+        if len(cache) > self.evaluation_cache_size:
+            cache.popitem(last=False)
+        return scores
+
+    def _evaluate_with_cache(
+            self,
+            keys: List[int],
+            evaluate_misses: Callable[[List[int]], np.ndarray]
+    ) -> np.ndarray:
+        '''
+        Returns the cached scores of the states with the given keys, evaluating the missing ones, given by their indices, with evaluate_misses.
+        '''
+        cache = self.evaluation_cache
+        evaluations = np.empty((len(keys), 2), dtype=np.float64)
+        misses = []
+        for i, key in enumerate(keys):
+            scores = cache.get(key)
+            if scores is None:
+                misses.append(i)
+            else:
+                cache.move_to_end(key)
+                evaluations[i] = scores
+        self.cache_hits += len(keys) - len(misses)
+        self.cache_misses += len(misses)
+
+        if misses:
+            evaluations[misses] = evaluate_misses(misses)
+            for i in misses:
+                cache[keys[i]] = (evaluations[i, 0], evaluations[i, 1])
+
+            # evict the least recently used evaluations
+            while len(cache) > self.evaluation_cache_size:
+                cache.popitem(last=False)
+        return evaluations
+
+    def evaluate_batch(self, batch: BatchGameState) -> np.ndarray:
+        '''
+        Same as evaluate_states, for the games of a BatchGameState, without the cache. By default the games are evaluated one by one with evaluate_state,
+        AIs with array-based features override this.
+        '''
+        n_games = len(batch.next_player)
+        return np.array([self.evaluate_state(batch.get_state(game).to_game_state())
+                        for game in range(n_games)], dtype=np.float64).reshape(n_games, 2)
+
+    @staticmethod
+    def _get_terminal_scores(batch: BatchGameState,
+                             scores: np.ndarray) -> np.ndarray:
+        '''
+        Overrides the scores of the finished games of the batch: 100 points to the winner, none to the loser.
+        '''
+        terminal = (batch.cells != EMPTY).all(axis=1)
+        if terminal.any():
+            player0_wins = (batch.owners == 0).sum(
+                axis=1) >= (batch.owners == 1).sum(axis=1)
+            scores[terminal] = np.where(player0_wins[terminal, None], [
+                                        100.0, 0.0], [0.0, 100.0])
+        return scores
+
+    def get_incremental_evaluator(
+            self,
+            state: FastGameState
+    ) -> Optional[IncrementalAdvancedEvaluator]:
+        '''
+        Returns an evaluator that scores the state like evaluate_state while moves are made and unmade through it, or None if the AI has none.
+        '''
+        return None
+
 
 class SimpleHeuristicAI(BaseHeuristicAI):
 
-    def __init__(self, defense_coefficient: float = 1, attack_coefficient: float = 1, presence_coefficient: float = 5):
+    def __init__(self, defense_coefficient: float = 1,
+                 attack_coefficient: float = 1,
+                 presence_coefficient: float = 5):
         self.coefficients = (defense_coefficient,
                              attack_coefficient, presence_coefficient)
 
@@ -49,7 +237,8 @@ class SimpleHeuristicAI(BaseHeuristicAI):
         Evaluates the given game state. Returns a tuple representing the score for each player.
         '''
 
-        # First, check if the game is over, if so, assign 100 points to the winner
+        # First, check if the game is over, if so, assign 100 points to the
+        # winner
         if game_state.is_terminal():
             final_game_scores = game_state.get_scores()
             winner = final_game_scores.index(max(final_game_scores))
@@ -88,32 +277,57 @@ class SimpleHeuristicAI(BaseHeuristicAI):
 
         return tuple(scores)
 
+    def evaluate_batch(self, batch: BatchGameState) -> np.ndarray:
+        owned = np.stack([batch.owners == 0, batch.owners == 1], axis=1)
+        board_defenses = CARD_DEFENSES[np.where(
+            batch.cells != EMPTY, batch.cells, 0)]
+
+        # the (defense, attack, presence) features of each player, in the order
+        # of the coefficients
+        features = np.stack([
+            (owned * board_defenses[:, None, :]).sum(axis=2),
+            batch.hands @ CARD_ATTACKS,
+            owned.sum(axis=2),
+        ], axis=2)
+        return self._get_terminal_scores(
+            batch, features @ np.array(self.coefficients, dtype=np.float64))
+
 
 class AdvancedHeuristicAI(BaseHeuristicAI):
 
-    def __init__(self, defense_coefficient: float = 1, attack_coefficient: float = 1, presence_coefficient: float = 5):
+    def __init__(self, defense_coefficient: float = 1,
+                 attack_coefficient: float = 1,
+                 presence_coefficient: float = 5):
         self.coefficients = (defense_coefficient,
                              attack_coefficient,
                              presence_coefficient
                              )
 
+    def get_incremental_evaluator(
+            self,
+            state: FastGameState
+    ) -> IncrementalAdvancedEvaluator:
+        return IncrementalAdvancedEvaluator(self.coefficients, state)
+
     def evaluate_state(self, game_state: GameState) -> Tuple[float, float]:
         '''
         Evaluates the given game state. Returns a tuple representing the score for each player.
         '''
 
-        # First, check if the game is over, if so, assign 100 points to the winner
+        # First, check if the game is over, if so, assign 100 points to the
+        # winner
         if game_state.is_terminal():
             final_game_scores = game_state.get_scores()
             winner = final_game_scores.index(max(final_game_scores))
             scores = [0.0, 0.0]
             scores[winner] = 100.0
             return tuple(scores)
-        
+
         # initialize scores
         scores = [0.0, 0.0]
 
-        # score is based on average exposed defense, average remaining attack, and total number of cards owned by player on the board
+        # score is based on average exposed defense, average remaining attack,
+        # and total number of cards owned by player on the board
 
         # retrieve the coefficients
         defense_coefficient, attack_coefficient, presence_coefficient = self.coefficients
@@ -130,12 +344,12 @@ class AdvancedHeuristicAI(BaseHeuristicAI):
 
         # first look at the board to assign board-based defense scores
         board = game_state.board
-        exposed_defenses = [[],[]]
+        exposed_defenses = [[], []]
         presence_raw_scores = [0.0, 0.0]
         for row in range(3):
             for col in range(3):
                 this_cell = board.get_cell_value((row, col))
-                
+
                 # skip empty cells
                 if this_cell.card is None:
                     continue
@@ -148,14 +362,10 @@ class AdvancedHeuristicAI(BaseHeuristicAI):
                 # add the presence score
                 presence_raw_scores[owner] += 1.0
 
-                for direction in Direction.all_directions():
-                    try:
-                        adj_coord = board.get_adj_coord_in_direction(coord=(row, col), direction=direction)
-                    except ValueError:
-                        continue
+                for adj_coord, direction, _ in Board.NEIGHBORS[(row, col)]:
 
                     # skip if the adjacent cell is not empty
-                    if not board.get_cell_owner(adj_coord) == None:
+                    if board.cells[adj_coord[0]][adj_coord[1]].card is not None:
                         continue
 
                     # check if the edge is overpower
@@ -167,16 +377,19 @@ class AdvancedHeuristicAI(BaseHeuristicAI):
                     # add the edge score to the exposed defense score
                     exposed_defenses[owner].append(this_edge_score)
 
-        # calculate the average exposed defense, for player with no exposed edges, set the average to the maximum attack (i.e. unbreakable)
+        # calculate the average exposed defense, for player with no exposed
+        # edges, set the average to the maximum attack (i.e. unbreakable)
         defense_raw_scores = [0.0, 0.0]
         for i in range(2):
             if len(exposed_defenses[i]) == 0:
                 defense_raw_scores[i] = max_attack
             else:
-                defense_raw_scores[i] = sum(exposed_defenses[i]) / len(exposed_defenses[i])
+                defense_raw_scores[i] = sum(
+                    exposed_defenses[i]) / len(exposed_defenses[i])
 
         # now look at the player's hand to assign hand-based attack scores. A card's attack score is its attack if no overpower, otherwise the average across all directions
-        # the attack score in a overpower direction in the maximum defense among all cards yet to be played and exposed edges on the board
+        # the attack score in a overpower direction in the maximum defense among
+        # all cards yet to be played and exposed edges on the board
         maximum_defense_candidates = [
             max(exposed_defenses[0] or [0]),
             max(exposed_defenses[1] or [0]),
@@ -187,7 +400,7 @@ class AdvancedHeuristicAI(BaseHeuristicAI):
 
         # calculate the attack scores for both players
         hands = game_state.player_hands
-        remaining_attacks = [[],[]]
+        remaining_attacks = [[], []]
         for player in range(2):
             hand = hands[player]
             for card in hand:
@@ -196,7 +409,9 @@ class AdvancedHeuristicAI(BaseHeuristicAI):
                 if len(overpower_directions) == 0:
                     card_attack_score = attack
                 else:
-                    card_attack_score = (maximum_defense * len(overpower_directions) + attack * (4 - len(overpower_directions)) ) / 4
+                    overpowers = len(overpower_directions)
+                    card_attack_score = (maximum_defense * overpowers +
+                                         attack * (4 - overpowers)) / 4
                 remaining_attacks[player].append(card_attack_score)
 
         # calculate the average remaining attack
@@ -206,13 +421,58 @@ class AdvancedHeuristicAI(BaseHeuristicAI):
         ]
 
         fianl_scores = [
-            defense_raw_scores[0] * defense_coefficient + attack_raw_scores[0] * attack_coefficient + presence_raw_scores[0] * presence_coefficient,
-            defense_raw_scores[1] * defense_coefficient + attack_raw_scores[1] * attack_coefficient + presence_raw_scores[1] * presence_coefficient
+            defense_raw_scores[0] * defense_coefficient + attack_raw_scores[0] *
+            attack_coefficient + presence_raw_scores[0] * presence_coefficient,
+            defense_raw_scores[1] * defense_coefficient + attack_raw_scores[1] *
+            attack_coefficient + presence_raw_scores[1] * presence_coefficient
         ]
 
         return tuple(fianl_scores)
 
-                    
-                    
-                
-
+    def evaluate_batch(self, batch: BatchGameState) -> np.ndarray:
+        n_games = len(batch.next_player)
+        occupied = batch.cells != EMPTY
+        owned = np.stack([batch.owners == 0, batch.owners == 1], axis=1)
+        in_hand = batch.hands > 0
+
+        # the maximum attack of all cards yet to be played
+        max_attack = np.where(in_hand, CARD_ATTACKS, 0.0).max(axis=(1, 2))
+
+        # the exposed edges, worth the maximum attack if overpower and the
+        # card's defense otherwise
+        edge_cards = np.where(
+            occupied[:, EDGE_CELLS], batch.cells[:, EDGE_CELLS], 0)
+        exposed = occupied[:, EDGE_CELLS] & ~occupied[:, EDGE_NEIGHBORS]
+        edge_scores = np.where(CARD_OVERPOWERS[edge_cards, EDGE_DIRECTIONS],
+                               max_attack[:, None], CARD_DEFENSES[edge_cards])
+        exposed_by_player = exposed[:, None, :] & owned[:, :, EDGE_CELLS]
+        edge_counts = exposed_by_player.sum(axis=2)
+        edge_sums = (exposed_by_player * edge_scores[:, None, :]).sum(axis=2)
+
+        # average exposed defense, the maximum attack for a player with no
+        # exposed edges
+        defense_raw_scores = np.where(edge_counts > 0,
+                                      edge_sums / np.maximum(edge_counts, 1),
+                                      max_attack[:, None])
+
+        # the maximum defense among the exposed edges and the cards yet to be
+        # played
+        maximum_defense = np.maximum(
+            np.where(exposed_by_player, edge_scores[:, None, :], 0.0).reshape(
+                n_games, -1).max(axis=1),
+            np.where(in_hand, CARD_DEFENSES, 0.0).max(axis=(1, 2))
+        )
+
+        # average remaining attack, where each overpower direction counts as the
+        # maximum defense
+        hand_sizes = batch.hands.sum(axis=2)
+        weighted_attacks = batch.hands @ (CARD_ATTACKS *
+                                          (4 - CARD_OVERPOWER_COUNTS))
+        overpowers = batch.hands @ CARD_OVERPOWER_COUNTS
+        attack_raw_scores = (maximum_defense[:, None] * overpowers +
+                             weighted_attacks) / 4 / np.maximum(hand_sizes, 1)
+
+        features = np.stack(
+            [defense_raw_scores, attack_raw_scores, owned.sum(axis=2)], axis=2)
+        return self._get_terminal_scores(
+            batch, features @ np.array(self.coefficients, dtype=np.float64))
@@ -0,0 +1,197 @@
+from typing import List, Optional, Tuple
+
+from ALL_CARDS import ALL_CARDS
+from fast_state import FastGameState, NUM_CELLS, NUM_CARDS, NEIGHBORS
+
+# attacks and defenses are small integers, so the maxima are read off
+# histograms of the values
+NUM_STAT_VALUES = max(max(cardinfo.attack, cardinfo.defense)
+                      for cardinfo in ALL_CARDS) + 1
+
+CARD_ATTACKS = tuple(cardinfo.attack for cardinfo in ALL_CARDS)
+CARD_DEFENSES = tuple(cardinfo.defense for cardinfo in ALL_CARDS)
+
+# CARD_OVERPOWERS[card][direction] is True if the card overpowers in that
+# direction (indexed as in fast_state)
+CARD_OVERPOWERS = tuple(
+    tuple(any(direction.value - 1 == index for direction in cardinfo.directions)
+          for index in range(4))
+    for cardinfo in ALL_CARDS
+)
+
+
+def _get_top_value(histogram: List[int]) -> int:
+    # the largest value with a positive count, or 0
+    for value in range(NUM_STAT_VALUES - 1, 0, -1):
+        if histogram[value]:
+            return value
+    return 0
+
+
+class IncrementalAdvancedEvaluator:
+    '''
+    Scores a FastGameState like AdvancedHeuristicAI.evaluate_state, but keeps the features up to date as moves are made and unmade,
+    instead of rescanning the board on every call.
+
+    The accumulators, per player:
+        presence: the number of cards owned on the board.
+        edge_defenses: a histogram, by defense, of the exposed edges (next to an empty cell) that are not overpower, with their count and sum.
+        overpower_edges: the number of exposed overpower edges, whose defense is the maximum attack left in the hands.
+        hand_attacks and hand_defenses: histograms of the attacks and defenses of the cards in hand, for the running maxima.
+        hand_size, hand_overpowers and hand_weighted_attack: the number of cards in hand, their total number of overpower directions,
+        and the sum of attack * (4 - overpower directions) over them.
+
+    A move only touches the cell, its neighbors and the neighbors of the captured cards, so make_move and unmake_move take constant time.
+    Moves must go through the evaluator, which applies them to its state.
+    '''
+
+    def __init__(self, coefficients: Tuple[float, float, float],
+                 state: FastGameState):
+        self.coefficients = coefficients
+        self.state = state
+
+        self.presence = [0, 0]
+        self.edge_defenses = ([0] * NUM_STAT_VALUES, [0] * NUM_STAT_VALUES)
+        self.edge_count = [0, 0]
+        self.edge_defense_sum = [0, 0]
+        self.overpower_edges = [0, 0]
+        self.hand_attacks = ([0] * NUM_STAT_VALUES, [0] * NUM_STAT_VALUES)
+        self.hand_defenses = ([0] * NUM_STAT_VALUES, [0] * NUM_STAT_VALUES)
+        self.hand_size = [0, 0]
+        self.hand_overpowers = [0, 0]
+        self.hand_weighted_attack = [0, 0]
+
+        # build the accumulators from scratch
+        for player in range(2):
+            for card in range(NUM_CARDS):
+                for _ in range(state.hands[player][card]):
+                    self._add_hand_card(player, card, 1)
+        for cell in range(NUM_CELLS):
+            if not (state.occupied >> cell) & 1:
+                continue
+            owner = (state.owners >> cell) & 1
+            card = state.cells[cell]
+            self.presence[owner] += 1
+            for neighbor, direction, _ in NEIGHBORS[cell]:
+                if not (state.occupied >> neighbor) & 1:
+                    self._add_edge(owner, card, direction, 1)
+
+    def _add_hand_card(self, player: int, card: int, sign: int):
+        attack = CARD_ATTACKS[card]
+        overpowers = sum(CARD_OVERPOWERS[card])
+        self.hand_attacks[player][attack] += sign
+        self.hand_defenses[player][CARD_DEFENSES[card]] += sign
+        self.hand_size[player] += sign
+        self.hand_overpowers[player] += sign * overpowers
+        self.hand_weighted_attack[player] += sign * attack * (4 - overpowers)
+
+    def _add_edge(self, player: int, card: int, direction: int, sign: int):
+        if CARD_OVERPOWERS[card][direction]:
+            self.overpower_edges[player] += sign
+        else:
+            defense = CARD_DEFENSES[card]
+            self.edge_defenses[player][defense] += sign
+            self.edge_count[player] += sign
+            self.edge_defense_sum[player] += sign * defense
+
+    def _update(self, cell: int, card: int, captures: int, sign: int):
+        '''
+        Adds (sign 1) or removes (sign -1) the changes of the features caused by the move, with the state as it was before the move.
+        '''
+        state = self.state
+        player = state.next_player
+        occupied = state.occupied
+
+        # the card leaves the hand and takes the cell
+        self._add_hand_card(player, card, -sign)
+        self.presence[player] += sign
+
+        for neighbor, direction, opposite in NEIGHBORS[cell]:
+            # the new card is exposed towards the empty neighbors
+            if not (occupied >> neighbor) & 1:
+                self._add_edge(player, card, direction, sign)
+                continue
+
+            # the neighbor's edge towards the cell is covered
+            owner = (state.owners >> neighbor) & 1
+            neighbor_card = state.cells[neighbor]
+            self._add_edge(owner, neighbor_card, opposite, -sign)
+
+            # a captured neighbor changes owner, along with its other exposed
+            # edges
+            if (captures >> neighbor) & 1:
+                self.presence[owner] -= sign
+                self.presence[player] += sign
+                for other, other_direction, _ in NEIGHBORS[neighbor]:
+                    if other != cell and not (occupied >> other) & 1:
+                        self._add_edge(owner, neighbor_card,
+                                       other_direction, -sign)
+                        self._add_edge(player, neighbor_card,
+                                       other_direction, sign)
+
+    def make_move(self, cell: int, card: int,
+                  captures: Optional[int] = None) -> int:
+        '''
+        Makes the move on the state, like FastGameState.make_move, and updates the features. Returns the captures that were applied.
+        '''
+        if captures is None:
+            captures = self.state.make_move(cell, card)
+            self.state.unmake_move()
+        self._update(cell, card, captures, 1)
+        return self.state.make_move(cell, card, captures)
+
+    def unmake_move(self):
+        '''
+        Reverts the last move made with make_move.
+        '''
+        cell, card, captures, _ = self.state.history[-1]
+        self.state.unmake_move()
+        self._update(cell, card, captures, -1)
+
+    def evaluate(self) -> Tuple[float, float]:
+        '''
+        Returns the scores of both players, the same as AdvancedHeuristicAI.evaluate_state on the corresponding GameState.
+        '''
+        state = self.state
+
+        # a finished game is worth 100 to its winner
+        if state.is_terminal():
+            final_scores = state.get_scores()
+            if final_scores[0] >= final_scores[1]:
+                return 100.0, 0.0
+            return 0.0, 100.0
+
+        defense_coefficient, attack_coefficient, presence_coefficient = self.coefficients
+        max_attack = max(_get_top_value(
+            self.hand_attacks[0]), _get_top_value(self.hand_attacks[1]))
+
+        # average exposed defense, the maximum attack if there are no exposed
+        # edges
+        defense_raw_scores = [0.0, 0.0]
+        maximum_defense = max(_get_top_value(
+            self.hand_defenses[0]), _get_top_value(self.hand_defenses[1]))
+        for player in range(2):
+            edges = self.edge_count[player] + self.overpower_edges[player]
+            if edges == 0:
+                defense_raw_scores[player] = max_attack
+            else:
+                defense_raw_scores[player] = (
+                    self.edge_defense_sum[player] +
+                    self.overpower_edges[player] * max_attack) / edges
+            maximum_defense = max(
+                maximum_defense, _get_top_value(self.edge_defenses[player]))
+            if self.overpower_edges[player]:
+                maximum_defense = max(maximum_defense, max_attack)
+
+        # average attack left in hand, where an overpower direction counts as
+        # the maximum defense
+        scores = [0.0, 0.0]
+        for player in range(2):
+            attack_raw_score = (
+                maximum_defense * self.hand_overpowers[player] +
+                self.hand_weighted_attack[player]
+            ) / 4 / (self.hand_size[player] or 1)
+            scores[player] = defense_raw_scores[player] * defense_coefficient + \
+                attack_raw_score * attack_coefficient + \
+                self.presence[player] * presence_coefficient
+        return tuple(scores)
@@ -0,0 +1,205 @@
+from game import *
+from ai.heuristic_ai import BaseHeuristicAI
+from fast_state import FastGameState, NUM_CELLS, NUM_CARDS, EMPTY
+from batch_sim import BatchGameState
+import numpy as np
+import math
+import os
+from typing import Dict
+
+# the default weight file, written by train_value_model.py
+DEFAULT_WEIGHTS_PATH = os.path.join(
+    os.path.dirname(__file__), "value_model.bin")
+
+# the encoding of a state: for each cell and card, +1 if player 0 owns that
+# card there and -1 if player 1 does, then the number of copies of each card
+# in each hand, then 1 if player 1 is to move
+NUM_FEATURES = NUM_CELLS * NUM_CARDS + 2 * NUM_CARDS + 1
+HAND_FEATURES = NUM_CELLS * NUM_CARDS
+NEXT_PLAYER_FEATURE = NUM_FEATURES - 1
+
+# the models loaded so far, by path, shared by the AIs using them
+_loaded_models: Dict[str, "ValueModel"] = {}
+
+
+def encode_game_state(
+        game_state: GameState) -> Tuple[List[int], List[float], int]:
+    '''
+    Returns the indices and values of the nonzero features of a single state, in the encoding of encode_batch, and the number of cards on the board,
+    whose features come first.
+    '''
+    indices = []
+    values = []
+    cell_index = 0
+    for row in game_state.board.cells:
+        for cell in row:
+            if cell.card is not None:
+                indices.append(cell_index * NUM_CARDS + cell.card.id)
+                values.append(-1.0 if cell.owner else 1.0)
+            cell_index += 1
+    occupied_count = len(indices)
+
+    # repeated indices add up to the number of copies in hand
+    indices.extend(
+        [HAND_FEATURES + card.id for card in game_state.player_hands[0]])
+    indices.extend([HAND_FEATURES + NUM_CARDS +
+                   card.id for card in game_state.player_hands[1]])
+    if game_state.next_player:
+        indices.append(NEXT_PLAYER_FEATURE)
+    values.extend([1.0] * (len(indices) - occupied_count))
+    return indices, values, occupied_count
+
+
+def encode_batch(batch: BatchGameState) -> np.ndarray:
+    '''
+    Returns the (n_games, NUM_FEATURES) encoding of the games of a batch.
+    '''
+    n_games = len(batch.next_player)
+    board = np.zeros((n_games, NUM_CELLS, NUM_CARDS), dtype=np.float32)
+    games, cells = np.nonzero(batch.cells != EMPTY)
+    board[games, cells, batch.cells[games, cells]] = 1 - \
+        2 * batch.owners[games, cells]
+    return np.concatenate([
+        board.reshape(n_games, -1),
+        batch.hands.reshape(n_games, -1).astype(np.float32),
+        batch.next_player[:, None].astype(np.float32),
+    ], axis=1)
+
+
+class ValueModel:
+    '''
+    A small multilayer perceptron estimating the probability that player 0 wins: one tanh hidden layer, then a sigmoid output.
+
+    The weight file is flat: two int32 (the number of features and of hidden units), then the float32 parameters W1, b1, w2, b2 in order.
+    '''
+
+    def __init__(self, hidden: int = 64,
+                 rng: Optional[np.random.Generator] = None):
+        rng = rng if rng is not None else np.random.default_rng(0)
+        self.W1 = (rng.standard_normal((NUM_FEATURES, hidden)) /
+                   np.sqrt(NUM_FEATURES)).astype(np.float32)
+        self.b1 = np.zeros(hidden, dtype=np.float32)
+        self.w2 = (rng.standard_normal(hidden) /
+                   np.sqrt(hidden)).astype(np.float32)
+        self.b2 = np.zeros(1, dtype=np.float32)
+
+        # float64 copies of the parameters for predict_sparse, made on first
+        # use, see get_sparse_parameters
+        self._sparse_parameters = None
+
+    def get_parameters(self) -> List[np.ndarray]:
+        return [self.W1, self.b1, self.w2, self.b2]
+
+    def forward(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Returns the hidden activations and the win probabilities of player 0 for a (n, NUM_FEATURES) batch.
+        '''
+        hidden = np.tanh(features @ self.W1 + self.b1)
+        logits = hidden @ self.w2 + self.b2[0]
+        return hidden, 1 / (1 + np.exp(-logits))
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        return self.forward(features)[1]
+
+    def predict_sparse(self, indices: List[int], values: List[float]) -> float:
+        '''
+        Returns the win probability of player 0 for a single state given by its nonzero features, as returned by encode_game_state.
+        Only the rows of W1 of those features are read, in float64 to skip converting the values.
+        '''
+        if self._sparse_parameters is None:
+            self._sparse_parameters = tuple(parameter.astype(
+                np.float64) for parameter in self.get_parameters())
+        W1, b1, w2, b2 = self._sparse_parameters
+        hidden = np.tanh(np.dot(values, W1.take(indices, axis=0)) + b1)
+        return 1 / (1 + math.exp(-(hidden.dot(w2) + b2[0])))
+
+    def clear_sparse_parameters(self):
+        '''
+        Drops the float64 copies of predict_sparse, to be called after the parameters change, e.g. in training.
+        '''
+        self._sparse_parameters = None
+
+    def get_gradients(self, features: np.ndarray,
+                      targets: np.ndarray) -> Tuple[float, List[np.ndarray]]:
+        '''
+        Returns the mean cross-entropy loss of the batch against the targets (1 if player 0 won) and its gradients, in the order of get_parameters.
+        '''
+        hidden, probabilities = self.forward(features)
+        eps = 1e-7
+        loss = -np.mean(targets * np.log(probabilities + eps) +
+                        (1 - targets) * np.log(1 - probabilities + eps))
+
+        # back-propagate through the sigmoid (with the cross-entropy) and the
+        # tanh
+        d_logits = (probabilities - targets) / len(targets)
+        d_w2 = hidden.T @ d_logits
+        d_b2 = np.array([d_logits.sum()], dtype=np.float32)
+        d_hidden = np.outer(d_logits, self.w2) * (1 - hidden ** 2)
+        d_W1 = features.T @ d_hidden
+        d_b1 = d_hidden.sum(axis=0)
+        return float(loss), [d_W1, d_b1, d_w2, d_b2]
+
+    def save(self, path: str):
+        with open(path, "wb") as file:
+            np.array(self.W1.shape, dtype=np.int32).tofile(file)
+            for parameter in self.get_parameters():
+                parameter.astype(np.float32).tofile(file)
+
+    @staticmethod
+    def load_shared(path: str) -> "ValueModel":
+        '''
+        Same as load, but reads each file only once per process and returns the same model to every caller, which must not modify it.
+        '''
+        model = _loaded_models.get(path)
+        if model is None:
+            model = ValueModel.load(path)
+            _loaded_models[path] = model
+        return model
+
+    @staticmethod
+    def load(path: str) -> "ValueModel":
+        with open(path, "rb") as file:
+            n_features, hidden = np.fromfile(file, dtype=np.int32, count=2)
+            if n_features != NUM_FEATURES:
+                raise ValueError(
+                    f"{path} encodes {n_features} features, expected {NUM_FEATURES}")
+            model = ValueModel(int(hidden))
+            for parameter in model.get_parameters():
+                parameter[...] = np.fromfile(
+                    file, dtype=np.float32, count=parameter.size).reshape(parameter.shape)
+        return model
+
+
+class LearnedValueAI(BaseHeuristicAI):
+    '''
+    Plays like the heuristic AIs, picking the move with the best expected evaluation, but evaluates states with a ValueModel trained on self-play outcomes.
+    The scores of a state are 100 times the win probability of each player, so finished games score the same as with the other heuristics.
+    '''
+
+    def __init__(self, model: Optional[ValueModel] = None,
+                 weights_path: str = DEFAULT_WEIGHTS_PATH):
+        self.model = model if model is not None else ValueModel.load_shared(
+            weights_path)
+
+    def evaluate_state(self, game_state: GameState) -> Tuple[float, float]:
+        '''
+        Evaluates the given game state. Returns a tuple representing the score for each player.
+        '''
+        indices, values, occupied_count = encode_game_state(game_state)
+
+        # a finished game (a full board) is worth 100 to its winner, as with the
+        # other heuristics. The board features are +1 for player 0's cards and
+        # -1 for player 1's
+        if occupied_count == NUM_CELLS:
+            return (100.0, 0.0) if sum(
+                values[:occupied_count]) >= 0 else (0.0, 100.0)
+
+        player0_wins = self.model.predict_sparse(indices, values)
+        return 100 * player0_wins, 100 * (1 - player0_wins)
+
+    def evaluate_batch(self, batch: BatchGameState) -> np.ndarray:
+        player0_wins = self.model.predict(
+            encode_batch(batch)).astype(np.float64)
+        scores = np.stack(
+            [100 * player0_wins, 100 * (1 - player0_wins)], axis=1)
+        return self._get_terminal_scores(batch, scores)
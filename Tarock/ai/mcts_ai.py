@@ -0,0 +1,402 @@
+from game import *
+from ai.base_ai import TarockBaseAi
+from ai.parallel_search import ParallelSearchMixin
+from game_event_listener import BaseGameEventListener, GameEvent, \
+    GameStartEvent, GameEndEvent, PlayerMoveEvent
+from fast_state import FastGameState, NUM_CELLS
+from contextlib import contextmanager
+import gc
+import math
+import threading
+import time
+
+# the share of a time budget left to the work around the search: setting
+# up the root, and freeing the tree once the move is chosen
+TIME_SAFETY_MARGIN = 0.05
+
+
+@contextmanager
+def garbage_collection_paused():
+    '''
+    Pauses the cyclic garbage collector, whose full collections scan the whole tree and pause a search for tens of milliseconds on a large one.
+    The trees hold no reference cycles, they are freed as soon as they are dropped either way.
+    '''
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+class DecisionNode:
+    '''
+    A node where a player chooses a move. Its children are the chance nodes of the moves tried so far.
+    Values are accumulated from the point of view of player 0 (1 for a win, 0 for a loss).
+    '''
+    __slots__ = ("children", "untried_moves", "visits", "value_sum")
+
+    def __init__(self, state: FastGameState, rng=random):
+        self.children = {}
+        self.untried_moves = list(state.legal_moves())
+        rng.shuffle(self.untried_moves)
+        self.visits = 0
+        self.value_sum = 0.0
+
+
+class ChanceNode:
+    '''
+    The node of a move, where the coinflips it causes are resolved. Its children are the decision nodes of the coinflip outcomes seen so far, keyed by the captures of the outcome.
+    '''
+    __slots__ = ("move", "outcomes", "children", "visits", "value_sum")
+
+    def __init__(self, move: Tuple[int, int],
+                 outcomes: List[Tuple[float, int]]):
+        self.move = move
+        self.outcomes = outcomes
+        self.children = {}
+        self.visits = 0
+        self.value_sum = 0.0
+
+    def sample_captures(self, rng=random) -> int:
+        '''
+        Draws a coinflip outcome according to its probability.
+        '''
+        if len(self.outcomes) == 1:
+            return self.outcomes[0][1]
+        draw = rng.random()
+        for probability, captures in self.outcomes:
+            draw -= probability
+            if draw < 0:
+                return captures
+        return self.outcomes[-1][1]
+
+
+class MCTSAI(ParallelSearchMixin, TarockBaseAi, BaseGameEventListener):
+    '''
+    Monte Carlo Tree Search with UCT selection, explicit chance nodes for the coinflips, and random playouts.
+
+    The search runs on a single FastGameState, making moves on the way down and unmaking them afterwards, so no state is copied.
+    Each call to get_move runs until the time limit (in seconds, or the time budget of the call if given) or the number of iterations is reached, whichever comes first.
+    The time limit covers the whole call: the search stops TIME_SAFETY_MARGIN of it early, leaving time to free the tree, and the cyclic garbage collector is paused meanwhile.
+
+    With workers > 1, the search is root-parallel: every worker process grows its own tree from the root with the same budget and its own random seed,
+    and the move with the most visits over all trees is played.
+
+    With ponder (and a single worker), the AI keeps growing the tree below its move in a background thread during the opponent's turn.
+    At the next get_move, the subtree of the position actually reached (found by Zobrist key) becomes the new root, the rest is thrown away,
+    and its visits count towards the budget: as iterations, or as the time the search takes to make that many, so a well-pondered position
+    comes back almost instantly. Pondering stops at the next
+    get_move, at stop_pondering, or, for an AI registered as an event listener, as soon as the opponent's PlayerMoveEvent arrives.
+    The thread shares the interpreter with everything else, so an opponent in the same process is slowed down while the AI ponders.
+    It draws from its own random.Random, seeded by the position, so that it does not race the game for the global random module.
+    '''
+
+    def __init__(
+            self,
+            time_limit: Optional[float] = 1.0,
+            iterations: Optional[int] = None,
+            exploration: float = 1.4,
+            workers: int = 1,
+            ponder: bool = False,
+            max_ponder_iterations: int = 1_000_000
+    ):
+        if time_limit is None and iterations is None:
+            raise ValueError("Either time_limit or iterations must be given")
+        self.time_limit = time_limit
+        self.iterations = iterations
+        self.exploration = exploration
+        self.workers = workers
+        self.ponder = ponder
+        self.max_ponder_iterations = max_ponder_iterations
+
+        # the chance node of the AI's last move, the state it was played from,
+        # the AI's seat, the thread pondering below it, and its stop signal
+        self.ponder_chance = None
+        self.ponder_state = None
+        self.ponder_player = None
+        self.ponder_thread = None
+        self.ponder_stop = None
+
+        # iterations per second of the last timed search, to turn the visits of
+        # a reused tree into time
+        self.iteration_rate = None
+
+    def get_move(
+            self,
+            game_state: GameState,
+            time_budget: Optional[float] = None
+    ) -> Tuple[Tuple[int, int], Card]:
+        start = time.perf_counter()
+        with garbage_collection_paused():
+            return self._get_move(game_state, time_budget, start)
+
+    def _get_move(self, game_state: GameState, time_budget: Optional[float],
+                  start: float) -> Tuple[Tuple[int, int], Card]:
+        '''
+        The body of get_move, called at the perf_counter time start, which counts towards the time limit.
+        '''
+        self.stop_pondering()
+
+        # play from the opening book, if one is set and has the position
+        book_move = self._get_book_move(game_state)
+        if book_move is not None:
+            return book_move
+
+        # the whole call, from its start, has to fit in the time limit, so the
+        # search stops early enough to leave a safety margin for the rest
+        time_limit = time_budget if time_budget is not None else self.time_limit
+        deadline = start + time_limit * \
+            (1 - TIME_SAFETY_MARGIN) if time_limit is not None else None
+
+        # switch to the exact solver in the endgame, if enabled, and search
+        # until the same deadline if it could not finish
+        endgame_move = self._get_endgame_move(game_state, deadline)
+        if endgame_move is not None:
+            return endgame_move
+
+        state = FastGameState.from_game_state(game_state)
+        if self.workers > 1:
+            moves = list(state.legal_moves())
+            time_limit = max(deadline - time.perf_counter(),
+                             0.0) if deadline is not None else None
+            cell, card = self._search_root_moves_in_parallel(
+                state, [moves] * self.workers, time_limit)
+            return FastGameState.cell_to_coords(cell), Card.get_card_by_id(card)
+
+        # reuse the pondered subtree if it has the position, and deduct the
+        # search it already got from the budget
+        iterations = self.iterations
+        root = self._take_pondered_tree(state)
+        if root is None or not root.children:
+            root = DecisionNode(state)
+        else:
+            if deadline is not None and self.iteration_rate is not None:
+                deadline -= root.visits / self.iteration_rate
+            if iterations is not None:
+                iterations = max(iterations - root.visits, 0)
+        search_start = time.perf_counter()
+        iterations_run = self._search(root, state, deadline, iterations)
+        elapsed = time.perf_counter() - search_start
+        if deadline is not None and elapsed > 0.01:
+            self.iteration_rate = iterations_run / elapsed
+        cell, card = self._get_best_move(root)
+
+        # free the rest of the tree now, within the time limit, rather than
+        # while the pondering thread competes for the interpreter
+        chance = root.children.get((cell, card))
+        root = None
+        if self.ponder and chance is not None:
+            self._start_pondering(chance, state)
+        return FastGameState.cell_to_coords(cell), Card.get_card_by_id(card)
+
+    def stop_pondering(self):
+        '''
+        Stops the pondering thread, if any, keeping the tree it grew.
+        '''
+        if self.ponder_thread is not None:
+            self.ponder_stop.set()
+            self.ponder_thread.join()
+            self.ponder_thread = None
+
+    def _on_game_event(self, event: GameEvent):
+        if isinstance(event, PlayerMoveEvent):
+            # the AI's own move is announced right after get_move, only the
+            # opponent's move ends the pondering. The seat is recorded when
+            # pondering starts, since the pondering thread keeps moving on
+            # ponder_state
+            _, _, initiating_player = event.event_data
+            if self.ponder_player is not None and \
+                    initiating_player != self.ponder_player:
+                self.stop_pondering()
+        elif isinstance(event, (GameStartEvent, GameEndEvent)):
+            self.stop_pondering()
+            self.ponder_chance = None
+            self.ponder_state = None
+            self.ponder_player = None
+
+    def _start_pondering(self, chance: "ChanceNode", state: FastGameState):
+        '''
+        Starts growing the tree below the chance node of the move just chosen from the state, in a background thread.
+        '''
+        self.ponder_chance = chance
+        self.ponder_state = state
+        self.ponder_player = state.next_player
+        self.ponder_stop = threading.Event()
+        rng = random.Random(state.zobrist_key)
+        self.ponder_thread = threading.Thread(target=self._ponder, args=(
+            chance, state, self.ponder_stop, rng), daemon=True)
+        self.ponder_thread.start()
+
+    def _ponder(self, chance: "ChanceNode", state: FastGameState,
+                stop: threading.Event, rng: random.Random):
+        # hand the interpreter back at once, so that get_move returns without
+        # waiting out a thread switch interval
+        time.sleep(0)
+
+        iteration = 0
+        while not stop.is_set() and iteration < self.max_ponder_iterations:
+            # resolve the coinflips of the AI's move, then run an iteration from
+            # the opponent's position
+            captures = chance.sample_captures(rng)
+            state.make_move(chance.move[0], chance.move[1], captures)
+            child = chance.children.get(captures)
+            if child is None:
+                child = DecisionNode(state, rng)
+                chance.children[captures] = child
+            result = self._run_iteration(child, state, rng)
+            state.unmake_move()
+            chance.visits += 1
+            chance.value_sum += result
+            iteration += 1
+
+    def _take_pondered_tree(self,
+                            state: FastGameState) -> Optional[DecisionNode]:
+        '''
+        Looks for the state two plies below the pondered move (the AI's move, then the opponent's reply) by Zobrist key.
+        Returns its node, or None if there is no pondered tree or it does not have the state.
+        '''
+        chance, ponder_state = self.ponder_chance, self.ponder_state
+        self.ponder_chance = None
+        self.ponder_state = None
+        self.ponder_player = None
+        if chance is None:
+            return None
+
+        cell, card = chance.move
+        for captures, child in chance.children.items():
+            ponder_state.make_move(cell, card, captures)
+            for reply in child.children.values():
+                for reply_captures, grandchild in reply.children.items():
+                    ponder_state.make_move(
+                        reply.move[0], reply.move[1], reply_captures)
+                    found = ponder_state.zobrist_key == state.zobrist_key
+                    ponder_state.unmake_move()
+                    if found:
+                        ponder_state.unmake_move()
+                        return grandchild
+            ponder_state.unmake_move()
+        return None
+
+    def _search_root_moves(
+            self,
+            state: FastGameState,
+            moves: List[Tuple[int, int]],
+            time_limit: Optional[float]
+    ) -> List[Tuple[Tuple[int, int], float]]:
+        '''
+        The worker side of the parallel search: grows a tree whose root only tries the given moves, and returns the visits of each.
+        '''
+        deadline = time.perf_counter() + time_limit * \
+            (1 - TIME_SAFETY_MARGIN) if time_limit is not None else None
+        root = DecisionNode(state)
+        root.untried_moves = [
+            move for move in root.untried_moves if move in moves]
+        with garbage_collection_paused():
+            self._search(root, state, deadline, self.iterations)
+        return [(move, float(chance.visits))
+                for move, chance in root.children.items()]
+
+    def _search(self, root: DecisionNode, state: FastGameState,
+                deadline: Optional[float], iterations: Optional[int]) -> int:
+        '''
+        Runs iterations from the root until the deadline (a perf_counter time) or the number of iterations is reached. Returns the number of iterations run.
+        '''
+        iteration = 0
+        while True:
+            if iterations is not None and iteration >= iterations:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            self._run_iteration(root, state)
+            iteration += 1
+        return iteration
+
+    def _get_best_move(self, root: DecisionNode) -> Tuple[int, int]:
+        '''
+        Returns the most visited move of the root.
+        '''
+        if not root.children:
+            return root.untried_moves[0]
+        return max(root.children.values(),
+                   key=lambda chance: chance.visits).move
+
+    def _run_iteration(self, root: DecisionNode,
+                       state: FastGameState, rng=random) -> float:
+        '''
+        Selects a path down the tree, expands one node, plays out the rest of the game at random, and backs the result up the path.
+        Returns the result, 1 if player 0 won and 0 otherwise. The random choices are drawn from rng, the global random module by default.
+        '''
+        path = [root]
+        node = root
+        moves_made = 0
+
+        # selection and expansion
+        while not state.is_terminal():
+            if node.untried_moves:
+                move = node.untried_moves.pop()
+                chance = ChanceNode(move, state.get_chance_outcomes(*move))
+                node.children[move] = chance
+            else:
+                chance = self._select(node, state.next_player)
+            captures = chance.sample_captures(rng)
+            state.make_move(chance.move[0], chance.move[1], captures)
+            moves_made += 1
+
+            child = chance.children.get(captures)
+            expanded = child is None
+            if expanded:
+                child = DecisionNode(state, rng)
+                chance.children[captures] = child
+            path.append(chance)
+            path.append(child)
+            node = child
+            if expanded:
+                break
+
+        # random playout
+        while not state.is_terminal():
+            self._make_random_move(state, rng)
+            moves_made += 1
+        scores = state.get_scores()
+        result = 1.0 if scores[0] > scores[1] else 0.0
+
+        for _ in range(moves_made):
+            state.unmake_move()
+
+        # backpropagation
+        for visited in path:
+            visited.visits += 1
+            visited.value_sum += result
+        return result
+
+    def _select(self, node: DecisionNode, player: int) -> ChanceNode:
+        '''
+        Picks the child with the highest upper confidence bound for the player to move.
+        '''
+        log_visits = math.log(node.visits)
+        exploration = self.exploration
+        best_score = -1.0
+        best_child = None
+        for child in node.children.values():
+            win_rate = child.value_sum / child.visits
+            if player == 1:
+                win_rate = 1.0 - win_rate
+            score = win_rate + exploration * \
+                math.sqrt(log_visits / child.visits)
+            if score > best_score:
+                best_score = score
+                best_child = child
+        return best_child
+
+    @staticmethod
+    def _make_random_move(state: FastGameState, rng=random):
+        '''
+        The playout policy: a random distinct card on a random empty cell.
+        '''
+        hand = state.hands[state.next_player]
+        card = rng.choice([card for card in range(len(hand)) if hand[card] > 0])
+        cell = rng.choice([cell for cell in range(NUM_CELLS)
+                          if not (state.occupied >> cell) & 1])
+        state.make_move(cell, card, rng=rng)
@@ -0,0 +1,96 @@
+from typing import Dict, List, Optional, Tuple
+import multiprocessing
+import random
+
+from fast_state import FastGameState
+
+# the search AI of each worker process, set once by the pool initializer
+_worker_ai = None
+
+
+def _init_worker(ai):
+    global _worker_ai
+    _worker_ai = ai
+
+
+def _run_task(task: Tuple[Tuple[int, int, int, int, int], List[Tuple[int, int]],
+              int, Optional[float]]) -> List[Tuple[Tuple[int, int], float]]:
+    compact_state, moves, seed, time_budget = task
+    random.seed(seed)
+    return _worker_ai._search_root_moves(
+        FastGameState.from_compact(compact_state), moves, time_budget)
+
+
+class ParallelSearchMixin:
+    '''
+    Lets a search AI spread its root search over a pool of worker processes.
+
+    The AI implements _search_root_moves(state, moves, time_budget), which searches the given root moves within the time budget (if not None)
+    and returns (move, score) pairs, where a higher score is better for the player to move. The pool is started on first use and kept alive
+    across moves, each worker holding its own copy of the AI (and of its tables). The scores of a move returned by several tasks are added up,
+    and the move with the highest total wins.
+    '''
+    workers: int = 1
+    parallel_search: Optional["ParallelSearchPool"] = None
+
+    def _search_root_moves_in_parallel(
+            self,
+            state: FastGameState,
+            tasks: List[List[Tuple[int, int]]],
+            time_budget: Optional[float] = None
+    ) -> Tuple[int, int]:
+        '''
+        Runs one task per list of root moves on the workers, each within the time budget. Returns the best move.
+        '''
+        if self.parallel_search is None:
+            self.parallel_search = ParallelSearchPool(self, self.workers)
+        totals = self.parallel_search.run(state, tasks, time_budget)
+        return max(totals, key=totals.get)
+
+    def close_workers(self):
+        '''
+        Stops the worker processes, if any. They are started again when needed.
+        '''
+        if self.parallel_search is not None:
+            self.parallel_search.close()
+            self.parallel_search = None
+
+    def __getstate__(self):
+        # the workers get a single-process copy of the AI
+        state = self.__dict__.copy()
+        state["workers"] = 1
+        state["parallel_search"] = None
+        return state
+
+
+class ParallelSearchPool:
+    '''
+    A persistent process pool running root searches for a copy of an AI. States are sent as FastGameState.to_compact tuples.
+    '''
+
+    def __init__(self, ai: ParallelSearchMixin, workers: int):
+        self.workers = workers
+        self.pool = multiprocessing.Pool(
+            workers, initializer=_init_worker, initargs=(ai,))
+
+    def run(
+            self,
+            state: FastGameState,
+            tasks: List[List[Tuple[int, int]]],
+            time_budget: Optional[float] = None
+    ) -> Dict[Tuple[int, int], float]:
+        '''
+        Runs the tasks on the workers and returns the total score of each move.
+        '''
+        compact_state = state.to_compact()
+        task_args = [(compact_state, moves, random.getrandbits(
+            32), time_budget) for moves in tasks]
+        totals = {}
+        for results in self.pool.imap_unordered(_run_task, task_args):
+            for move, score in results:
+                totals[move] = totals.get(move, 0.0) + score
+        return totals
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
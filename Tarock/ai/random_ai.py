@@ -1,22 +1,30 @@
 from game import *
 from human_vs_ai import *
 from ai.base_ai import TarockBaseAi
+import time
+
 
 class RandomAI(TarockBaseAi):
-    def get_move(self, game_state: GameState) -> Tuple[Tuple[int, int], Card]:
-        # get a random card from the hand
-        card = random.choice(game_state.player_hands[game_state.get_next_player()])
+    def get_move(
+            self,
+            game_state: GameState,
+            time_budget: Optional[float] = None
+    ) -> Tuple[Tuple[int, int], Card]:
+        # play from the opening book, if one is set and has the position
+        book_move = self._get_book_move(game_state)
+        if book_move is not None:
+            return book_move
 
-        # get all unoccupied cells from the board
-        unoccupied_cell_coords = []
-        for row in range(3):
-            for col in range(3):
-                cell = game_state.board.get_cell_value((row, col))
-                if cell.card is None:
-                    unoccupied_cell_coords.append((row, col))
+        # switch to the exact solver in the endgame, if enabled
+        endgame_move = self._get_endgame_move(game_state, time.perf_counter(
+        ) + time_budget if time_budget is not None else None)
+        if endgame_move is not None:
+            return endgame_move
 
-        # get a random unoccupied cell
-        row, col = random.choice(unoccupied_cell_coords)
+        # get a random card from the hand, so that a card held twice is twice as
+        # likely as one held once
+        card = random.choice(
+            game_state.player_hands[game_state.get_next_player()])
 
-        # return the move
-        return (row, col), card
\ No newline at end of file
+        # put it on a random unoccupied cell
+        return random.choice(game_state.board.get_empty_coords()), card
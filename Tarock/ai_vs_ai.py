@@ -2,24 +2,27 @@ from game import Game, Card, Board, Direction, AttackEvent, GameState
 from pprint import pprint
 from ALL_CARDS import ALL_CARDS
 from coinflip_listener import CoinflipListenerMixin
-from typing import Tuple
+from typing import Optional, Tuple
 from ai.base_ai import TarockBaseAi
 
+
 class FullAiTarockController(CoinflipListenerMixin):
 
     # setup the game, player 0 is human, player 1 is AI
-    def __init__(self, ai_0: TarockBaseAi, ai_1: TarockBaseAi, starting_player: int = 0):
+    def __init__(self, ai_0: TarockBaseAi, ai_1: TarockBaseAi,
+                 starting_player: int = 0, time_budget: Optional[float] = None):
         player0_hand = [Card.get_random_card(ALL_CARDS) for _ in range(5)]
         player1_hand = [Card.get_random_card(ALL_CARDS) for _ in range(5)]
         starting_hands = (player0_hand, player1_hand)
         self.game = Game(starting_player, starting_hands)
         self.game.register_coinflip_listener(self)
         self.ais = [ai_0, ai_1]
+        self.time_budget = time_budget
 
     def start_game(self):
         '''
         Start the game, and play until the game ends.
-        
+
         @Returns: (final_scores: List[int], final_state: GameState)
 
         '''
@@ -42,12 +45,18 @@ class FullAiTarockController(CoinflipListenerMixin):
             pprint(self.game.game_state.player_hands[1])
 
             # print whose turn it is
-            print(f"\n\nPlayer {self.game.game_state.get_next_player()+1}'s turn!")
-            coord, card = self.ais[self.game.game_state.get_next_player()].get_move(self.game.game_state)
-            print(f"Player {self.game.game_state.get_next_player()+1} places {card} at ({coord[0]}, {coord[1]})")
+            next_player = self.game.game_state.get_next_player()
+            print(f"\n\nPlayer {next_player+1}'s turn!")
+            coord, card = self.ais[next_player].get_move(
+                self.game.game_state, self.time_budget)
+            print(f"Player {next_player+1} places {card} "
+                  f"at ({coord[0]}, {coord[1]})")
             self.game.place_card(coord[0], coord[1], card)
 
-        # game ended, print the final board and declare the winner
+        # game ended, stop the AIs thinking on their opponent's turn, print the
+        # final board and declare the winner
+        for ai in self.ais:
+            ai.stop_pondering()
         print("\n\nFinal Board:")
         self._print_board(self.game.game_state.board)
         final_scores = self.game.game_state.get_scores()
@@ -60,17 +69,21 @@ class FullAiTarockController(CoinflipListenerMixin):
 
         return final_scores, self.game.game_state
 
-    def _on_coinflip_result(self, attack_event: AttackEvent, favored_player: int):
+    def _on_coinflip_result(self, attack_event: AttackEvent,
+                            favored_player: int):
         attacker = attack_event.attacker
         defender = attack_event.defender
         attacker_coords = attack_event.attacker_coords
         defender_coords = attack_event.defender_coords
-        print(f"\nCoin flip required for {attacker.name} ({attacker_coords[0]}, {attacker_coords[1]}) attacking {defender.name} ({defender_coords[0]}, {defender_coords[1]})")
+        print(f"\nCoin flip required for {attacker.name} "
+              f"({attacker_coords[0]}, {attacker_coords[1]}) attacking "
+              f"{defender.name} ({defender_coords[0]}, {defender_coords[1]})")
         print(f"Player {favored_player+1} wins the coinflip!")
 
     @staticmethod
     def _print_board(board: Board):
-        # generate a pretty representation of the board with 3 rows and 3 columns, each cell in 20 characters wide
+        # generate a pretty representation of the board with 3 rows and 3
+        # columns, each cell in 20 characters wide
 
         # first, generate the top border
         board_str = "┌"+"─"*20+"┬"+"─"*20+"┬"+"─"*20+"┐\n"
@@ -88,7 +101,8 @@ class FullAiTarockController(CoinflipListenerMixin):
                             board_str += " "*20
                     else:
                         name_lines = cell.card.name.center(20).split('\n')
-                        attack_defense = f"(🗡️ {cell.card.attack}/🛡️ {cell.card.defense})".center(22)
+                        attack_defense = f"(🗡️ {cell.card.attack}/🛡️ {cell.card.defense})"
+                        attack_defense = attack_defense.center(22)
                         attack_defense_lines = attack_defense.split('\n')
                         if i == 1:
                             board_str += name_lines[0].center(20)
@@ -119,8 +133,9 @@ class FullAiTarockController(CoinflipListenerMixin):
 
         print(board_str)
 
+
 if __name__ == "__main__":
     from ai.random_ai import RandomAI
     from ai.heuristic_ai import SimpleHeuristicAI
     controller = FullAiTarockController(RandomAI(), SimpleHeuristicAI())
-    controller.start_game()
\ No newline at end of file
+    controller.start_game()
@@ -0,0 +1,51 @@
+from direction import Direction
+from ALL_CARDS import ALL_CARDS, CardInfo
+
+# possible outcomes of an attack
+ATTACK_LOSE = 0
+ATTACK_WIN = 1
+ATTACK_COINFLIP = 2
+
+
+def _determine_attack_outcome(attacker: CardInfo, defender: CardInfo,
+                              attack_direction: Direction) -> int:
+    '''
+    Determines the outcome of the attacker attacking the defender, which sits in the given direction of the attacker.
+    '''
+    attack_overpower = attack_direction in attacker.directions
+    defense_overpower = attack_direction.opposite() in defender.directions
+
+    # if both overpower, coin flip to determine outcome
+    if attack_overpower and defense_overpower:
+        return ATTACK_COINFLIP
+
+    # if only the attack overpowers, the attack is successful
+    elif attack_overpower:
+        return ATTACK_WIN
+
+    # if only the defense overpowers, the attack is unsuccessful
+    elif defense_overpower:
+        return ATTACK_LOSE
+
+    # if neither overpower, compare the attack and defense values
+    attack_advantage = attacker.attack - defender.defense
+    if attack_advantage > 0:
+        return ATTACK_WIN
+    elif attack_advantage < 0:
+        return ATTACK_LOSE
+    else:
+        return ATTACK_COINFLIP
+
+
+# ATTACK_OUTCOMES[attacker][defender][direction] is the outcome of an attack,
+# where attacker and defender are indices in ALL_CARDS, and direction is the
+# direction of the defender seen from the attacker, indexed as
+# Direction.value - 1 (UP, DOWN, LEFT, RIGHT)
+ATTACK_OUTCOMES = tuple(
+    tuple(
+        tuple(_determine_attack_outcome(attacker, defender, direction)
+              for direction in Direction.all_directions())
+        for defender in ALL_CARDS
+    )
+    for attacker in ALL_CARDS
+)
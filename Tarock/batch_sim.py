@@ -0,0 +1,263 @@
+from typing import List, Optional, Tuple
+import time
+
+import numpy as np
+
+from ALL_CARDS import ALL_CARDS
+from attack_table import ATTACK_OUTCOMES, ATTACK_WIN, ATTACK_COINFLIP
+from fast_state import FastGameState, NUM_CELLS, NUM_CARDS, EMPTY, NEIGHBORS
+
+HAND_SIZE = 5
+
+# OUTCOMES[attacker, defender, direction] as an array, see attack_table.py
+OUTCOMES = np.array(ATTACK_OUTCOMES, dtype=np.int8)
+
+# NEIGHBOR_CELLS[cell] and NEIGHBOR_DIRECTIONS[cell] list the neighbors of
+# each cell and their directions, padded with -1 up to 4 entries
+NEIGHBOR_CELLS = np.full((NUM_CELLS, 4), -1, dtype=np.int64)
+NEIGHBOR_DIRECTIONS = np.zeros((NUM_CELLS, 4), dtype=np.int64)
+for _cell in range(NUM_CELLS):
+    for _i, (_neighbor, _direction, _) in enumerate(NEIGHBORS[_cell]):
+        NEIGHBOR_CELLS[_cell, _i] = _neighbor
+        NEIGHBOR_DIRECTIONS[_cell, _i] = _direction
+
+# the 24 edges of the board, from a cell towards one of its neighbors:
+# EDGE_CELLS[e] faces EDGE_NEIGHBORS[e] in direction EDGE_DIRECTIONS[e]
+EDGE_CELLS = np.array([cell for cell in range(NUM_CELLS)
+                      for _ in NEIGHBORS[cell]])
+EDGE_NEIGHBORS = np.array([neighbor for cell in range(NUM_CELLS)
+                          for neighbor, _, _ in NEIGHBORS[cell]])
+EDGE_DIRECTIONS = np.array([direction for cell in range(
+    NUM_CELLS) for _, direction, _ in NEIGHBORS[cell]])
+
+# the stats of the cards, indexed by card id
+CARD_ATTACKS = np.array(
+    [cardinfo.attack for cardinfo in ALL_CARDS], dtype=np.float64)
+CARD_DEFENSES = np.array(
+    [cardinfo.defense for cardinfo in ALL_CARDS], dtype=np.float64)
+
+# CARD_OVERPOWERS[card, direction] is True if the card overpowers in that
+# direction
+CARD_OVERPOWERS = np.array([
+    [any(direction.value - 1 == index for direction in cardinfo.directions)
+     for index in range(4)]
+    for cardinfo in ALL_CARDS
+])
+CARD_OVERPOWER_COUNTS = CARD_OVERPOWERS.sum(axis=1).astype(np.float64)
+
+
+class BatchGameState:
+    '''
+    Many games played side by side, stored as arrays with one row per game.
+
+    Attributes:
+        cells: (n_games, 9) card id on each cell, or EMPTY.
+        owners: (n_games, 9) owner of each cell, or EMPTY.
+        hands: (n_games, 2, NUM_CARDS) number of copies of each card in each player's hand.
+        next_player: (n_games,) the player to move in each game.
+
+    All games start together and every move fills one cell, so all games end after 9 moves.
+    '''
+
+    def __init__(self, hands: np.ndarray, starting_players: np.ndarray):
+        n_games = hands.shape[0]
+        self.cells = np.full((n_games, NUM_CELLS), EMPTY, dtype=np.int8)
+        self.owners = np.full((n_games, NUM_CELLS), EMPTY, dtype=np.int8)
+        self.hands = hands.astype(np.int8)
+        self.next_player = starting_players.astype(np.int8)
+        self._rows = np.arange(n_games)
+
+    @staticmethod
+    def deal(n_games: int, rng: np.random.Generator,
+             starting_player: Optional[int] = None) -> "BatchGameState":
+        '''
+        Deals random hands of 5 cards from ALL_CARDS (with repetition, like Card.get_random_card) to both players of every game.
+        The starting player is random unless given.
+        '''
+        dealt = rng.integers(0, NUM_CARDS, size=(n_games, 2, HAND_SIZE))
+        hands = np.zeros((n_games, 2, NUM_CARDS), dtype=np.int8)
+        for player in range(2):
+            for i in range(HAND_SIZE):
+                np.add.at(hands[:, player], (np.arange(
+                    n_games), dealt[:, player, i]), 1)
+        if starting_player is None:
+            starting_players = rng.integers(0, 2, size=n_games)
+        else:
+            starting_players = np.full(n_games, starting_player)
+        return BatchGameState(hands, starting_players)
+
+    @staticmethod
+    def from_states(states: List[FastGameState]) -> "BatchGameState":
+        '''
+        Stacks the given states into a batch, one row per state.
+        '''
+        cells = np.array([state.cells for state in states],
+                         dtype=np.int8).reshape(len(states), NUM_CELLS)
+        owner_masks = np.array(
+            [state.owners for state in states], dtype=np.int64)
+        batch = BatchGameState(
+            np.array([state.hands for state in states],
+                     dtype=np.int8).reshape(len(states), 2, NUM_CARDS),
+            np.array([state.next_player for state in states], dtype=np.int8)
+        )
+        batch.cells = cells
+        owner_bits = (owner_masks[:, None] >> np.arange(NUM_CELLS)) & 1
+        batch.owners = np.where(cells == EMPTY, EMPTY,
+                                owner_bits).astype(np.int8)
+        return batch
+
+    @staticmethod
+    def from_moves(state: FastGameState, cells: List[int], cards: List[int],
+                   captures: List[int]) -> "BatchGameState":
+        '''
+        Returns the batch of the successors of the state, one per (cell, card, captures) move as passed to FastGameState.make_move, without making the moves.
+        '''
+        n_moves = len(cells)
+        rows = np.arange(n_moves)
+        cells = np.array(cells, dtype=np.int64)
+        cards = np.array(cards, dtype=np.int64)
+        player = state.next_player
+
+        hands = np.tile(np.array(state.hands, dtype=np.int8), (n_moves, 1, 1))
+        hands[rows, player, cards] -= 1
+        batch = BatchGameState(hands, np.full(n_moves, 1 - player))
+
+        batch.cells = np.tile(
+            np.array(state.cells, dtype=np.int8), (n_moves, 1))
+        batch.cells[rows, cells] = cards
+        owner_masks = (state.owners ^ np.array(
+            captures, dtype=np.int64)) | (player << cells)
+        owner_bits = (owner_masks[:, None] >> np.arange(NUM_CELLS)) & 1
+        batch.owners = np.where(batch.cells == EMPTY, EMPTY,
+                                owner_bits).astype(np.int8)
+        return batch
+
+    def get_state(self, game: int) -> FastGameState:
+        '''
+        Returns the given game of the batch as a FastGameState.
+        '''
+        cells = [int(card) for card in self.cells[game]]
+        owned = self.owners[game] == 1
+        owners = sum(1 << cell for cell in range(NUM_CELLS) if owned[cell])
+        occupied = sum(1 << cell for cell in range(
+            NUM_CELLS) if cells[cell] != EMPTY)
+        hands = tuple([int(count) for count in self.hands[game, player]]
+                      for player in range(2))
+        return FastGameState(cells, owners, occupied, hands,
+                             int(self.next_player[game]))
+
+    def get_empty_cell_masks(self) -> np.ndarray:
+        '''
+        Returns a (n_games, 9) boolean mask of the cells a card can be placed on.
+        '''
+        return self.cells == EMPTY
+
+    def get_playable_card_counts(self) -> np.ndarray:
+        '''
+        Returns the (n_games, NUM_CARDS) hand of the player to move in each game. A card can be played where its count is positive.
+        '''
+        return self.hands[self._rows, self.next_player]
+
+    def get_legal_move_masks(self) -> np.ndarray:
+        '''
+        Returns a (n_games, 9, NUM_CARDS) boolean mask of the legal (cell, card) moves of each game.
+        '''
+        return self.get_empty_cell_masks()[:, :, None] & (
+            self.get_playable_card_counts() > 0)[:, None, :]
+
+    def place_cards(self, cells: np.ndarray, cards: np.ndarray,
+                    rng: np.random.Generator):
+        '''
+        Plays one move in every game: the player to move places cards[i] on cells[i] of game i, then the attacks are resolved, with coinflips drawn from rng.
+        '''
+        rows = self._rows
+        players = self.next_player
+
+        # place the cards and remove them from the hands
+        self.cells[rows, cells] = cards
+        self.owners[rows, cells] = players
+        self.hands[rows, players, cards] -= 1
+
+        # look up the four possible attacks of each placement
+        neighbors = NEIGHBOR_CELLS[cells]
+        directions = NEIGHBOR_DIRECTIONS[cells]
+        on_board = neighbors >= 0
+        safe_neighbors = np.where(on_board, neighbors, 0)
+        defenders = self.cells[rows[:, None], safe_neighbors]
+        defender_owners = self.owners[rows[:, None], safe_neighbors]
+        attacked = on_board & (defenders != EMPTY) & (
+            defender_owners != players[:, None])
+
+        outcomes = OUTCOMES[cards[:, None], np.where(
+            defenders != EMPTY, defenders, 0), directions]
+        coinflips_won = rng.random(outcomes.shape) < 0.5
+        captured = attacked & ((outcomes == ATTACK_WIN) | (
+            (outcomes == ATTACK_COINFLIP) & coinflips_won))
+
+        # hand the captured cells over to the attackers
+        capture_rows, capture_slots = np.nonzero(captured)
+        self.owners[capture_rows, neighbors[capture_rows,
+                                            capture_slots]] = players[capture_rows]
+
+        self.next_player = 1 - players
+
+    def get_random_moves(
+            self,
+            rng: np.random.Generator
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Picks a move in every game the way RandomAI does: a random card from the hand, each copy counting, on a random empty cell.
+        '''
+        # random empty cell: the empty cell with the largest random key
+        cell_keys = np.where(self.get_empty_cell_masks(),
+                             rng.random(self.cells.shape), -1.0)
+        cells = cell_keys.argmax(axis=1)
+
+        # random card from the hand, weighted by its count: the first card whose
+        # cumulative count exceeds a uniform draw over the hand size
+        cumulative_counts = self.get_playable_card_counts().cumsum(axis=1)
+        draws = rng.random(len(cells)) * cumulative_counts[:, -1]
+        cards = (cumulative_counts <= draws[:, None]).sum(axis=1)
+        return cells, cards
+
+    def get_scores(self) -> np.ndarray:
+        '''
+        Returns the (n_games, 2) number of cells owned by each player.
+        '''
+        return np.stack([(self.owners == 0).sum(axis=1),
+                        (self.owners == 1).sum(axis=1)], axis=1)
+
+
+def play_random_games(state: BatchGameState,
+                      rng: np.random.Generator) -> np.ndarray:
+    '''
+    Plays the dealt games to the end between two random players. Returns the (n_games, 2) final scores.
+    '''
+    for _ in range(NUM_CELLS):
+        cells, cards = state.get_random_moves(rng)
+        state.place_cards(cells, cards, rng)
+    return state.get_scores()
+
+
+if __name__ == "__main__":
+    # balance study: how much does starting, or holding a given card, matter
+    # between random players?
+    rng = np.random.default_rng(0)
+    n_games = 1_000_000
+
+    start = time.perf_counter()
+    state = BatchGameState.deal(n_games, rng, starting_player=0)
+    dealt_hands = state.hands.copy()
+    scores = play_random_games(state, rng)
+    elapsed = time.perf_counter() - start
+    print(f"{n_games:,} games, {n_games * NUM_CELLS / elapsed:,.0f} moves/s")
+
+    player0_wins = scores[:, 0] > scores[:, 1]
+    print(f"starting player win rate: {player0_wins.mean():.3f}")
+
+    print("\nwin rate of the starting player with and without each card in "
+          "their hand:")
+    for card, cardinfo in enumerate(ALL_CARDS):
+        holds = dealt_hands[:, 0, card] > 0
+        print(f"{cardinfo.name:>20}: {player0_wins[holds].mean():.3f} with, "
+              f"{player0_wins[~holds].mean():.3f} without")
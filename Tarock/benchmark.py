@@ -0,0 +1,395 @@
+from game import AttackEvent, Board, Card, Direction, GameState
+from ALL_CARDS import ALL_CARDS
+from ai.base_ai import TarockBaseAi
+from ai.heuristic_ai import SimpleHeuristicAI, AdvancedHeuristicAI
+from ai.expectiminimax_ai import ExpectiminimaxAI
+from ai.learned_ai import LearnedValueAI
+from ai.random_ai import RandomAI
+from fast_state import FastGameState
+from game_event_listener import BaseGameEventListener, GameEvent
+from general_controller import TarockGameController
+from symmetry import get_canonical_key
+from typing import List, Tuple
+import multiprocessing
+import random
+import time
+
+# how far over its time budget a move may take, as a factor of the budget
+TIME_BUDGET_TOLERANCE = 1.1
+
+
+def get_random_states(count: int, moves_played: int = 4) -> List[GameState]:
+    '''
+    Deals random hands and plays random moves to get some mid-game states.
+    '''
+    states = []
+    for _ in range(count):
+        hands = (
+            [Card.get_random_card(ALL_CARDS) for _ in range(5)],
+            [Card.get_random_card(ALL_CARDS) for _ in range(5)]
+        )
+        state = FastGameState.from_game_state(
+            GameState(Board.get_fresh_board(), hands, random.randint(0, 1)))
+        for _ in range(moves_played):
+            hand = state.hands[state.next_player]
+            card = random.choice(
+                [card for card in range(len(hand)) if hand[card] > 0])
+            state.make_move(random.choice(state.get_empty_cells()), card)
+        state.history.clear()
+        states.append(state.to_game_state())
+    return states
+
+
+def _get_all_moves(game_state: GameState) -> List[Tuple[Tuple[int, int], Card]]:
+    hand = game_state.player_hands[game_state.get_next_player()]
+    return [(coord, card)
+            for coord in game_state.board.get_empty_coords() for card in hand]
+
+
+def bench_simulate_move(states: List[GameState]) -> float:
+    '''
+    Returns the number of moves per second simulated with TarockBaseAi.simulate_move.
+    '''
+    all_moves = [(state, _get_all_moves(state)) for state in states]
+    moves = 0
+    start = time.perf_counter()
+    for state, state_moves in all_moves:
+        for coord, card in state_moves:
+            TarockBaseAi.simulate_move(coord, card, state)
+        moves += len(state_moves)
+    return moves / (time.perf_counter() - start)
+
+
+def bench_make_unmake(states: List[GameState]) -> float:
+    '''
+    Returns the number of moves per second simulated with FastGameState.make_move/unmake_move, about 6x the rate of bench_simulate_move here.
+    '''
+    all_moves = []
+    for state in states:
+        fast_state = FastGameState.from_game_state(state)
+        hand = fast_state.hands[fast_state.next_player]
+        state_moves = [(cell, card) for cell in fast_state.get_empty_cells()
+                       for card in range(len(hand)) for _ in range(hand[card])]
+        all_moves.append((fast_state, state_moves))
+    moves = 0
+    start = time.perf_counter()
+    for state, state_moves in all_moves:
+        make_move = state.make_move
+        unmake_move = state.unmake_move
+        for cell, card in state_moves:
+            make_move(cell, card)
+            unmake_move()
+        moves += len(state_moves)
+    return moves / (time.perf_counter() - start)
+
+
+def bench_get_move(ai: TarockBaseAi, states: List[GameState]) -> float:
+    '''
+    Returns the number of moves per second chosen by the given AI.
+    '''
+    start = time.perf_counter()
+    for state in states:
+        ai.get_move(state)
+    return len(states) / (time.perf_counter() - start)
+
+
+def count_positions(state: GameState, plies: int) -> Tuple[int, int]:
+    '''
+    Counts the distinct positions reachable from the state in the given number of plies, by Zobrist key and up to board symmetry.
+    '''
+    frontier = [FastGameState.from_game_state(state)]
+    for _ in range(plies):
+        successors = {}
+        for position in frontier:
+            for cell in position.get_empty_cells():
+                for card, count in enumerate(
+                        position.hands[position.next_player]):
+                    if count == 0:
+                        continue
+                    for _, successor in position.get_successors(cell, card):
+                        successors[successor.zobrist_key] = successor
+        frontier = list(successors.values())
+    canonical_keys = set(get_canonical_key(position) for position in frontier)
+    return len(frontier), len(canonical_keys)
+
+
+def _generate_attack_events_with_bounds_checks(
+        coords: Tuple[int, int],
+        card: Card,
+        player: int,
+        board: Board
+) -> List[AttackEvent]:
+    '''
+    The previous attack event generation, which relies on get_adj_coord_in_direction raising for off-board cells. Kept as a baseline.
+    '''
+    events = []
+    for direction in Direction.all_directions():
+        try:
+            defense_cell_coords = Board.get_adj_coord_in_direction(
+                coords, direction)
+            defense_cell = board.get_cell_value(defense_cell_coords)
+        except ValueError:
+            continue
+        if defense_cell.card is None or defense_cell.owner == player:
+            continue
+        events.append(AttackEvent(card, defense_cell.card, coords,
+                      defense_cell_coords, player, direction))
+    return events
+
+
+def bench_event_sweep(states: List[GameState]) -> Tuple[float, float]:
+    '''
+    Generates the attack events of every cell of fully populated boards, as if its card was just placed by its owner.
+    Returns the number of sweeps per second with bounds checks and with Board.NEIGHBORS.
+    '''
+    sweeps = [(state.board, [(coords, state.board.get_cell_value(coords))
+               for coords in Board.NEIGHBORS]) for state in states]
+    rates = []
+    generators = (_generate_attack_events_with_bounds_checks,
+                  TarockBaseAi._generate_attack_events_for_placement)
+    for generate_attack_events in generators:
+        start = time.perf_counter()
+        for board, cells in sweeps:
+            for coords, cell in cells:
+                generate_attack_events(coords, cell.card, cell.owner, board)
+        rates.append(len(sweeps) / (time.perf_counter() - start))
+    return rates[0], rates[1]
+
+
+def bench_time_budget(ai: TarockBaseAi, states: List[GameState],
+                      time_budget: float) -> Tuple[float, float]:
+    '''
+    Returns the mean and the worst time (in seconds) taken by the AI to choose a move with the given time budget.
+    '''
+    times = []
+    for state in states:
+        start = time.perf_counter()
+        ai.get_move(state, time_budget)
+        times.append(time.perf_counter() - start)
+    return sum(times) / len(times), max(times)
+
+
+def check_incremental_eval(states: List[GameState]) -> int:
+    '''
+    Plays every state to the end at random through an incremental evaluator, then unmakes the moves, comparing its scores with
+    AdvancedHeuristicAI.evaluate_state at every step. Returns the number of positions checked, raises AssertionError on a mismatch.
+    '''
+    ai = AdvancedHeuristicAI()
+    checked = 0
+    for game_state in states:
+        state = FastGameState.from_game_state(game_state)
+        evaluator = ai.get_incremental_evaluator(state)
+        expected = [ai.evaluate_state(state.to_game_state())]
+        while not state.is_terminal():
+            hand = state.hands[state.next_player]
+            card = random.choice(
+                [card for card in range(len(hand)) if hand[card] > 0])
+            evaluator.make_move(random.choice(state.get_empty_cells()), card)
+            expected.append(ai.evaluate_state(state.to_game_state()))
+            assert all(abs(a - b) < 1e-9 for a, b in zip(evaluator.evaluate(),
+                       expected[-1])), "incremental evaluation mismatch after make_move"
+            checked += 1
+        while state.history:
+            evaluator.unmake_move()
+            expected.pop()
+            assert all(abs(a - b) < 1e-9 for a, b in zip(evaluator.evaluate(),
+                       expected[-1])), "incremental evaluation mismatch after unmake_move"
+            checked += 1
+    return checked
+
+
+def check_batch_eval(states: List[GameState]) -> int:
+    '''
+    Compares evaluate_states with evaluate_state for SimpleHeuristicAI, AdvancedHeuristicAI and LearnedValueAI on the states and all their successors.
+    Returns the number of states checked, raises AssertionError on a mismatch.
+    '''
+    fast_states = []
+    for state in states:
+        fast_state = FastGameState.from_game_state(state)
+        fast_states.append(fast_state)
+        for move in fast_state.legal_moves():
+            fast_states.extend(
+                successor for _, successor in fast_state.get_successors(*move))
+    # the value model computes in float32, whose rounding depends on the batch
+    # size
+    for ai, tolerance in ((SimpleHeuristicAI(), 1e-9),
+                          (AdvancedHeuristicAI(), 1e-9), (LearnedValueAI(), 1e-3)):
+        batch_scores = ai.evaluate_states(fast_states)
+        for state, scores in zip(fast_states, batch_scores):
+            expected = ai.evaluate_state(state.to_game_state())
+            assert all(abs(a - b) < tolerance
+                       for a, b in zip(scores, expected)), \
+                "batch evaluation mismatch"
+    return len(fast_states)
+
+
+def bench_incremental_eval(states: List[GameState]) -> Tuple[float, float]:
+    '''
+    Returns the number of moves per second made, evaluated and unmade, with AdvancedHeuristicAI.evaluate_state on a converted GameState and with the incremental evaluator.
+    '''
+    ai = AdvancedHeuristicAI()
+    fast_states = [FastGameState.from_game_state(state) for state in states]
+    all_moves = [list(state.legal_moves()) for state in fast_states]
+
+    start = time.perf_counter()
+    for state, state_moves in zip(fast_states, all_moves):
+        for cell, card in state_moves:
+            state.make_move(cell, card)
+            ai.evaluate_state(state.to_game_state())
+            state.unmake_move()
+    full_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for state, state_moves in zip(fast_states, all_moves):
+        evaluator = ai.get_incremental_evaluator(state)
+        for cell, card in state_moves:
+            evaluator.make_move(cell, card)
+            evaluator.evaluate()
+            evaluator.unmake_move()
+    incremental_time = time.perf_counter() - start
+
+    moves = sum(len(state_moves) for state_moves in all_moves)
+    return moves / full_time, moves / incremental_time
+
+
+def bench_evaluation_cost(
+        ai: TarockBaseAi, states: List[GameState]) -> Tuple[float, float]:
+    '''
+    Returns the microseconds per position of ai.evaluate_state one GameState at a time, and of ai.evaluate_states on all the states at once.
+    '''
+    fast_states = [FastGameState.from_game_state(state) for state in states]
+
+    start = time.perf_counter()
+    for state in states:
+        ai.evaluate_state(state)
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ai.evaluate_states(fast_states)
+    batch_time = time.perf_counter() - start
+    return single_time / len(states) * 1e6, batch_time / len(states) * 1e6
+
+
+def bench_parallel_search(
+        states: List[GameState], max_depth: int, workers: int) -> float:
+    '''
+    Returns the speedup of ExpectiminimaxAI with the given number of workers over a single process, on the given states.
+    Both AIs start with empty transposition tables, and the worker processes are started before timing.
+    '''
+    serial_rate = bench_get_move(ExpectiminimaxAI(max_depth=max_depth), states)
+    parallel_ai = ExpectiminimaxAI(max_depth=max_depth, workers=workers)
+    parallel_ai.get_move(get_random_states(1, moves_played=6)[0])
+    parallel_rate = bench_get_move(parallel_ai, states)
+    parallel_ai.close_workers()
+    return parallel_rate / serial_rate
+
+
+class _NullListener(BaseGameEventListener):
+    def _on_game_event(self, event: GameEvent):
+        pass
+
+
+def bench_controller(n_games: int) -> Tuple[float, float]:
+    '''
+    Returns the games per second of RandomAI against itself through TarockGameController, with a listener that ignores every event,
+    then headless. Both play the same games, so the gap is the cost of building and dispatching the events. Each rate is the best of 3 runs.
+    The gap is small, about 1.2x: most of a headless game is spent listing RandomAI's legal moves and applying the rules in Game.place_card.
+    '''
+    rates = [0.0, 0.0]
+    for _ in range(3):
+        for i, listening in enumerate((True, False)):
+            controller = TarockGameController(RandomAI(), RandomAI())
+            if listening:
+                controller.register_event_listener(_NullListener())
+            random.seed(0)
+            start = time.perf_counter()
+            for _ in range(n_games):
+                controller.start_new_game()
+            rates[i] = max(rates[i], n_games / (time.perf_counter() - start))
+    return tuple(rates)
+
+
+def bench_tournament(n_games: int, workers: int) -> Tuple[float, float]:
+    '''
+    Returns the games per second of a RandomAI against AdvancedHeuristicAI tournament on one process and on the given number of workers.
+    '''
+    from tournament import Tournament
+    rates = []
+    for tournament_workers in (1, workers):
+        tournament = Tournament(
+            RandomAI, AdvancedHeuristicAI, workers=tournament_workers)
+        start = time.perf_counter()
+        for _ in tournament.run(n_games):
+            pass
+        rates.append(n_games / (time.perf_counter() - start))
+    return tuple(rates)
+
+
+if __name__ == "__main__":
+    random.seed(0)
+    states = get_random_states(2000)
+
+    simulate_rate = bench_simulate_move(states)
+    make_unmake_rate = bench_make_unmake(states)
+    print(f"simulate_move:          {simulate_rate:12,.0f} moves/s")
+    print(f"make_move/unmake_move:  {make_unmake_rate:12,.0f} moves/s "
+          f"({make_unmake_rate / simulate_rate:.1f}x)")
+
+    full_states = get_random_states(2000, moves_played=9)
+    bounds_checks_rate, neighbors_rate = bench_event_sweep(full_states)
+    print(
+        f"event sweep, bounds checks:    {bounds_checks_rate:12,.0f} boards/s")
+    print(f"event sweep, Board.NEIGHBORS:  {neighbors_rate:12,.0f} boards/s "
+          f"({neighbors_rate / bounds_checks_rate:.1f}x)")
+
+    for opening_state in get_random_states(3, moves_played=0):
+        distinct, distinct_canonical = count_positions(opening_state, plies=2)
+        print(f"positions after 2 plies:  {distinct:8,d} "
+              f"({distinct_canonical:,d} up to symmetry, "
+              f"{distinct / distinct_canonical:.1f}x fewer)")
+
+    checked = check_batch_eval(states[:200])
+    print(f"batch evaluation parity: {checked:,d} states match")
+    checked = check_incremental_eval(states[:500])
+    print(f"incremental evaluation parity: {checked:,d} positions match")
+    full_rate, incremental_rate = bench_incremental_eval(states)
+    print(f"evaluate_state:          {full_rate:12,.0f} moves/s")
+    print(f"incremental evaluation:  {incremental_rate:12,.0f} moves/s "
+          f"({incremental_rate / full_rate:.1f}x)")
+
+    for ai in (AdvancedHeuristicAI(), LearnedValueAI()):
+        single_cost, batch_cost = bench_evaluation_cost(ai, states)
+        print(f"{type(ai).__name__} evaluation:  {single_cost:6.1f} µs per "
+              f"position, {batch_cost:6.1f} µs batched")
+
+    listener_rate, headless_rate = bench_controller(5000)
+    print(f"controller with a listener:  {listener_rate:10,.0f} games/s")
+    print(f"headless controller:         {headless_rate:10,.0f} games/s "
+          f"({headless_rate / listener_rate:.2f}x)")
+
+    get_move_states = states[:200]
+    for ai in (SimpleHeuristicAI(), AdvancedHeuristicAI(), LearnedValueAI()):
+        rate = bench_get_move(ai, get_move_states)
+        print(f"{type(ai).__name__}.get_move:  {rate:12,.1f} moves/s")
+
+    from ai.mcts_ai import MCTSAI
+    budget_states = get_random_states(20, moves_played=1)
+    for ai in (ExpectiminimaxAI(max_depth=9), MCTSAI(), MCTSAI(ponder=True)):
+        mean_time, worst_time = bench_time_budget(
+            ai, budget_states, time_budget=0.05)
+        ai.stop_pondering()
+        print(f"{type(ai).__name__} with a 50 ms budget:  "
+              f"{mean_time * 1000:.1f} ms mean, "
+              f"{worst_time * 1000:.1f} ms worst")
+        assert worst_time <= 0.05 * TIME_BUDGET_TOLERANCE, \
+            f"{type(ai).__name__} overran its time budget"
+
+    workers = multiprocessing.cpu_count()
+    if workers > 1:
+        speedup = bench_parallel_search(get_random_states(
+            10, moves_played=1), max_depth=3, workers=workers)
+        print(f"ExpectiminimaxAI, depth 3, {workers} workers:  "
+              f"{speedup:.1f}x faster than 1 worker")
+        serial_rate, parallel_rate = bench_tournament(2000, workers)
+        print(f"tournament, {workers} workers:  {parallel_rate:,.0f} games/s "
+              f"({parallel_rate / serial_rate:.1f}x faster than 1 worker)")
@@ -0,0 +1,32 @@
+from enum import Enum
+
+
+class Direction(Enum):
+    UP = 1
+    DOWN = 2
+    LEFT = 3
+    RIGHT = 4
+
+    def opposite(self):
+        if self == Direction.UP:
+            return Direction.DOWN
+        elif self == Direction.DOWN:
+            return Direction.UP
+        elif self == Direction.LEFT:
+            return Direction.RIGHT
+        elif self == Direction.RIGHT:
+            return Direction.LEFT
+
+    def __str__(self):
+        if self == Direction.UP:
+            return "⬆️ "
+        elif self == Direction.DOWN:
+            return "⬇️ "
+        elif self == Direction.LEFT:
+            return "⬅️ "
+        elif self == Direction.RIGHT:
+            return "➡️ "
+
+    @staticmethod
+    def all_directions():
+        return [Direction.UP, Direction.DOWN, Direction.LEFT, Direction.RIGHT]
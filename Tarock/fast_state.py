@@ -0,0 +1,337 @@
+import random
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from game import Board, Card, Cell, Direction, GameState
+from ALL_CARDS import ALL_CARDS
+from attack_table import ATTACK_OUTCOMES, ATTACK_WIN, ATTACK_COINFLIP
+from zobrist import ZOBRIST_CELLS, ZOBRIST_HANDS, ZOBRIST_SIDE, \
+    ZOBRIST_FLIPS, ZOBRIST_HAND_REMOVALS
+
+# cells are indexed row by row, i.e. cell = row * 3 + col
+NUM_CELLS = 9
+FULL_MASK = (1 << NUM_CELLS) - 1
+EMPTY = -1
+
+# directions are encoded as small integers, in the same order as
+# Direction.all_directions() and ATTACK_OUTCOMES
+UP, DOWN, LEFT, RIGHT = range(4)
+DIRECTION_TO_INDEX = {Direction.UP: UP, Direction.DOWN: DOWN,
+                      Direction.LEFT: LEFT, Direction.RIGHT: RIGHT}
+OPPOSITE = (DOWN, UP, RIGHT, LEFT)
+
+# cards are identified by their id, i.e. their position in ALL_CARDS
+NUM_CARDS = len(ALL_CARDS)
+
+# for each cell, the (neighbor cell, direction of the neighbor, direction
+# of the cell seen from the neighbor) triples, see Board.NEIGHBORS
+NEIGHBORS = tuple(
+    tuple(
+        (coords[0] * 3 + coords[1], DIRECTION_TO_INDEX[direction],
+         DIRECTION_TO_INDEX[opposite])
+        for coords, direction, opposite in Board.NEIGHBORS[divmod(cell, 3)]
+    )
+    for cell in range(NUM_CELLS)
+)
+
+
+class FastGameState:
+    '''
+    A compact, integer-encoded game state meant for simulation and search.
+
+    Attributes:
+        cells: The id of the card placed on each of the 9 cells, or EMPTY.
+        owners: A bitmask over the cells, a set bit means the card on that cell is owned by player 1 (player 0 otherwise).
+        occupied: A bitmask over the cells, a set bit means the cell holds a card.
+        hands: For each player, the number of copies of each card (indexed as in ALL_CARDS) still in hand.
+        next_player: The player to move.
+        zobrist_key: The Zobrist key of the position, the same as the key of the corresponding GameState.
+
+    Moves are applied in place with make_move and reverted with unmake_move, no copies are made. In benchmark.py a make/unmake pair is about 6x
+    faster than TarockBaseAi.simulate_move. Keeping zobrist_key up to date costs about 6% of that, and is kept in make_move since the search,
+    the endgame solver and the evaluation cache read the key at nearly every node.
+    '''
+    __slots__ = ("cells", "owners", "occupied", "hands",
+                 "next_player", "zobrist_key", "history")
+
+    def __init__(
+            self,
+            cells: Optional[List[int]] = None,
+            owners: int = 0,
+            occupied: int = 0,
+            hands: Optional[Tuple[List[int], List[int]]] = None,
+            next_player: int = 0,
+            zobrist_key: Optional[int] = None
+    ):
+        self.cells = cells if cells is not None else [EMPTY] * NUM_CELLS
+        self.owners = owners
+        self.occupied = occupied
+        self.hands = hands if hands is not None else (
+            [0] * NUM_CARDS, [0] * NUM_CARDS)
+        self.next_player = next_player
+        self.zobrist_key = zobrist_key if zobrist_key is not None else self.compute_key()
+
+        # each entry is a (cell, card, captures, zobrist key before the move)
+        # tuple, used to revert moves
+        self.history: List[Tuple[int, int, int, int]] = []
+
+    def __copy__(self):
+        return FastGameState(
+            list(self.cells),
+            self.owners,
+            self.occupied,
+            (list(self.hands[0]), list(self.hands[1])),
+            self.next_player,
+            self.zobrist_key
+        )
+
+    def copy(self):
+        return self.__copy__()
+
+    @staticmethod
+    def from_game_state(game_state: GameState) -> "FastGameState":
+        '''
+        Encodes a GameState.
+        '''
+        state = FastGameState(next_player=game_state.get_next_player())
+        for row in range(3):
+            for col in range(3):
+                cell = game_state.board.get_cell_value((row, col))
+                if cell.card is None:
+                    continue
+                index = row * 3 + col
+                state.cells[index] = cell.card.id
+                state.occupied |= 1 << index
+                if cell.owner == 1:
+                    state.owners |= 1 << index
+        for player in range(2):
+            for card in game_state.player_hands[player]:
+                state.hands[player][card.id] += 1
+        state.zobrist_key = state.compute_key()
+        return state
+
+    def to_game_state(self) -> GameState:
+        '''
+        Decodes this state back into a GameState.
+        '''
+        cells = [[Cell() for _ in range(3)] for _ in range(3)]
+        for index in range(NUM_CELLS):
+            card = self.cells[index]
+            if card == EMPTY:
+                continue
+            row, col = divmod(index, 3)
+            cells[row][col] = Cell(Card.get_card_by_id(
+                card), (self.owners >> index) & 1)
+        player_hands = ([], [])
+        for player in range(2):
+            for card, count in enumerate(self.hands[player]):
+                for _ in range(count):
+                    player_hands[player].append(Card.get_card_by_id(card))
+        return GameState(Board(cells), player_hands,
+                         self.next_player, self.is_terminal())
+
+    def to_compact(self) -> Tuple[int, int, int, int, int]:
+        '''
+        Packs the state into a tuple of 5 ints, cheap to send to another process: the cards on the cells (4 bits per cell, EMPTY as 15), the owners,
+        the occupied cells, the hands (4 bits per card and player) and the next player.
+        '''
+        packed_cells = 0
+        for cell in range(NUM_CELLS):
+            packed_cells |= (self.cells[cell] & 15) << (4 * cell)
+        packed_hands = 0
+        for player in range(2):
+            for card in range(NUM_CARDS):
+                packed_hands |= self.hands[player][card] << (
+                    4 * (player * NUM_CARDS + card))
+        return packed_cells, self.owners, self.occupied, packed_hands, self.next_player
+
+    @staticmethod
+    def from_compact(
+            compact: Tuple[int, int, int, int, int]) -> "FastGameState":
+        '''
+        Unpacks a state packed with to_compact.
+        '''
+        packed_cells, owners, occupied, packed_hands, next_player = compact
+        cells = [EMPTY if (occupied >> cell) & 1 == 0 else (
+            packed_cells >> (4 * cell)) & 15 for cell in range(NUM_CELLS)]
+        hands = tuple(
+            [(packed_hands >> (4 * (player * NUM_CARDS + card)))
+             & 15 for card in range(NUM_CARDS)]
+            for player in range(2)
+        )
+        return FastGameState(cells, owners, occupied, hands, next_player)
+
+    def key(self) -> int:
+        '''
+        Returns the Zobrist key of the position.
+        '''
+        return self.zobrist_key
+
+    def compute_key(self) -> int:
+        '''
+        Computes the Zobrist key of the position from scratch.
+        '''
+        key = ZOBRIST_SIDE if self.next_player == 1 else 0
+        for cell in range(NUM_CELLS):
+            card = self.cells[cell]
+            if card != EMPTY:
+                key ^= ZOBRIST_CELLS[cell][card][(self.owners >> cell) & 1]
+        for player in range(2):
+            for card, count in enumerate(self.hands[player]):
+                key ^= ZOBRIST_HANDS[player][card][count]
+        return key
+
+    def get_next_player(self) -> int:
+        return self.next_player
+
+    def is_terminal(self) -> bool:
+        return self.occupied == FULL_MASK
+
+    def get_scores(self) -> List[int]:
+        '''
+        Returns the scores of the players, i.e. the number of cards each player owns on the board.
+        '''
+        player1_score = bin(self.owners).count("1")
+        return [bin(self.occupied).count("1") - player1_score, player1_score]
+
+    def get_empty_cells(self) -> List[int]:
+        return [cell for cell in range(
+            NUM_CELLS) if not (self.occupied >> cell) & 1]
+
+    def legal_moves(
+            self,
+            key: Optional[Callable[[Tuple[int, int]], float]] = None
+    ) -> Iterator[Tuple[int, int]]:
+        '''
+        Yields the legal moves of the player to move as (cell, card) tuples, each distinct move once.
+        Moves are generated lazily, cell by cell. If key is given, the moves are yielded in ascending order of key(move) instead.
+        '''
+        if key is not None:
+            yield from sorted(self.legal_moves(), key=key)
+            return
+
+        hand = self.hands[self.next_player]
+        cards = [card for card in range(NUM_CARDS) if hand[card] > 0]
+        occupied = self.occupied
+        for cell in range(NUM_CELLS):
+            if not (occupied >> cell) & 1:
+                for card in cards:
+                    yield cell, card
+
+    def get_attack_outcomes(self, cell: int, card: int) -> Tuple[int, int]:
+        '''
+        Determines the attacks caused by the player to move placing the card on the cell.
+
+        Returns a (captures, coinflips) pair of cell bitmasks: the opponent cells that are captured for sure, and the opponent cells whose capture depends on a coinflip.
+        '''
+        player = self.next_player
+        cells = self.cells
+        occupied = self.occupied
+        owners = self.owners
+        outcomes = ATTACK_OUTCOMES[card]
+        captures = 0
+        coinflips = 0
+        for neighbor, direction, _ in NEIGHBORS[cell]:
+            # only occupied cells owned by the other player are attacked
+            if not (occupied >> neighbor) & 1 or \
+                    ((owners >> neighbor) & 1) == player:
+                continue
+            outcome = outcomes[cells[neighbor]][direction]
+            if outcome == ATTACK_WIN:
+                captures |= 1 << neighbor
+            elif outcome == ATTACK_COINFLIP:
+                coinflips |= 1 << neighbor
+        return captures, coinflips
+
+    def get_chance_outcomes(self, cell: int,
+                            card: int) -> List[Tuple[float, int]]:
+        '''
+        Lists every coinflip outcome of the player to move placing the card on the cell, as (probability, captures) pairs, where captures can be passed to make_move.
+        '''
+        captures, coinflips = self.get_attack_outcomes(cell, card)
+        outcomes = [(1.0, captures)]
+        while coinflips:
+            # the attacker wins each coinflip with probability 1/2
+            lowest = coinflips & -coinflips
+            outcomes = [(probability / 2, outcome | lowest)
+                        for probability, outcome in outcomes] + \
+                [(probability / 2, outcome)
+                 for probability, outcome in outcomes]
+            coinflips ^= lowest
+        return outcomes
+
+    def get_successors(self, cell: int,
+                       card: int) -> List[Tuple[float, "FastGameState"]]:
+        '''
+        Lists every coinflip outcome of the player to move placing the card on the cell, as (probability, successor state) pairs.
+        '''
+        successors = []
+        for probability, captures in self.get_chance_outcomes(cell, card):
+            successor = self.copy()
+            successor.make_move(cell, card, captures)
+            successors.append((probability, successor))
+        return successors
+
+    def make_move(self, cell: int, card: int,
+                  captures: Optional[int] = None, rng=random) -> int:
+        '''
+        Places the card on the cell for the player to move, in place.
+
+        If captures (a bitmask of the opponent cells that change owner) is not given, it is determined by the attack rules, with coinflips drawn from rng
+        (the global random module by default). Returns the captures that were applied.
+        '''
+        if captures is None:
+            captures, coinflips = self.get_attack_outcomes(cell, card)
+            if coinflips:
+                # flip in the same order as the attack events of the Game
+                for neighbor, _, _ in NEIGHBORS[cell]:
+                    if (coinflips >> neighbor) & 1 and \
+                            rng.randint(0, 1) == self.next_player:
+                        captures |= 1 << neighbor
+
+        player = self.next_player
+        cells = self.cells
+        hand = self.hands[player]
+        key = self.zobrist_key
+        self.history.append((cell, card, captures, key))
+
+        # update the key for the placed card, the hand and the side to move,
+        # then for each captured card
+        key ^= ZOBRIST_CELLS[cell][card][player] ^ \
+            ZOBRIST_HAND_REMOVALS[player][card][hand[card]] ^ ZOBRIST_SIDE
+        if captures:
+            for neighbor, _, _ in NEIGHBORS[cell]:
+                if (captures >> neighbor) & 1:
+                    key ^= ZOBRIST_FLIPS[neighbor][cells[neighbor]]
+
+        bit = 1 << cell
+        cells[cell] = card
+        self.occupied |= bit
+        if player:
+            self.owners |= bit
+        self.owners ^= captures
+        hand[card] -= 1
+        self.next_player = 1 - player
+        self.zobrist_key = key
+        return captures
+
+    def unmake_move(self):
+        '''
+        Reverts the last move made with make_move.
+        '''
+        cell, card, captures, self.zobrist_key = self.history.pop()
+        player = 1 - self.next_player
+        bit = 1 << cell
+        self.next_player = player
+        self.hands[player][card] += 1
+        self.owners ^= captures
+        self.owners &= ~bit
+        self.occupied &= ~bit
+        self.cells[cell] = EMPTY
+
+    @staticmethod
+    def cell_to_coords(cell: int) -> Tuple[int, int]:
+        return divmod(cell, 3)
+
+    @staticmethod
+    def coords_to_cell(coords: Tuple[int, int]) -> int:
+        return coords[0] * 3 + coords[1]
@@ -2,42 +2,16 @@
 from dataclasses import dataclass
 from enum import Enum, Flag
 import random
-from typing import List, Optional, Tuple, Set
+from typing import Callable, Iterator, List, Optional, Tuple, Set
 from copy import copy
 
 # from coinflip_listener import CoinflipListenerMixin
-# from ALL_CARDS import ALL_CARDS, name_to_cardinfo
-
-
-class Direction(Enum):
-    UP = 1
-    DOWN = 2
-    LEFT = 3
-    RIGHT = 4
-
-    def opposite(self):
-        if self == Direction.UP:
-            return Direction.DOWN
-        elif self == Direction.DOWN:
-            return Direction.UP
-        elif self == Direction.LEFT:
-            return Direction.RIGHT
-        elif self == Direction.RIGHT:
-            return Direction.LEFT
-        
-    def __str__(self):
-        if self == Direction.UP:
-            return "⬆️ "
-        elif self == Direction.DOWN:
-            return "⬇️ "
-        elif self == Direction.LEFT:
-            return "⬅️ "
-        elif self == Direction.RIGHT:
-            return "➡️ "
-    
-    @staticmethod 
-    def all_directions():
-        return [Direction.UP, Direction.DOWN, Direction.LEFT, Direction.RIGHT]
+from direction import Direction
+from ALL_CARDS import ALL_CARDS, name_to_cardinfo, name_to_card_id
+from attack_table import ATTACK_OUTCOMES, ATTACK_WIN, ATTACK_COINFLIP
+from zobrist import ZOBRIST_CELLS, ZOBRIST_HANDS, ZOBRIST_SIDE, \
+    ZOBRIST_FLIPS, ZOBRIST_HAND_REMOVALS
+
 
 class Card:
     '''
@@ -50,39 +24,91 @@ class Card:
         directions: The directions this card "overpowers". 
             When attacking: the card ignores the defense of the cards in these directions. If the card being attacked doesn't have a defense in the opposite direction, the attack is automatically successful. Otherwise, the outcome depends on a coin toss.
             When defending: the card ignores the attack of the cards in these directions. If the card being attacked doesn't have an attack in the opposite direction, the attack is automatically failed. Otherwise, the outcome depends on a coin toss.
+        id: The index of the card in ALL_CARDS.
+
+    Cards are immutable and interned: there is exactly one Card per entry of ALL_CARDS, obtained with get_card_by_id, get_card_based_on_cardinfo or get_random_card.
+    Constructing a card returns that instance too. Equality is therefore an identity check, and cards can be used as dict/set keys.
     '''
-    # TODO: make immutable
-    def __init__(self, attack: int, defense: int, name: str, directions: List[Direction]):
-        self.attack = attack
-        self.defense = defense
-        self.name = name
-        self.directions = directions
+    __slots__ = ("attack", "defense", "name", "directions", "id")
+
+    def __new__(cls, attack: int, defense: int, name: str,
+                directions: List[Direction]):
+        # until INTERNED_CARDS is built below, this makes the instances.
+        # Afterwards it returns the interned card of the same ALL_CARDS entry
+        interned_cards = getattr(cls, "INTERNED_CARDS", None)
+        if interned_cards is None:
+            return super().__new__(cls)
+        if name not in name_to_card_id:
+            raise ValueError(f"unknown card {name}")
+        card = interned_cards[name_to_card_id[name]]
+        if (card.attack, card.defense, card.directions) != (
+                attack, defense, tuple(directions)):
+            raise ValueError(
+                f"{name} does not have attack {attack}, defense {defense} "
+                f"and directions {list(directions)}")
+        return card
+
+    def __init__(self, attack: int, defense: int, name: str,
+                 directions: List[Direction]):
+        # the interned card returned by __new__ is already initialized
+        if hasattr(self, "id"):
+            return
+        object.__setattr__(self, "attack", attack)
+        object.__setattr__(self, "defense", defense)
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "directions", tuple(directions))
+        object.__setattr__(self, "id", name_to_card_id[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Card is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Card is immutable")
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        # unpickle to the interned instance
+        return (Card.get_card_by_id, (self.id,))
 
     def __str__(self):
         if len(self.directions) == 0:
             return f"{self.name} (🗡️ {self.attack} 🛡️ {self.defense})"
         else:
-            direction_str = "".join([str(direction) for direction in self.directions])
+            direction_str = "".join([str(direction)
+                                    for direction in self.directions])
             return f"{self.name} (🗡️ {self.attack} 🛡️ {self.defense}, {direction_str})"
 
     def __repr__(self):
         return str(self)
-    
-    def __eq__(self, other):
-        return (self.attack == other.attack and self.defense == other.defense and self.directions == other.directions) or self.name == other.name
-    
+
     @staticmethod
-    def get_card_based_on_cardinfo(cardinfo):
-        return Card(cardinfo.attack, cardinfo.defense, cardinfo.name, cardinfo.directions)
-    
+    def get_card_by_id(card_id: int) -> "Card":
+        return Card.INTERNED_CARDS[card_id]
+
+    @staticmethod
+    def get_card_based_on_cardinfo(cardinfo) -> "Card":
+        return Card.INTERNED_CARDS[name_to_card_id[cardinfo.name]]
+
     @staticmethod
-    def get_random_card(ALL_CARDS):
+    def get_random_card(ALL_CARDS) -> "Card":
         return Card.get_card_based_on_cardinfo(random.choice(ALL_CARDS))
 
+
+# the only Card instances, indexed by card id
+Card.INTERNED_CARDS = tuple(Card(cardinfo.attack, cardinfo.defense,
+                            cardinfo.name, cardinfo.directions) for cardinfo in ALL_CARDS)
+
+
 class Cell:
     '''
     A cell in the game board. Can be either empty or occupied by a card.
     '''
+
     def __init__(self, card: Optional[Card] = None, owner: int = -1):
         self.card = card
         self.owner = owner
@@ -91,12 +117,17 @@ class Cell:
         return Cell(self.card, self.owner)
 
     def __str__(self):
-        return str(self.card) + f"*{self.owner+1}" if self.card is not None else "Empty"
+        return str(self.card) + \
+            f"*{self.owner+1}" if self.card is not None else "Empty"
+
 
 class Board:
     '''
     The board of the game. Contains 9 cells in a 3x3 grid, each of which can hold a card. Each cell can be either empty or occupied by a card. A cell which is occupied by a card must have a owner, which is one of the players.
+
+    Board.NEIGHBORS maps the coords of each cell to its on-board neighbors, as (neighbor coords, direction of the neighbor, direction of the cell seen from the neighbor) triples.
     '''
+
     def __init__(self, cells: Optional[List[List[Cell]]] = None):
         if cells is not None:
             self.cells = cells
@@ -116,17 +147,16 @@ class Board:
     def get_cell_owner(self, coords: Tuple[int, int]):
         row, col = coords
         return self.cells[row][col].owner if self.cells[row][col].card is not None else None
-    
+
     def get_empty_coords(self):
-        empty_coords = []
-        for row in range(3):
-            for col in range(3):
-                if self.is_cell_empty(row, col):
-                    empty_coords.append((row, col))
-        return empty_coords
-    
+        # row by row, reading the cells directly since this runs for every move
+        # of every game
+        return [(row, col) for row, cells in enumerate(self.cells)
+                for col, cell in enumerate(cells) if cell.card is None]
+
     def __str__(self) -> str:
-        # generate a pretty representation of the board with 3 rows and 3 columns, each cell in 20 characters wide
+        # generate a pretty representation of the board with 3 rows and 3
+        # columns, each cell in 20 characters wide
 
         # first, generate the top border
         board_str = "┌"+"─"*20+"┬"+"─"*20+"┬"+"─"*20+"┐\n"
@@ -144,8 +174,8 @@ class Board:
                             board_str += " "*20
                     else:
                         name_lines = cell.card.name.center(20).split('\n')
-                        attack_defense = f"(🗡️ {cell.card.attack}/🛡️ {cell.card.defense})".center(
-                            22)
+                        attack_defense = f"(🗡️ {cell.card.attack}/🛡️ {cell.card.defense})"
+                        attack_defense = attack_defense.center(22)
                         attack_defense_lines = attack_defense.split('\n')
                         if i == 1:
                             board_str += name_lines[0].center(20)
@@ -176,10 +206,9 @@ class Board:
 
         return board_str
 
-
-    
     @staticmethod
-    def get_adj_coord_in_direction(coord: Tuple[int, int], direction: Direction):
+    def get_adj_coord_in_direction(
+            coord: Tuple[int, int], direction: Direction):
         if direction == Direction.UP:
             temp_coord = (coord[0] - 1, coord[1])
         elif direction == Direction.DOWN:
@@ -193,9 +222,10 @@ class Board:
             raise ValueError("The cell is out of bounds.")
         else:
             return temp_coord
-        
+
     @staticmethod
-    def get_direction_of_other_about_this(this: Tuple[int, int], other: Tuple[int, int]):
+    def get_direction_of_other_about_this(
+            this: Tuple[int, int], other: Tuple[int, int]):
         if other[0] == this[0]:
             if other[1] == this[1] + 1:
                 return Direction.RIGHT
@@ -212,15 +242,42 @@ class Board:
     def get_fresh_board():
         return Board()
 
+
+def _build_neighbors(
+        coord: Tuple[int, int]
+) -> List[Tuple[Tuple[int, int], Direction, Direction]]:
+    neighbors = []
+    for direction in Direction.all_directions():
+        try:
+            neighbors.append((Board.get_adj_coord_in_direction(
+                coord, direction), direction, direction.opposite()))
+        except ValueError:
+            continue
+    return neighbors
+
+
+# for each cell, the on-board neighbors in the order of
+# Direction.all_directions(), so hot loops need no bounds checks
+Board.NEIGHBORS = {(row, col): _build_neighbors((row, col))
+                   for row in range(3) for col in range(3)}
+
+
 class GameState:
     '''
     The state of the game. Contains the board and the hands of the players.
+
+    The state also keeps the Zobrist key of the position (see zobrist.py), which identifies it for caches and transposition tables.
+    Changes to the board, the hands or the next player should go through place_card_for_next_player, set_cell_owner and switch_next_player so that the key is kept in step.
     '''
-    def __init__(self, board: Board , player_hands: Tuple[List[Card],List[Card]], next_player: int, terminal: bool = False):
+
+    def __init__(self, board: Board,
+                 player_hands: Tuple[List[Card], List[Card]], next_player: int,
+                 terminal: bool = False, zobrist_key: Optional[int] = None):
         self.board = board
         self.player_hands = player_hands
         self.next_player = next_player
         self.ended = terminal
+        self.zobrist_key = zobrist_key if zobrist_key is not None else self.compute_key()
 
     def __copy__(self):
         copied_board = copy(self.board)
@@ -228,29 +285,97 @@ class GameState:
             [card for card in self.player_hands[0]],
             [card for card in self.player_hands[1]]
         )
-        return GameState(copied_board, copied_player_hands, self.next_player)
+        return GameState(copied_board, copied_player_hands,
+                         self.next_player, zobrist_key=self.zobrist_key)
+
+    def key(self) -> int:
+        '''
+        Returns the Zobrist key of the position.
+        '''
+        return self.zobrist_key
+
+    def compute_key(self) -> int:
+        '''
+        Computes the Zobrist key of the position from scratch.
+        '''
+        key = ZOBRIST_SIDE if self.next_player == 1 else 0
+        for row in range(3):
+            for col in range(3):
+                cell = self.board.cells[row][col]
+                if cell.card is not None:
+                    key ^= ZOBRIST_CELLS[row * 3 +
+                                         col][cell.card.id][cell.owner]
+        for player in range(2):
+            hand = self.player_hands[player]
+            for card in set(hand):
+                key ^= ZOBRIST_HANDS[player][card.id][hand.count(card)]
+        return key
+
+    def place_card_for_next_player(self, coords: Tuple[int, int], card: Card):
+        '''
+        Places a card from the hand of the next player on the given (empty) cell, owned by that player. Attacks are not resolved.
+        '''
+        player = self.next_player
+        hand = self.player_hands[player]
+        cell_index = coords[0] * 3 + coords[1]
+        self.zobrist_key ^= ZOBRIST_CELLS[cell_index][card.id][player] ^ \
+            ZOBRIST_HAND_REMOVALS[player][card.id][hand.count(card)]
+        cell = self.board.cells[coords[0]][coords[1]]
+        cell.card = card
+        cell.owner = player
+        hand.remove(card)
+
+    def set_cell_owner(self, coords: Tuple[int, int], owner: int):
+        '''
+        Changes the owner of an occupied cell.
+        '''
+        cell = self.board.cells[coords[0]][coords[1]]
+        if cell.owner != owner:
+            self.zobrist_key ^= ZOBRIST_FLIPS[coords[0]
+                                              * 3 + coords[1]][cell.card.id]
+            cell.owner = owner
+
+    def switch_next_player(self):
+        self.zobrist_key ^= ZOBRIST_SIDE
+        self.next_player = 1 - self.next_player
 
     def get_player_hand(self, player: int):
         return self.player_hands[player]
-    
+
     def get_next_player(self):
         return self.next_player
-    
+
     def get_board(self):
         return self.board
-    
+
+    def legal_moves(
+            self,
+            key: Optional[Callable[[Tuple[Tuple[int, int], Card]], float]] = None
+    ) -> Iterator[Tuple[Tuple[int, int], Card]]:
+        '''
+        Yields the legal moves of the next player as ((row, col), card) tuples. Each move is yielded once, even if the hand holds several copies of the card.
+        Moves are generated lazily, cell by cell. If key is given, the moves are yielded in ascending order of key(move) instead, which requires generating them all first.
+        '''
+        if key is not None:
+            yield from sorted(self.legal_moves(), key=key)
+            return
+
+        # the distinct cards in hand, in the order they appear
+        cards = list(dict.fromkeys(self.player_hands[self.next_player]))
+        for coords in self.board.get_empty_coords():
+            for card in cards:
+                yield coords, card
+
     def is_terminal(self):
         '''
         Returns True if the this represents a terminal state, i.e. the game is over. The game is over if the board is full.
         '''
-        is_terminal_state = True
-        for row in range(3):
-            for col in range(3):
-                if self.board.is_cell_empty(row, col):
-                    is_terminal_state = False
-                    break
-        return is_terminal_state
-    
+        for cells in self.board.cells:
+            for cell in cells:
+                if cell.card is None:
+                    return False
+        return True
+
     def get_scores(self):
         '''
         Returns the scores of the players. The score of a player is the totally number of cards they own on the board.
@@ -262,53 +387,85 @@ class GameState:
                 if owner is not None:
                     scores[owner] += 1
         return scores
-    
+
 
 class AttackEvent:
     '''
     An event in the game, defined as an attack of a card to another card, (with the potential to change the state of the board).
     '''
-    def __init__(self, attacker: Card, defender: Card, attacker_coords: Tuple[int, int], defender_coords: Tuple[int, int], intiating_player: int):
+
+    def __init__(self, attacker: Card, defender: Card,
+                 attacker_coords: Tuple[int, int],
+                 defender_coords: Tuple[int, int], intiating_player: int,
+                 direction: Optional[Direction] = None):
         self.attacker = attacker
         self.defender = defender
         self.attacker_coords = attacker_coords
         self.defender_coords = defender_coords
         self.intiating_player = intiating_player
 
+        # the direction of the defender seen from the attacker
+        if direction is None:
+            direction = Board.get_direction_of_other_about_this(
+                attacker_coords, defender_coords)
+        self.direction = direction
+
+
 class Game:
     '''
     The game itself.
     '''
 
-    def __init__(self, starting_player: int, starting_hands: Tuple[List[Card],List[Card]], coinflip_listeners: Set = set()):
-        self.game_state = GameState(Board.get_fresh_board(), starting_hands, starting_player)
-        self.coinflip_listeners = coinflip_listeners
+    def __init__(
+            self,
+            starting_player: int,
+            starting_hands: Tuple[List[Card], List[Card]],
+            coinflip_listeners: Optional[Set] = None,
+            coinflip_rng: Optional[random.Random] = None,
+            mirror_coinflips: bool = False,
+    ):
+        self.game_state = GameState(
+            Board.get_fresh_board(), starting_hands, starting_player)
+
+        # a fresh set per game, a shared default would collect the listeners of
+        # every game ever created
+        self.coinflip_listeners = coinflip_listeners \
+            if coinflip_listeners is not None else set()
+
+        # the source of the coinflips, the global random module by default. A
+        # game replayed with the hands and the starting player swapped can
+        # reuse the seed of the original with mirror_coinflips set, so that
+        # each flip favors the same hand in both games
+        self.coinflip_rng = coinflip_rng if coinflip_rng is not None else random
+        self.mirror_coinflips = mirror_coinflips
 
     def get_game_state(self):
         return self.game_state
-    
+
     def register_coinflip_listener(self, listener):
         self.coinflip_listeners.add(listener)
-    
+
     def get_coinflip_result(self, event: AttackEvent):
-        favored_player = random.randint(0, 1)
-        for listener in self.coinflip_listeners:
-            listener._on_coinflip_result(event, favored_player)
+        favored_player = self.coinflip_rng.randint(0, 1)
+        if self.mirror_coinflips:
+            favored_player = 1 - favored_player
+        if self.coinflip_listeners:
+            for listener in self.coinflip_listeners:
+                listener._on_coinflip_result(event, favored_player)
         return favored_player
-    
+
     def place_card(self, row: int, col: int, card: Card):
         '''
         Plays a card on the board. The card is placed on the given cell and the cell is marked as owned by the given player.
         '''
-        
-        # TODO: legality check: is the cell empty? is the card in the player's hand? 
+
+        # TODO: legality check: is the cell empty? is the card in the player's
+        # hand?
 
         player = self.game_state.next_player
 
         # place the card on the board and remove it from the player's hand
-        self.game_state.board.cells[row][col].card = card
-        self.game_state.board.cells[row][col].owner = player
-        self.game_state.player_hands[player].remove(card)
+        self.game_state.place_card_for_next_player((row, col), card)
 
         # generate the events that this card causes
         attack_events = self._generate_attack_events((row, col), card, player)
@@ -316,103 +473,58 @@ class Game:
             self._resolve_attack_event(attack_event)
 
         # change the next player
-        self.game_state.next_player = 1 - self.game_state.next_player
+        self.game_state.switch_next_player()
 
         # check if the game is over
         self.game_state.ended = self.game_state.is_terminal()
 
-    def _generate_attack_events(self, attacker_coord: Tuple[int, int] , attacking_card: Card, attacking_player: int):
+    def _generate_attack_events(self, attacker_coord: Tuple[int, int],
+                                attacking_card: Card, attacking_player: int):
         '''
         Generates the attack events that this card causes.
         '''
         events = []
-        for direction in Direction.all_directions():
+        cells = self.game_state.board.cells
+        for defense_cell_coords, direction, _ in Board.NEIGHBORS[attacker_coord]:
 
             # get the defense cell in the given direction
-            try:
-                defense_cell_coords = Board.get_adj_coord_in_direction(attacker_coord, direction)
-                defense_cell = self.game_state.board.get_cell_value(defense_cell_coords)
-            except ValueError:
-                continue
+            defense_cell = cells[defense_cell_coords[0]][defense_cell_coords[1]]
 
             # if the defense cell is empty, no event is generated
             if defense_cell.card is None:
                 continue
 
-            # if the defense cell is owned by the attacking player, no event is generated
+            # if the defense cell is owned by the attacking player, no event is
+            # generated
             if defense_cell.owner == attacking_player:
                 continue
 
-            # if the defense cell is owned by the other player, an event is generated
-            new_event = AttackEvent(attacking_card, defense_cell.card, attacker_coord, defense_cell_coords, attacking_player)
+            # if the defense cell is owned by the other player, an event is
+            # generated
+            new_event = AttackEvent(attacking_card, defense_cell.card,
+                                    attacker_coord, defense_cell_coords,
+                                    attacking_player, direction)
             events.append(new_event)
 
         return events
-    
+
     def _resolve_attack_event(self, attack_event: AttackEvent):
         '''
         Resolves an event. Nothing happens if the attack is unsuccessful. If the attack is successful, the defender's ownership is transfered to the attacker.
         '''
         attack_successful = self._determine_attack_event_outcome(attack_event)
         if attack_successful:
-            defender_cell = self.game_state.board.get_cell_value(attack_event.defender_coords)
-            defender_cell.owner = attack_event.intiating_player
-
+            self.game_state.set_cell_owner(
+                attack_event.defender_coords, attack_event.intiating_player)
 
     def _determine_attack_event_outcome(self, event: AttackEvent):
         '''
         Resolves an event.
         '''
-        # determine the attack and defense directions and check for overpowering
-        attack_direction = Board.get_direction_of_other_about_this(event.attacker_coords, event.defender_coords)
-        defense_direction = Board.get_direction_of_other_about_this(event.defender_coords, event.attacker_coords)
-        attack_overpower = attack_direction in event.attacker.directions
-        defense_overpower = defense_direction in event.defender.directions
-
-        # attack is unsuccessful by default
-        attack_successful = False
-
-        # if both overpower, coin flip to determine outcome
-        if attack_overpower and defense_overpower:
+        # look up the outcome of the attack, only coin flips need more work
+        outcome = ATTACK_OUTCOMES[event.attacker.id][event.defender.id][
+            event.direction.value - 1]
+        if outcome == ATTACK_COINFLIP:
             favored_player = self.get_coinflip_result(event)
-            attack_successful = favored_player == event.intiating_player
-
-        # if only the attack overpowers, the attack is successful
-        elif attack_overpower:
-            attack_successful = True
-
-        # if only the defense overpowers, the attack is unsuccessful
-        elif defense_overpower:
-            attack_successful = False
-
-        # if neither overpower, compare the attack and defense values
-        else:
-            attack_advantage = event.attacker.attack - event.defender.defense
-            if attack_advantage > 0:
-                attack_successful = True
-            elif attack_advantage < 0:
-                attack_successful = False
-            else:
-                favored_player = self.get_coinflip_result(event)
-                attack_successful = favored_player == event.intiating_player
-
-        return attack_successful
-
-            
-
-
-                
-        
-
-
-
-
-    
-
-    
-
-    
-    
-
-
-    
+            return favored_player == event.intiating_player
+        return outcome == ATTACK_WIN
@@ -8,6 +8,7 @@ from tarock_player import TarockBasePlayer
 from ai.base_ai import TarockBaseAi
 from human_player import HumanTarockPlayer
 from tqdm import trange
+import random
 
 
 class TarockGameController(CoinflipListenerMixin):
@@ -17,21 +18,39 @@ class TarockGameController(CoinflipListenerMixin):
             self,
             player1: TarockBasePlayer,
             player2: TarockBasePlayer,
+            time_budget: Optional[float] = None,
     ):
-        # initialize the players
+        # initialize the players, and the time (in seconds) each of them gets
+        # per move, if limited
         self.players = [player1, player2]
+        self.time_budget = time_budget
         self.game_event_listeners: List[BaseGameEventListener] = []
-        self.player_game_event_listeners: List[Optional[BaseGameEventListener]] = [None, None]
+        self.player_game_event_listeners: List[Optional[BaseGameEventListener]] = [
+            None, None]
+        self.game: Optional[Game] = None
 
     # TODO: make this automatic
-    def register_event_listener(self, listener: BaseGameEventListener, player_index: int = -1):
+    def register_event_listener(self, listener: BaseGameEventListener,
+                                player_index: int = -1):
         self.game_event_listeners.append(listener)
 
         # TODO: safety check, maybe?
         if player_index >= 0:
             self.player_game_event_listeners[player_index] = listener
 
-    def dispatch_event(self, event: GameEvent, players_only = False, players_to_notify: List[int] = []):
+        # a game in progress starts reporting its coinflips once someone is
+        # listening
+        if self.game is not None:
+            self.game.register_coinflip_listener(self)
+
+    def is_headless(self) -> bool:
+        '''
+        Returns True if no listener is registered, in which case no events are built or dispatched and the game does not report its coinflips.
+        '''
+        return not self.game_event_listeners
+
+    def dispatch_event(self, event: GameEvent, players_only=False,
+                       players_to_notify: List[int] = []):
         if players_only:
             for player_index in players_to_notify:
                 listener = self.player_game_event_listeners[player_index]
@@ -40,13 +59,14 @@ class TarockGameController(CoinflipListenerMixin):
         else:
             for listener in self.game_event_listeners:
                 listener._on_game_event(event)
-        
 
     def start_new_game(
             self,
             starting_player: int = 0,
             starting_hands: Optional[Tuple[List[Card], List[Card]]] = None,
-            fair_start: bool = False
+            fair_start: bool = False,
+            coinflip_rng: Optional[random.Random] = None,
+            mirror_coinflips: bool = False,
     ):
         if starting_hands is None:
             player0_hand = [Card.get_random_card(ALL_CARDS) for _ in range(5)]
@@ -61,9 +81,11 @@ class TarockGameController(CoinflipListenerMixin):
                     starting_hands = (player0_hand, player1_hand)
 
         # initialize the game
-        self.game = Game(starting_player, starting_hands)
-        self.game.register_coinflip_listener(self)
-        self.dispatch_event(GameStartEvent(self.game.game_state))
+        self.game = Game(starting_player, starting_hands,
+                         coinflip_rng=coinflip_rng, mirror_coinflips=mirror_coinflips)
+        if not self.is_headless():
+            self.game.register_coinflip_listener(self)
+            self.dispatch_event(GameStartEvent(self.game.game_state))
 
         # play the game
         final_scores = self._start_game()
@@ -78,27 +100,32 @@ class TarockGameController(CoinflipListenerMixin):
 
             # get the next move from the player
             coord, card = self.players[next_to_play].get_move(
-                self.game.game_state)
-            
+                self.game.game_state, self.time_budget)
 
             # notify the listeners that player has made a move
-            self.dispatch_event(PlayerMoveEvent(
-                coord,
-                card,
-                initiating_player=next_to_play,
-            ))
+            if not self.is_headless():
+                self.dispatch_event(PlayerMoveEvent(
+                    coord,
+                    card,
+                    initiating_player=next_to_play,
+                ))
 
             # actually place the card on the board
             self.game.place_card(coord[0], coord[1], card)
 
-        # game ended, notify the listeners
-        self.dispatch_event(GameEndEvent(self.game.game_state))
+        # game ended, stop the players thinking on their opponent's turn, and
+        # notify the listeners
+        for player in self.players:
+            player.stop_pondering()
+        if not self.is_headless():
+            self.dispatch_event(GameEndEvent(self.game.game_state))
 
         # get and return the final scores
         final_scores = self.game.game_state.get_scores()
         return final_scores
 
-    def _on_coinflip_result(self, attack_event: AttackEvent, favored_player: int):
+    def _on_coinflip_result(self, attack_event: AttackEvent,
+                            favored_player: int):
         # notify the listeners that the coinflip has been resolved
         self.dispatch_event(CoinflipEvent(attack_event, favored_player))
 
@@ -141,7 +168,8 @@ if __name__ == "__main__":
     player_1 = RandomAI()
 
     # player_2 = RandomAI()
-    player_2 = SimpleHeuristicAI(attack_coefficient=1, defense_coefficient=1, presence_coefficient=5)
+    player_2 = SimpleHeuristicAI(
+        attack_coefficient=1, defense_coefficient=1, presence_coefficient=5)
 
     controller = TarockGameController(player_1, player_2)
     # controller.register_event_listener(player_1, 0)
@@ -152,7 +180,8 @@ if __name__ == "__main__":
 
     win_counts = [0, 0]
     for _ in trange(1000):
-        final_scores = controller.start_new_game(fair_start=True, starting_player=0)
+        final_scores = controller.start_new_game(
+            fair_start=True, starting_player=0)
         winner = 0 if final_scores[0] > final_scores[1] else 1
         win_counts[winner] += 1
 
@@ -2,13 +2,15 @@ from game import Game, Card, Board, Direction, AttackEvent, GameState
 from pprint import pprint
 from ALL_CARDS import ALL_CARDS
 from coinflip_listener import CoinflipListenerMixin
-from typing import Tuple
+from typing import Optional, Tuple
 from ai.base_ai import TarockBaseAi
 
+
 class SemiInteractiveTarockController(CoinflipListenerMixin):
 
     # setup the game, player 0 is human, player 1 is AI
-    def __init__(self, ai: TarockBaseAi, player_start: bool = True):
+    def __init__(self, ai: TarockBaseAi, player_start: bool = True,
+                 ai_time_budget: Optional[float] = None):
         player0_hand = [Card.get_random_card(ALL_CARDS) for _ in range(5)]
         player1_hand = [Card.get_random_card(ALL_CARDS) for _ in range(5)]
         starting_hands = (player0_hand, player1_hand)
@@ -16,6 +18,7 @@ class SemiInteractiveTarockController(CoinflipListenerMixin):
         self.game = Game(starting_player, starting_hands)
         self.game.register_coinflip_listener(self)
         self.ai = ai
+        self.ai_time_budget = ai_time_budget
         self.PLAYER = 0
         self.AI = 1
 
@@ -45,13 +48,16 @@ class SemiInteractiveTarockController(CoinflipListenerMixin):
                 print("\n\nPlayer's turn!")
                 # prompt the player to select a card for placement
                 print("Select a card to place on the board: [1-5]")
-                for i, card in enumerate(self.game.game_state.player_hands[self.game.game_state.get_next_player()]):
+                next_player = self.game.game_state.get_next_player()
+                hand = self.game.game_state.player_hands[next_player]
+                for i, card in enumerate(hand):
                     print(f"{i+1}: {card}")
                 card_index = int(input()) - 1
-                card = self.game.game_state.player_hands[self.game.game_state.get_next_player()][card_index]
+                card = hand[card_index]
 
                 # prompt the player to select a cell to place the card in
-                print("\nSelect a cell to place the card in: [1-9, upper left to lower right, row by row]")
+                print("\nSelect a cell to place the card in: "
+                      "[1-9, upper left to lower right, row by row]")
                 placement_index = int(input()) - 1
                 row = placement_index // 3
                 col = placement_index % 3
@@ -62,11 +68,14 @@ class SemiInteractiveTarockController(CoinflipListenerMixin):
             # AI's logic
             else:
                 print("\n\nAI's turn!")
-                coord, card = self.ai.get_move(self.game.game_state)
+                coord, card = self.ai.get_move(
+                    self.game.game_state, self.ai_time_budget)
                 print(f"AI places {card} at ({coord[0]}, {coord[1]})")
                 self.game.place_card(coord[0], coord[1], card)
 
-        # game ended, print the final board and declare the winner
+        # game ended, stop the AI thinking on the player's turn, print the final
+        # board and declare the winner
+        self.ai.stop_pondering()
         print("\n\nFinal Board:")
         self._print_board(self.game.game_state.board)
         final_scores = self.game.game_state.get_scores()
@@ -77,12 +86,15 @@ class SemiInteractiveTarockController(CoinflipListenerMixin):
         elif final_scores[0] < final_scores[1]:
             print("AI wins!")
 
-    def _on_coinflip_result(self, attack_event: AttackEvent, favored_player: int):
+    def _on_coinflip_result(self, attack_event: AttackEvent,
+                            favored_player: int):
         attacker = attack_event.attacker
         defender = attack_event.defender
         attacker_coords = attack_event.attacker_coords
         defender_coords = attack_event.defender_coords
-        print(f"\nCoin flip required for {attacker.name} ({attacker_coords[0]}, {attacker_coords[1]}) attacking {defender.name} ({defender_coords[0]}, {defender_coords[1]})")
+        print(f"\nCoin flip required for {attacker.name} "
+              f"({attacker_coords[0]}, {attacker_coords[1]}) attacking "
+              f"{defender.name} ({defender_coords[0]}, {defender_coords[1]})")
         if favored_player == self.PLAYER:
             print("Player wins the coinflip!")
         else:
@@ -90,7 +102,8 @@ class SemiInteractiveTarockController(CoinflipListenerMixin):
 
     @staticmethod
     def _print_board(board: Board):
-        # generate a pretty representation of the board with 3 rows and 3 columns, each cell in 20 characters wide
+        # generate a pretty representation of the board with 3 rows and 3
+        # columns, each cell in 20 characters wide
 
         # first, generate the top border
         board_str = "┌"+"─"*20+"┬"+"─"*20+"┬"+"─"*20+"┐\n"
@@ -108,7 +121,8 @@ class SemiInteractiveTarockController(CoinflipListenerMixin):
                             board_str += " "*20
                     else:
                         name_lines = cell.card.name.center(20).split('\n')
-                        attack_defense = f"(🗡️ {cell.card.attack}/🛡️ {cell.card.defense})".center(22)
+                        attack_defense = f"(🗡️ {cell.card.attack}/🛡️ {cell.card.defense})"
+                        attack_defense = attack_defense.center(22)
                         attack_defense_lines = attack_defense.split('\n')
                         if i == 1:
                             board_str += name_lines[0].center(20)
@@ -139,7 +153,8 @@ class SemiInteractiveTarockController(CoinflipListenerMixin):
 
         print(board_str)
 
+
 if __name__ == "__main__":
     from ai.random_ai import RandomAI
     controller = SemiInteractiveTarockController(RandomAI())
-    controller.start_game()
\ No newline at end of file
+    controller.start_game()
@@ -0,0 +1,282 @@
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+
+import numpy as np
+
+from tournament import PLAYER_FACTORIES, Tournament, tally
+
+# the factor from natural-log strengths to Elo
+ELO_PER_NEPER = 400 / math.log(10)
+
+
+def get_expected_score(elo_difference: float) -> float:
+    return 1 / (1 + 10 ** (-elo_difference / 400))
+
+
+class SPRT:
+    '''
+    A sequential probability ratio test between "the first player is elo_margin Elo weaker" (H0) and "it is elo_margin Elo stronger" (H1),
+    on the wins and losses of a pairing (draws carry no information on either). alpha and beta are the probabilities of deciding for the wrong player.
+    '''
+
+    def __init__(self, elo_margin: float = 20,
+                 alpha: float = 0.05, beta: float = 0.05):
+        self.p0 = get_expected_score(-elo_margin)
+        self.p1 = get_expected_score(elo_margin)
+        self.lower_bound = math.log(beta / (1 - alpha))
+        self.upper_bound = math.log((1 - beta) / alpha)
+
+    def get_llr(self, wins: int, losses: int) -> float:
+        '''
+        The log-likelihood ratio of H1 against H0.
+        '''
+        return wins * math.log(self.p1 / self.p0) + \
+            losses * math.log((1 - self.p1) / (1 - self.p0))
+
+    def get_decision(self, wins: int, losses: int) -> Optional[int]:
+        '''
+        Returns 0 if the first player is better, 1 if the second one is, or None if the test needs more games.
+        '''
+        llr = self.get_llr(wins, losses)
+        if llr >= self.upper_bound:
+            return 0
+        if llr <= self.lower_bound:
+            return 1
+        return None
+
+
+def fit_ratings(names: List[str], pairings: List[Dict], prior_elo: float = 1000,
+                iterations: int = 50) -> Dict[str, Tuple[float, float]]:
+    '''
+    Fits Bradley-Terry ratings to the results of the pairings by maximum likelihood, counting draws as half a win for each player.
+    A wide Gaussian prior on the ratings keeps them finite for players that never lost or never won.
+    Returns the Elo of each player, centered on the average player, with the half-width of its 95% confidence interval.
+    '''
+    index = {name: i for i, name in enumerate(names)}
+    n = len(names)
+    prior_precision = (ELO_PER_NEPER / prior_elo) ** 2
+
+    # pairwise win and game counts, wins[i, j] being the score of i against j
+    wins = np.zeros((n, n))
+    games = np.zeros((n, n))
+    for pairing in pairings:
+        if not all(name in index for name in pairing["players"]):
+            continue
+        i, j = (index[name] for name in pairing["players"])
+        draws = pairing["draws"]
+        wins[i, j] += pairing["wins"][0] + draws / 2
+        wins[j, i] += pairing["wins"][1] + draws / 2
+        games[i, j] += pairing["wins"][0] + pairing["wins"][1] + draws
+        games[j, i] = games[i, j]
+
+    # Newton's method on the log-likelihood, in natural-log strengths
+    strengths = np.zeros(n)
+    for _ in range(iterations):
+        expected = 1 / (1 + np.exp(strengths[None, :] - strengths[:, None]))
+        gradient = (wins - games * expected).sum(axis=1) - \
+            prior_precision * strengths
+        weights = games * expected * (1 - expected)
+        hessian = weights - np.diag(weights.sum(axis=1)) - \
+            prior_precision * np.eye(n)
+        step = np.linalg.solve(hessian, gradient)
+        strengths -= step
+        if np.abs(step).max() < 1e-9:
+            break
+
+    # the covariance of the strengths relative to their mean
+    covariance = np.linalg.inv(-hessian)
+    centering = np.eye(n) - 1 / n
+    centered_variances = np.diag(centering @ covariance @ centering.T)
+    elos = (strengths - strengths.mean()) * ELO_PER_NEPER
+    half_widths = 1.96 * np.sqrt(centered_variances) * ELO_PER_NEPER
+    return {name: (float(elos[i]), float(half_widths[i]))
+            for i, name in enumerate(names)}
+
+
+def get_pairing_seed(seed: int, name_0: str, name_1: str) -> int:
+    # the tournament seed of a pairing, which does not depend on the other
+    # players of the league
+    return random.Random(f"{seed}/{name_0}/{name_1}").getrandbits(64)
+
+
+class League:
+    '''
+    Plays a round robin between registered players, one pairing at a time, each in batches of games until an SPRT decides which player is better
+    or max_games are played. The results of the pairings and the fitted ratings are kept in a JSON file, so that a later run only plays
+    the pairings that are new or undecided, e.g. those of a newly registered player.
+
+    Pairings continue their tournament where they stopped, so their games are the same however many runs they are played over.
+    The seed is kept in the file too: a seed given for an existing file must match it, and None means the file's seed (0 for a new file).
+    '''
+
+    def __init__(
+            self,
+            path: str,
+            seed: Optional[int] = None,
+            workers: int = 1,
+            sprt: Optional[SPRT] = None,
+            batch_games: int = 100,
+            max_games: int = 2000,
+    ):
+        self.path = path
+        self.seed = seed if seed is not None else 0
+        self.workers = workers
+        self.sprt = sprt if sprt is not None else SPRT()
+        self.batch_games = batch_games
+        self.max_games = max_games
+        self.pairings: Dict[str, Dict] = {}
+        self.ratings: Dict[str, Tuple[float, float]] = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                data = json.load(file)
+            # the games of unfinished pairings continue from the seed they
+            # started with
+            if seed is not None and seed != data["seed"]:
+                raise ValueError(
+                    f"{path} was played with seed {data['seed']}, not {seed}")
+            self.seed = data["seed"]
+            self.pairings = {self._get_pairing_key(
+                *pairing["players"]): pairing for pairing in data["pairings"]}
+            self.ratings = {name: (rating["elo"], rating["ci95"])
+                            for name, rating in data["ratings"].items()}
+
+    @staticmethod
+    def _get_pairing_key(name_0: str, name_1: str) -> str:
+        return f"{name_0} vs {name_1}"
+
+    def play_pairing(self, name_0: str, name_1: str, verbose: bool = True,
+                     pool: Optional[multiprocessing.Pool] = None) -> Dict:
+        '''
+        Plays, or continues, the pairing between two players of PLAYER_FACTORIES until it is decided or max_games are played, saving after every batch.
+        The batches are played on the given pool of self.workers processes, or on a pool created for the pairing.
+        '''
+        if pool is None and self.workers > 1:
+            with multiprocessing.Pool(self.workers) as pool:
+                return self.play_pairing(name_0, name_1, verbose, pool)
+
+        key = self._get_pairing_key(name_0, name_1)
+        pairing = self.pairings.setdefault(key, {
+            "players": [name_0, name_1],
+            "wins": [0, 0],
+            "draws": 0,
+            "games": 0,
+            "decision": None,
+        })
+        tournament = Tournament(PLAYER_FACTORIES[name_0],
+                                PLAYER_FACTORIES[name_1],
+                                get_pairing_seed(self.seed, name_0, name_1),
+                                self.workers)
+
+        start = time.perf_counter()
+        start_games = pairing["games"]
+        while pairing["decision"] is None and pairing["games"] < self.max_games:
+            n_games = min(self.batch_games, self.max_games - pairing["games"])
+            wins_0, wins_1, draws = tally(
+                list(tournament.run(n_games, pairing["games"], pool)))
+            pairing["wins"][0] += wins_0
+            pairing["wins"][1] += wins_1
+            pairing["draws"] += draws
+            pairing["games"] += n_games
+            decision = self.sprt.get_decision(*pairing["wins"])
+            if decision is not None:
+                pairing["decision"] = pairing["players"][decision]
+            self.save()
+
+        if verbose and pairing["games"] > start_games:
+            if pairing["decision"] is not None:
+                outcome = f"{pairing['decision']} is better"
+            else:
+                outcome = "undecided"
+            rate = (pairing["games"] - start_games) / \
+                (time.perf_counter() - start)
+            print(f"{key}: {pairing['wins'][0]}-{pairing['wins'][1]}-"
+                  f"{pairing['draws']}, {outcome} after {pairing['games']} "
+                  f"games ({rate:,.1f} games/s)")
+        return pairing
+
+    def run(
+            self,
+            names: List[str],
+            verbose: bool = True,
+            pool: Optional[multiprocessing.Pool] = None
+    ) -> Dict[str, Tuple[float, float]]:
+        '''
+        Plays every pairing of the named players that is not finished yet, all on the given pool of self.workers processes or on one created for the run.
+        Then fits and saves the ratings of every player of the league, those of earlier runs included.
+        '''
+        if pool is None and self.workers > 1:
+            with multiprocessing.Pool(self.workers) as pool:
+                return self.run(names, verbose, pool)
+
+        for name_0, name_1 in combinations(names, 2):
+            # a pairing is kept in whichever order it was first played
+            if self._get_pairing_key(name_1, name_0) in self.pairings:
+                name_0, name_1 = name_1, name_0
+            self.play_pairing(name_0, name_1, verbose, pool)
+
+        # every player with a pairing in the file, in the order they were first
+        # played, then any named player without one
+        played_names = [name for pairing in self.pairings.values()
+                        for name in pairing["players"]]
+        all_names = list(dict.fromkeys(played_names + list(names)))
+        self.ratings = fit_ratings(all_names, list(self.pairings.values()))
+        self.save()
+        return self.ratings
+
+    def save(self):
+        with open(self.path, "w") as file:
+            json.dump({
+                "seed": self.seed,
+                "pairings": list(self.pairings.values()),
+                "ratings": {
+                    name: {"elo": elo, "ci95": half_width}
+                    for name, (elo, half_width) in self.ratings.items()
+                },
+            }, file, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rates players with a round-robin league of SPRT-stopped "
+        "pairings, kept in a JSON file.")
+    parser.add_argument("path", help="the league file, created if missing")
+    parser.add_argument(
+        "players", nargs="*",
+        help=f"the players to rate, among "
+        f"{', '.join(sorted(PLAYER_FACTORIES))} (all by default)")
+    parser.add_argument("--max-games", type=int, default=2000,
+                        help="the most games of a pairing")
+    parser.add_argument("--batch-games", type=int, default=100,
+                        help="the games played between two SPRT checks")
+    parser.add_argument("--elo-margin", type=float, default=20,
+                        help="the Elo difference the SPRT tells apart from "
+                        "its opposite")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument(
+        "--seed", type=int,
+        help="the seed of a new league file, which an existing file must "
+        "match (its own seed by default, 0 for a new file)")
+    parser.add_argument("--workers", type=int,
+                        default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+    for name in args.players:
+        if name not in PLAYER_FACTORIES:
+            parser.error(f"unknown player {name}")
+
+    try:
+        sprt = SPRT(args.elo_margin, args.alpha, args.alpha)
+        league = League(args.path, args.seed, args.workers, sprt,
+                        args.batch_games, args.max_games)
+    except ValueError as error:
+        parser.error(str(error))
+    ratings = league.run(args.players or list(PLAYER_FACTORIES))
+    for name, (elo, half_width) in sorted(
+            ratings.items(), key=lambda item: -item[1][0]):
+        print(f"{name:24s} {elo:+8.1f} ± {half_width:.1f}")
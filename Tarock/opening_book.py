@@ -0,0 +1,201 @@
+from array import array
+from bisect import bisect_left
+from math import comb
+from typing import Iterable, List, Optional, Tuple
+import argparse
+import multiprocessing
+import random
+import struct
+import time
+
+from game import Card, GameState
+from ALL_CARDS import ALL_CARDS
+from fast_state import FastGameState, NUM_CARDS
+from symmetry import canonicalize, inverse_transform_move
+
+HAND_SIZE = 5
+
+# the number of distinct hands, i.e. multisets of HAND_SIZE cards out of
+# ALL_CARDS
+NUM_HANDS = comb(NUM_CARDS + HAND_SIZE - 1, HAND_SIZE)
+
+BOOK_MAGIC = b"TRBK"
+
+
+def rank_hand(counts: List[int]) -> int:
+    '''
+    Maps a hand of HAND_SIZE cards, given as the number of copies of each card, to its index in [0, NUM_HANDS).
+    The sorted cards c_0 <= c_1 <= ... become the distinct numbers c_i + i, which are ranked in the combinatorial number system.
+    '''
+    rank = 0
+    i = 0
+    for card in range(NUM_CARDS):
+        for _ in range(counts[card]):
+            rank += comb(card + i, i + 1)
+            i += 1
+    return rank
+
+
+def get_opening_key(state: FastGameState) -> Tuple[Optional[int], int]:
+    '''
+    Returns the book key of an opening state and the symmetry transform taking the state to the canonical state the key stands for.
+    The key is None if the board is not empty or the hands are not full.
+    '''
+    if state.occupied or any(sum(hand) != HAND_SIZE for hand in state.hands):
+        return None, 0
+    canonical_state, transform = canonicalize(state)
+    mover = canonical_state.next_player
+    key = rank_hand(canonical_state.hands[mover]) * \
+        NUM_HANDS + rank_hand(canonical_state.hands[1 - mover])
+    return key, transform
+
+
+class OpeningBook:
+    '''
+    The best first moves of games, keyed by the two dealt hands (the hand of the player to move, then the other hand) up to the symmetries of the board.
+
+    Entries are kept as two parallel arrays sorted by key: the keys (4 bytes each, since there are NUM_HANDS ** 2 < 2 ** 32 hand pairs)
+    and the moves (1 byte each, cell * NUM_CARDS + card, in the canonical state). Lookups are a binary search.
+    '''
+
+    def __init__(self, keys: Optional[array]
+                 = None, moves: Optional[array] = None):
+        self.keys = keys if keys is not None else array("I")
+        self.moves = moves if moves is not None else array("B")
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lookup(self, state: FastGameState) -> Optional[Tuple[int, int]]:
+        '''
+        Returns the book (cell, card) move for the state, or None if the state is not an opening or not in the book.
+        '''
+        key, transform = get_opening_key(state)
+        if key is None:
+            return None
+        index = bisect_left(self.keys, key)
+        if index == len(self.keys) or self.keys[index] != key:
+            return None
+        return inverse_transform_move(
+            divmod(self.moves[index], NUM_CARDS), transform)
+
+    def lookup_game_state(
+            self,
+            game_state: GameState
+    ) -> Optional[Tuple[Tuple[int, int], Card]]:
+        '''
+        Same as lookup, for a GameState. The move is returned as ((row, col), card).
+        '''
+        move = self.lookup(FastGameState.from_game_state(game_state))
+        if move is None:
+            return None
+        return FastGameState.cell_to_coords(
+            move[0]), Card.get_card_by_id(move[1])
+
+    def save(self, path: str):
+        with open(path, "wb") as file:
+            file.write(BOOK_MAGIC + struct.pack("<I", len(self.keys)))
+            file.write(self.keys.tobytes())
+            file.write(self.moves.tobytes())
+
+    @staticmethod
+    def load(path: str) -> "OpeningBook":
+        with open(path, "rb") as file:
+            if file.read(4) != BOOK_MAGIC:
+                raise ValueError(f"{path} is not an opening book")
+            count, = struct.unpack("<I", file.read(4))
+            keys = array("I")
+            keys.frombytes(file.read(count * keys.itemsize))
+            moves = array("B")
+            moves.frombytes(file.read(count))
+        return OpeningBook(keys, moves)
+
+    @staticmethod
+    def build(ai, states: Iterable[FastGameState],
+              workers: int = 1) -> "OpeningBook":
+        '''
+        Searches the first move of every distinct canonical opening among the states with the given AI, on that many processes.
+        '''
+        canonical_states = {}
+        for state in states:
+            key, _ = get_opening_key(state)
+            if key is not None and key not in canonical_states:
+                canonical_states[key] = canonicalize(state)[0]
+
+        tasks = [(key, state.to_compact())
+                 for key, state in canonical_states.items()]
+        entries = []
+        if workers > 1:
+            with multiprocessing.Pool(workers, initializer=_init_builder,
+                                      initargs=(ai,)) as pool:
+                entries = list(pool.imap_unordered(
+                    _search_opening, tasks, chunksize=16))
+        else:
+            _init_builder(ai)
+            entries = [_search_opening(task) for task in tasks]
+
+        entries.sort()
+        return OpeningBook(array("I", [key for key, _ in entries]), array(
+            "B", [move for _, move in entries]))
+
+
+# the AI searching the openings in each builder process
+_builder_ai = None
+
+
+def _init_builder(ai):
+    global _builder_ai
+    _builder_ai = ai
+
+
+def _search_opening(
+        task: Tuple[int, Tuple[int, int, int, int, int]]) -> Tuple[int, int]:
+    key, compact_state = task
+    coords, card = _builder_ai.get_move(
+        FastGameState.from_compact(compact_state).to_game_state())
+    return key, FastGameState.coords_to_cell(coords) * NUM_CARDS + card.id
+
+
+def deal_opening(rng: random.Random) -> FastGameState:
+    '''
+    Deals two random hands like TarockGameController.start_new_game, with a random starting player.
+    '''
+    hands = ([0] * NUM_CARDS, [0] * NUM_CARDS)
+    for player in range(2):
+        for _ in range(HAND_SIZE):
+            hands[player][rng.randrange(NUM_CARDS)] += 1
+    return FastGameState(hands=hands, next_player=rng.randint(0, 1))
+
+
+if __name__ == "__main__":
+    from ai.expectiminimax_ai import ExpectiminimaxAI
+
+    parser = argparse.ArgumentParser(
+        description="Precomputes the first moves of random deals into an "
+        "opening book.")
+    parser.add_argument("path", help="the book file to write")
+    parser.add_argument("--deals", type=int, default=1000,
+                        help="the number of random deals")
+    parser.add_argument("--depth", type=int, default=3,
+                        help="the search depth of ExpectiminimaxAI")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int,
+                        default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    openings = [deal_opening(rng) for _ in range(args.deals)]
+
+    start = time.perf_counter()
+    book = OpeningBook.build(ExpectiminimaxAI(
+        max_depth=args.depth), openings, args.workers)
+    print(
+        f"searched {len(book):,d} openings in {time.perf_counter() - start:.1f}s")
+    book.save(args.path)
+
+    start = time.perf_counter()
+    found = sum(OpeningBook.load(args.path).lookup(
+        state) is not None for state in openings)
+    lookup_time = (time.perf_counter() - start) / len(openings)
+    print(f"{found:,d}/{len(openings):,d} deals found in "
+          f"{lookup_time * 1e6:.0f} µs per lookup")
@@ -0,0 +1,187 @@
+from typing import List, Tuple
+
+from game import Card, GameState
+from ALL_CARDS import ALL_CARDS
+from fast_state import FastGameState, NUM_CELLS, NUM_CARDS, EMPTY, NEIGHBORS
+
+# The 3x3 board has 8 symmetries (rotations and reflections), each given as a
+# function of (row, col). A card's overpower directions turn with the board,
+# so a transform maps a card onto the card with the same attack and defense
+# and the transformed directions. When ALL_CARDS has no such card (e.g. a
+# vertical flip of Kaktos would need a 5/4 card overpowering DOWN, and
+# Galactoss is 6/4), the transform is not a symmetry of any state holding
+# that card.
+TRANSFORMS = (
+    lambda row, col: (row, col),            # identity
+    lambda row, col: (col, 2 - row),        # rotate 90 degrees clockwise
+    lambda row, col: (2 - row, 2 - col),    # rotate 180 degrees
+    lambda row, col: (2 - col, row),        # rotate 270 degrees clockwise
+    lambda row, col: (row, 2 - col),        # flip left-right
+    lambda row, col: (2 - row, col),        # flip up-down
+    lambda row, col: (col, row),            # flip along the main diagonal
+    lambda row, col: (2 - col, 2 - row),    # flip along the anti-diagonal
+)
+IDENTITY = 0
+NUM_TRANSFORMS = len(TRANSFORMS)
+
+
+# CELL_MAPS[t][cell] is the image of the cell under transform t
+CELL_MAPS = tuple(
+    tuple(image[0] * 3 + image[1]
+          for image in (transform(*divmod(cell, 3)) for cell in range(NUM_CELLS)))
+    for transform in TRANSFORMS
+)
+
+# INVERSES[t] is the transform that undoes transform t
+INVERSES = tuple(
+    next(u for u in range(NUM_TRANSFORMS) if all(
+        CELL_MAPS[u][CELL_MAPS[t][cell]] == cell for cell in range(NUM_CELLS)))
+    for t in range(NUM_TRANSFORMS)
+)
+
+
+def _build_direction_maps():
+    # the image of a direction is read off the image of the neighbor of the
+    # center cell in that direction
+    center = 4
+    direction_maps = []
+    for cell_map in CELL_MAPS:
+        direction_map = [0] * 4
+        for neighbor, direction, _ in NEIGHBORS[center]:
+            image_direction = next(
+                d for n, d, _ in NEIGHBORS[center] if n == cell_map[neighbor])
+            direction_map[direction] = image_direction
+        direction_maps.append(tuple(direction_map))
+    return tuple(direction_maps)
+
+
+# DIRECTION_MAPS[t][direction] is the image of the direction (indexed as
+# in fast_state) under transform t
+DIRECTION_MAPS = _build_direction_maps()
+
+
+def _build_card_maps():
+    direction_indices = [
+        frozenset(direction.value - 1 for direction in cardinfo.directions)
+        for cardinfo in ALL_CARDS
+    ]
+    card_maps = []
+    for direction_map in DIRECTION_MAPS:
+        card_map = []
+        for card, cardinfo in enumerate(ALL_CARDS):
+            image_directions = frozenset(
+                direction_map[direction] for direction in direction_indices[card])
+            card_map.append(next(
+                (other for other, otherinfo in enumerate(ALL_CARDS)
+                 if otherinfo.attack == cardinfo.attack and
+                 otherinfo.defense == cardinfo.defense and
+                 direction_indices[other] == image_directions),
+                None
+            ))
+        card_maps.append(tuple(card_map))
+    return tuple(card_maps)
+
+
+# CARD_MAPS[t][card] is the id of the image of the card under transform t,
+# or None if ALL_CARDS has no such card
+CARD_MAPS = _build_card_maps()
+
+
+def get_valid_transforms(state: FastGameState) -> List[int]:
+    '''
+    Returns the transforms that map every card of the state (on the board and in the hands) onto a card of ALL_CARDS.
+    '''
+    present = [card for card in state.cells if card != EMPTY]
+    for hand in state.hands:
+        present.extend(card for card in range(NUM_CARDS) if hand[card] > 0)
+    return [t for t in range(NUM_TRANSFORMS) if all(
+        CARD_MAPS[t][card] is not None for card in present)]
+
+
+def transform_state(state: FastGameState, t: int) -> FastGameState:
+    '''
+    Returns the image of the state under transform t, which must be valid for it.
+    '''
+    cell_map = CELL_MAPS[t]
+    card_map = CARD_MAPS[t]
+    cells = [EMPTY] * NUM_CELLS
+    owners = 0
+    occupied = 0
+    for cell in range(NUM_CELLS):
+        card = state.cells[cell]
+        if card == EMPTY:
+            continue
+        image = cell_map[cell]
+        cells[image] = card_map[card]
+        occupied |= 1 << image
+        owners |= ((state.owners >> cell) & 1) << image
+    hands = ([0] * NUM_CARDS, [0] * NUM_CARDS)
+    for player in range(2):
+        for card in range(NUM_CARDS):
+            if state.hands[player][card]:
+                hands[player][card_map[card]] += state.hands[player][card]
+    return FastGameState(cells, owners, occupied, hands, state.next_player)
+
+
+def _get_order_key(state: FastGameState):
+    return (state.cells, state.owners, state.hands)
+
+
+def canonicalize(state: FastGameState) -> Tuple[FastGameState, int]:
+    '''
+    Maps the state onto the canonical representative of its symmetry class. Returns the representative and the transform t used, so that
+    the representative is transform_state(state, t). Moves found for the representative map back with inverse_transform_move(move, t).
+    '''
+    best_state = state
+    best_transform = IDENTITY
+    for t in get_valid_transforms(state):
+        if t == IDENTITY:
+            continue
+        candidate = transform_state(state, t)
+        if _get_order_key(candidate) < _get_order_key(best_state):
+            best_state = candidate
+            best_transform = t
+    if best_state is state:
+        best_state = state.copy()
+    return best_state, best_transform
+
+
+def get_canonical_key(state: FastGameState) -> int:
+    '''
+    Returns the Zobrist key of the canonical representative of the state, which is the same for all its symmetric images.
+    '''
+    return canonicalize(state)[0].zobrist_key
+
+
+def transform_move(move: Tuple[int, int], t: int) -> Tuple[int, int]:
+    '''
+    Maps a (cell, card) move onto its image under transform t.
+    '''
+    cell, card = move
+    return CELL_MAPS[t][cell], CARD_MAPS[t][card]
+
+
+def inverse_transform_move(move: Tuple[int, int], t: int) -> Tuple[int, int]:
+    '''
+    Maps a (cell, card) move of a state transformed with t back onto the original state.
+    '''
+    return transform_move(move, INVERSES[t])
+
+
+def canonicalize_game_state(game_state: GameState) -> Tuple[GameState, int]:
+    '''
+    Same as canonicalize, for a GameState.
+    '''
+    state, t = canonicalize(FastGameState.from_game_state(game_state))
+    return state.to_game_state(), t
+
+
+def inverse_transform_game_move(move: Tuple[Tuple[int, int], Card],
+                                t: int) -> Tuple[Tuple[int, int], Card]:
+    '''
+    Maps a ((row, col), card) move of a GameState transformed with t back onto the original state.
+    '''
+    coords, card = move
+    cell, card_id = inverse_transform_move(
+        (FastGameState.coords_to_cell(coords), card.id), t)
+    return FastGameState.cell_to_coords(cell), Card.get_card_by_id(card_id)
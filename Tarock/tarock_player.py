@@ -1,10 +1,22 @@
 from game import *
-from typing import Tuple
+from typing import Optional, Tuple
+
 
 class TarockBasePlayer:
-    def get_move(self, game_state: GameState) -> Tuple[Tuple[int, int], Card]:
+    def get_move(
+            self,
+            game_state: GameState,
+            time_budget: Optional[float] = None
+    ) -> Tuple[Tuple[int, int], Card]:
         '''
         Provided the current game state, return a move to make, in the form of a tuple of the form:
         ((row, col), card)
+        If a time budget (in seconds) is given, the move should be returned within it, give or take a few milliseconds.
+        '''
+        raise NotImplementedError("get_move not implemented")
+
+    def stop_pondering(self):
+        '''
+        Stops any thinking done on the opponent's turn, e.g. when the game is over. Players that do not ponder have nothing to stop.
         '''
-        raise NotImplementedError("get_move not implemented")
\ No newline at end of file
+        pass
@@ -0,0 +1,331 @@
+from functools import partial
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+import argparse
+import math
+import multiprocessing
+import random
+import time
+
+from tqdm import tqdm
+
+from ALL_CARDS import ALL_CARDS
+from game import Card
+from general_controller import TarockGameController
+from tarock_player import TarockBasePlayer
+from ai.random_ai import RandomAI
+from ai.heuristic_ai import SimpleHeuristicAI, AdvancedHeuristicAI
+from ai.learned_ai import LearnedValueAI
+from ai.expectiminimax_ai import ExpectiminimaxAI
+from ai.mcts_ai import MCTSAI
+
+# a picklable callable building a fresh player, e.g. a class or a
+# functools.partial, so that it can be sent to the worker processes
+PlayerFactory = Callable[[], TarockBasePlayer]
+
+# the players that can be named on the command line. Players with a time
+# limit are not included, since their games cannot be replayed exactly
+PLAYER_FACTORIES: Dict[str, PlayerFactory] = {
+    "RandomAI": RandomAI,
+    "SimpleHeuristicAI": SimpleHeuristicAI,
+    "AdvancedHeuristicAI": AdvancedHeuristicAI,
+    "LearnedValueAI": LearnedValueAI,
+    "ExpectiminimaxAI-2": partial(ExpectiminimaxAI, max_depth=2),
+    "ExpectiminimaxAI-3": partial(ExpectiminimaxAI, max_depth=3),
+    "MCTSAI-1000": partial(MCTSAI, time_limit=None, iterations=1000),
+}
+
+
+class GameResult(NamedTuple):
+    game_index: int
+    seed: int
+    starting_player: int
+    final_scores: Tuple[int, int]
+
+    @property
+    def winner(self) -> Optional[int]:
+        # None for a draw
+        if self.final_scores[0] == self.final_scores[1]:
+            return None
+        return 0 if self.final_scores[0] > self.final_scores[1] else 1
+
+
+def get_game_seed(seed: int, game_index: int) -> int:
+    '''
+    Derives the seed of a game from the seed of the tournament and the index of the game, independently of the other games,
+    so that any game can be replayed on its own.
+    '''
+    return random.Random(f"{seed}/{game_index}").getrandbits(64)
+
+
+def play_game(task: Tuple[PlayerFactory, PlayerFactory,
+              int, int, int, bool, Optional[float]]) -> GameResult:
+    '''
+    Plays one game between fresh players built by the factories, with the global random module seeded with the game's seed,
+    so that the deal, the coinflips and the random choices of the players only depend on it.
+    '''
+    factory_0, factory_1, game_index, seed, starting_player, fair_start, \
+        time_budget = task
+    random.seed(seed)
+    players = (factory_0(), factory_1())
+    controller = TarockGameController(*players, time_budget=time_budget)
+    final_scores = controller.start_new_game(
+        starting_player=starting_player, fair_start=fair_start)
+    return GameResult(game_index, seed, starting_player, tuple(final_scores))
+
+
+class PairedResult(NamedTuple):
+    deal_index: int
+    seed: int
+    # the scores of the game as dealt, then of its mirror, with the hands and
+    # the starting player swapped
+    final_scores: Tuple[Tuple[int, int], Tuple[int, int]]
+
+    @property
+    def score(self) -> float:
+        '''
+        The share of the pair won by player 0, in [0, 1], a draw counting as half a win.
+        '''
+        points = 0.0
+        for scores in self.final_scores:
+            if scores[0] > scores[1]:
+                points += 1.0
+            elif scores[0] == scores[1]:
+                points += 0.5
+        return points / 2
+
+
+def deal_hands(fair_start: bool = False) -> Tuple[List[Card], List[Card]]:
+    '''
+    Deals two random hands from the global random module, like TarockGameController.start_new_game.
+    '''
+    while True:
+        hands = ([Card.get_random_card(ALL_CARDS) for _ in range(5)],
+                 [Card.get_random_card(ALL_CARDS) for _ in range(5)])
+        if not fair_start or TarockGameController._hand_is_fair(hands):
+            return hands
+
+
+def play_paired_deal(task: Tuple[PlayerFactory, PlayerFactory,
+                     int, int, bool, Optional[float]]) -> PairedResult:
+    '''
+    Plays a deal twice between fresh players: as dealt, then with the hands and the starting player swapped, so that each player holds each hand once.
+    Both games draw their coinflips from the same seed, mirrored in the second game so that each flip favors the same hand,
+    and reseed the global random module, which the players draw from, with the deal's seed.
+    '''
+    factory_0, factory_1, deal_index, seed, fair_start, time_budget = task
+    random.seed(seed)
+    hands = deal_hands(fair_start)
+    starting_player = random.randint(0, 1)
+    coinflip_seed = random.getrandbits(64)
+
+    final_scores = []
+    for mirrored in (False, True):
+        random.seed(seed)
+        dealt_hands = (hands[1], hands[0]) if mirrored else hands
+        controller = TarockGameController(
+            factory_0(), factory_1(), time_budget=time_budget)
+        scores = controller.start_new_game(
+            starting_player=1 - starting_player if mirrored else starting_player,
+            starting_hands=(list(dealt_hands[0]), list(dealt_hands[1])),
+            coinflip_rng=random.Random(coinflip_seed),
+            mirror_coinflips=mirrored,
+        )
+        final_scores.append(tuple(scores))
+    return PairedResult(deal_index, seed, tuple(final_scores))
+
+
+def get_paired_statistics(
+        results: List[PairedResult]) -> Tuple[float, float, float]:
+    '''
+    Returns the mean score of player 0 over the pairs, its standard error, and the variance reduction of the pairing:
+    how many times more games independent deals would need for the same standard error, estimated from the per-game win rate.
+    '''
+    n = len(results)
+    scores = [result.score for result in results]
+    mean = sum(scores) / n
+    if n < 2:
+        return mean, math.inf, 1.0
+    variance = sum((score - mean) ** 2 for score in scores) / (n - 1)
+
+    # the variance of a single game's outcome, draws counting as half a win
+    game_scores = [1.0 if s[0] > s[1] else 0.5 if s[0] == s[1]
+                   else 0.0 for result in results for s in result.final_scores]
+    game_variance = sum(
+        (score - mean) ** 2 for score in game_scores) / (len(game_scores) - 1)
+
+    # a pair is two games, so independent games would reach a variance of the
+    # mean of game_variance / (2 n)
+    variance_reduction = game_variance / \
+        (2 * variance) if variance > 0 else math.inf
+    return mean, math.sqrt(variance / n), variance_reduction
+
+
+class Tournament:
+    '''
+    Plays games between two players on a process pool. Game i is seeded with get_game_seed(seed, i) and,
+    if alternate_start is set, started by player i % 2, so every game can be replayed on its own with replay(i).
+
+    Replays are exact as long as the players only depend on the global random module, i.e. do not search against the clock:
+    pass no time budget, and give search AIs a depth or an iteration count rather than a time limit.
+    '''
+
+    def __init__(
+            self,
+            factory_0: PlayerFactory,
+            factory_1: PlayerFactory,
+            seed: int = 0,
+            workers: int = 1,
+            fair_start: bool = False,
+            alternate_start: bool = True,
+            time_budget: Optional[float] = None,
+    ):
+        self.factories = (factory_0, factory_1)
+        self.seed = seed
+        self.workers = workers
+        self.fair_start = fair_start
+        self.alternate_start = alternate_start
+        self.time_budget = time_budget
+
+    def _get_task(
+            self,
+            game_index: int
+    ) -> Tuple[PlayerFactory, PlayerFactory, int, int, int, bool, Optional[float]]:
+        starting_player = game_index % 2 if self.alternate_start else 0
+        return (*self.factories, game_index, get_game_seed(self.seed,
+                game_index), starting_player, self.fair_start, self.time_budget)
+
+    def run(
+            self,
+            n_games: int,
+            first_game: int = 0,
+            pool: Optional[multiprocessing.Pool] = None
+    ) -> Iterator[GameResult]:
+        '''
+        Plays games first_game to first_game + n_games - 1, yielding their results as they finish, in no particular order.
+        The games are played on the given pool if any (which should have self.workers processes), so that several runs can share one, or else on a pool of their own.
+        '''
+        tasks = [self._get_task(game_index) for game_index in range(
+            first_game, first_game + n_games)]
+        if self.workers == 1:
+            yield from map(play_game, tasks)
+            return
+
+        # small chunks keep the results streaming and the workers balanced when
+        # game lengths vary
+        chunksize = max(1, min(16, n_games // (self.workers * 8)))
+        if pool is not None:
+            yield from pool.imap_unordered(play_game, tasks, chunksize=chunksize)
+            return
+        with multiprocessing.Pool(self.workers) as pool:
+            yield from pool.imap_unordered(play_game, tasks, chunksize=chunksize)
+
+    def replay(self, game_index: int) -> GameResult:
+        '''
+        Plays game game_index again in this process, returning the same result as in run.
+        '''
+        return play_game(self._get_task(game_index))
+
+    def _get_paired_task(
+            self,
+            deal_index: int
+    ) -> Tuple[PlayerFactory, PlayerFactory, int, int, bool, Optional[float]]:
+        return (*self.factories, deal_index, get_game_seed(self.seed,
+                deal_index), self.fair_start, self.time_budget)
+
+    def run_paired(
+            self,
+            n_deals: int,
+            first_deal: int = 0,
+            pool: Optional[multiprocessing.Pool] = None
+    ) -> Iterator[PairedResult]:
+        '''
+        Plays deals first_deal to first_deal + n_deals - 1 as mirrored pairs of games, see play_paired_deal, yielding their results as they finish.
+        Deal i is seeded like game i of run, and the pool is used like in run.
+        '''
+        tasks = [self._get_paired_task(deal_index) for deal_index in range(
+            first_deal, first_deal + n_deals)]
+        if self.workers == 1:
+            yield from map(play_paired_deal, tasks)
+            return
+
+        chunksize = max(1, min(8, n_deals // (self.workers * 8)))
+        if pool is not None:
+            yield from pool.imap_unordered(play_paired_deal, tasks, chunksize=chunksize)
+            return
+        with multiprocessing.Pool(self.workers) as pool:
+            yield from pool.imap_unordered(play_paired_deal, tasks, chunksize=chunksize)
+
+    def replay_paired(self, deal_index: int) -> PairedResult:
+        '''
+        Plays the pair of deal deal_index again in this process, returning the same result as in run_paired.
+        '''
+        return play_paired_deal(self._get_paired_task(deal_index))
+
+
+def tally(results: List[GameResult]) -> Tuple[int, int, int]:
+    '''
+    Returns the number of wins of player 0, of wins of player 1, and of draws.
+    '''
+    win_counts = [0, 0, 0]
+    for result in results:
+        winner = result.winner
+        win_counts[winner if winner is not None else 2] += 1
+    return tuple(win_counts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Plays a reproducible tournament between two players on "
+        "a process pool.")
+    parser.add_argument("player_0", choices=sorted(PLAYER_FACTORIES))
+    parser.add_argument("player_1", choices=sorted(PLAYER_FACTORIES))
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument("--fair-start", action="store_true",
+                        help="only deal hands of similar value, see "
+                        "TarockGameController._hand_is_fair")
+    parser.add_argument("--paired", action="store_true",
+                        help="play every deal twice, with the hands and the "
+                        "starting player swapped, and report paired "
+                        "statistics")
+    parser.add_argument("--replay", type=int, metavar="GAME_INDEX",
+                        help="replay a single game (a single deal if "
+                        "--paired) of the tournament and print its result")
+    args = parser.parse_args()
+
+    tournament = Tournament(
+        PLAYER_FACTORIES[args.player_0], PLAYER_FACTORIES[args.player_1],
+        args.seed, args.workers, args.fair_start)
+    if args.replay is not None:
+        print(tournament.replay_paired(args.replay)
+              if args.paired else tournament.replay(args.replay))
+    elif args.paired:
+        n_deals = args.games // 2
+        start = time.perf_counter()
+        paired_results = []
+        for result in tqdm(tournament.run_paired(n_deals), total=n_deals):
+            paired_results.append(result)
+        elapsed = time.perf_counter() - start
+
+        mean, standard_error, variance_reduction = get_paired_statistics(
+            paired_results)
+        print(f"{args.player_0} scored {mean:.3f} ± {standard_error:.3f} "
+              f"against {args.player_1} over {n_deals} paired deals")
+        print(f"pairing reduced the variance {variance_reduction:.1f}x, the "
+              f"games needed for the same precision with independent deals")
+        print(f"{2 * n_deals / elapsed:,.1f} games/s on {args.workers} workers")
+    else:
+        start = time.perf_counter()
+        results = []
+        for result in tqdm(tournament.run(args.games), total=args.games):
+            results.append(result)
+        elapsed = time.perf_counter() - start
+
+        wins_0, wins_1, draws = tally(results)
+        print(f"{args.player_0} won {wins_0} times")
+        print(f"{args.player_1} won {wins_1} times")
+        if draws:
+            print(f"{draws} draws")
+        print(f"{len(results) / elapsed:,.1f} games/s on {args.workers} workers")
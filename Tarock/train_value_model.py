@@ -0,0 +1,172 @@
+from functools import partial
+from typing import List, Tuple
+import argparse
+import multiprocessing
+import random
+import time
+
+import numpy as np
+
+from batch_sim import BatchGameState
+from fast_state import FastGameState, NUM_CARDS
+from ai.heuristic_ai import AdvancedHeuristicAI, BaseHeuristicAI
+from ai.learned_ai import LearnedValueAI, ValueModel, encode_batch, DEFAULT_WEIGHTS_PATH
+from tournament import PlayerFactory, Tournament, get_paired_statistics
+
+HAND_SIZE = 5
+
+# the AI playing the self-play games of each worker process
+_selfplay_ai = None
+
+
+def _init_selfplay(ai: BaseHeuristicAI):
+    global _selfplay_ai
+    _selfplay_ai = ai
+
+
+def play_selfplay_game(
+        task: Tuple[int, float]
+) -> Tuple[List[Tuple[int, int, int, int, int]], int]:
+    '''
+    Plays a random deal between two copies of the worker's AI, which play a random move with probability epsilon.
+    Returns the compact states of the game before each move, and 1 if player 0 won (0 otherwise).
+    '''
+    seed, epsilon = task
+    random.seed(seed)
+    hands = ([0] * NUM_CARDS, [0] * NUM_CARDS)
+    for player in range(2):
+        for _ in range(HAND_SIZE):
+            hands[player][random.randrange(NUM_CARDS)] += 1
+    state = FastGameState(hands=hands, next_player=random.randint(0, 1))
+
+    positions = []
+    while not state.is_terminal():
+        positions.append(state.to_compact())
+        if random.random() < epsilon:
+            move = random.choice(list(state.legal_moves()))
+        else:
+            coords, card = _selfplay_ai.get_move(state.to_game_state())
+            move = (FastGameState.coords_to_cell(coords), card.id)
+        state.make_move(*move)
+    scores = state.get_scores()
+    return positions, int(scores[0] > scores[1])
+
+
+def generate_data(pool: multiprocessing.Pool, n_games: int,
+                  epsilon: float, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Plays n_games self-play games on the pool. Returns the encoded positions and their outcomes.
+    '''
+    rng = random.Random(seed)
+    tasks = [(rng.getrandbits(64), epsilon) for _ in range(n_games)]
+    compact_states = []
+    targets = []
+    for positions, player0_won in pool.imap_unordered(
+            play_selfplay_game, tasks, chunksize=64):
+        compact_states.extend(positions)
+        targets.extend([player0_won] * len(positions))
+    batch = BatchGameState.from_states([FastGameState.from_compact(
+        compact_state) for compact_state in compact_states])
+    return encode_batch(batch), np.array(targets, dtype=np.float32)
+
+
+def train(model: ValueModel, features: np.ndarray, targets: np.ndarray,
+          epochs: int, seed: int, batch_size: int = 256,
+          learning_rate: float = 1e-3):
+    '''
+    Fits the model to the data with Adam, holding out 10% of it to report the validation loss after each epoch.
+    '''
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(targets))
+    n_validation = len(targets) // 10
+    validation, training = order[:n_validation], order[n_validation:]
+
+    parameters = model.get_parameters()
+    first_moments = [np.zeros_like(parameter) for parameter in parameters]
+    second_moments = [np.zeros_like(parameter) for parameter in parameters]
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    step = 0
+    for epoch in range(epochs):
+        rng.shuffle(training)
+        for start in range(0, len(training), batch_size):
+            indices = training[start:start + batch_size]
+            _, gradients = model.get_gradients(
+                features[indices], targets[indices])
+            step += 1
+            for parameter, gradient, m, v in zip(
+                    parameters, gradients, first_moments, second_moments):
+                m *= beta1
+                m += (1 - beta1) * gradient
+                v *= beta2
+                v += (1 - beta2) * gradient ** 2
+                parameter -= (learning_rate * (m / (1 - beta1 ** step)) /
+                              (np.sqrt(v / (1 - beta2 ** step)) + eps)).astype(np.float32)
+        validation_loss, _ = model.get_gradients(
+            features[validation], targets[validation])
+        print(f"  epoch {epoch + 1}: validation loss {validation_loss:.4f}")
+    model.clear_sparse_parameters()
+
+
+def play_match(factory_a: PlayerFactory, factory_b: PlayerFactory, n_deals: int,
+               seed: int, workers: int = 1) -> Tuple[float, float]:
+    '''
+    Plays every deal as a mirrored pair of games, see tournament.play_paired_deal. Returns the win rate of the first player and its standard error over the deals.
+    '''
+    tournament = Tournament(factory_a, factory_b, seed, workers)
+    win_rate, standard_error, _ = get_paired_statistics(
+        list(tournament.run_paired(n_deals)))
+    return win_rate, standard_error
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Trains the value model of LearnedValueAI on self-play outcomes.")
+    parser.add_argument("--output", default=DEFAULT_WEIGHTS_PATH)
+    parser.add_argument("--generations", type=int, default=4,
+                        help="rounds of self-play and training, the first "
+                        "one played by AdvancedHeuristicAI")
+    parser.add_argument("--games", type=int, default=40000,
+                        help="self-play games per generation")
+    parser.add_argument("--epsilon", type=float, default=0.2,
+                        help="the probability of a random move in self-play")
+    parser.add_argument("--epochs", type=int, default=8)
+    parser.add_argument("--hidden", type=int, default=64)
+    parser.add_argument("--eval-deals", type=int, default=2000,
+                        help="deals played against AdvancedHeuristicAI after training")
+    parser.add_argument("--workers", type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    model = ValueModel(args.hidden, np.random.default_rng(args.seed))
+    all_features, all_targets = [], []
+    for generation in range(args.generations):
+        # the first generation learns from the hand-written heuristic, the next
+        # ones from the model itself
+        if generation == 0:
+            selfplay_ai = AdvancedHeuristicAI()
+        else:
+            selfplay_ai = LearnedValueAI(model)
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.workers, initializer=_init_selfplay,
+                                  initargs=(selfplay_ai,)) as pool:
+            features, targets = generate_data(
+                pool, args.games, args.epsilon, args.seed + generation)
+        all_features.append(features)
+        all_targets.append(targets)
+        print(f"generation {generation + 1}: {len(targets):,d} positions "
+              f"from {type(selfplay_ai).__name__} in "
+              f"{time.perf_counter() - start:.1f}s")
+
+        train(model, np.concatenate(all_features), np.concatenate(
+            all_targets), args.epochs, args.seed + generation)
+
+    model.save(args.output)
+    print(f"wrote {args.output}")
+
+    win_rate, standard_error = play_match(
+        partial(LearnedValueAI, model), AdvancedHeuristicAI, args.eval_deals,
+        args.seed, args.workers)
+    print(f"LearnedValueAI against AdvancedHeuristicAI: {win_rate:.3f} ± "
+          f"{standard_error:.3f} win rate over {args.eval_deals:,d} paired "
+          f"deals")
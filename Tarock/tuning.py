@@ -0,0 +1,179 @@
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Tuple
+import argparse
+import json
+import math
+import multiprocessing
+import random
+import time
+
+from tournament import play_paired_deal
+from ai.heuristic_ai import SimpleHeuristicAI, AdvancedHeuristicAI
+
+# the heuristic AIs that can be tuned, all taking (defense, attack,
+# presence) coefficients
+AI_CLASSES = {
+    "SimpleHeuristicAI": SimpleHeuristicAI,
+    "AdvancedHeuristicAI": AdvancedHeuristicAI,
+}
+COEFFICIENT_NAMES = ("defense", "attack", "presence")
+
+
+def play_pair(task: Tuple[str, Tuple[float, ...],
+              Tuple[float, ...], int]) -> float:
+    '''
+    Plays a deal as a mirrored pair of games between two coefficient sets of the same AI, the first set as player 0, see tournament.play_paired_deal.
+    Returns the score of the first coefficient set: its wins minus its losses over both games, divided by 2, in [-1, 1].
+    '''
+    ai_name, coefficients_a, coefficients_b, seed = task
+    ai_class = AI_CLASSES[ai_name]
+    result = play_paired_deal((partial(ai_class, *coefficients_a),
+                              partial(ai_class, *coefficients_b), 0, seed, False, None))
+    return 2 * result.score - 1
+
+
+class SelfPlayMatch:
+    '''
+    Plays paired games between two coefficient sets on a process pool, in batches, until a z-test on the paired scores decides which is better
+    (|mean| > z * standard error) or the maximum number of pairs is reached.
+    '''
+
+    def __init__(self, pool: multiprocessing.Pool, ai_name: str,
+                 batch_pairs: int = 32, max_pairs: int = 256, z: float = 2.5):
+        self.pool = pool
+        self.ai_name = ai_name
+        self.batch_pairs = batch_pairs
+        self.max_pairs = max_pairs
+        self.z = z
+
+    def play(self, coefficients_a: Tuple[float, ...],
+             coefficients_b: Tuple[float, ...],
+             seeds: Iterator[int]) -> Tuple[float, float, int]:
+        '''
+        Returns the mean paired score of coefficients_a against coefficients_b, its standard error, and the number of pairs played.
+        '''
+        scores = []
+        while len(scores) < self.max_pairs:
+            tasks = [(self.ai_name, coefficients_a, coefficients_b, next(seeds))
+                     for _ in range(self.batch_pairs)]
+            scores.extend(self.pool.imap_unordered(play_pair, tasks))
+            mean, standard_error = get_mean_and_standard_error(scores)
+            if standard_error > 0 and abs(mean) > self.z * standard_error:
+                break
+        mean, standard_error = get_mean_and_standard_error(scores)
+        return mean, standard_error, len(scores)
+
+
+def get_mean_and_standard_error(values: List[float]) -> Tuple[float, float]:
+    n = len(values)
+    mean = sum(values) / n
+    if n < 2:
+        return mean, math.inf
+    variance = sum((value - mean) ** 2 for value in values) / (n - 1)
+    return mean, math.sqrt(variance / n)
+
+
+def spsa(
+        match: SelfPlayMatch,
+        start: Tuple[float, ...],
+        iterations: int,
+        seed: int = 0,
+        a: float = 2.0,
+        c: float = 0.5,
+        stability: float = 5.0,
+        verbose: bool = True
+) -> Tuple[float, ...]:
+    '''
+    Simultaneous perturbation stochastic approximation over the coefficients, maximizing the paired self-play score.
+    Each iteration plays theta + c_k * delta against theta - c_k * delta for a random +-1 vector delta, and moves theta along the estimated gradient.
+    Coefficients are kept non-negative. Returns the final coefficients.
+    '''
+    rng = random.Random(seed)
+    seeds = _derive_seeds(rng.getrandbits(64))
+    theta = list(start)
+    for k in range(iterations):
+        start_time = time.perf_counter()
+        a_k = a / (k + 1 + stability) ** 0.602
+        c_k = c / (k + 1) ** 0.101
+        delta = [rng.choice((-1, 1)) for _ in theta]
+        plus = tuple(max(value + c_k * d, 0.0)
+                     for value, d in zip(theta, delta))
+        minus = tuple(max(value - c_k * d, 0.0)
+                      for value, d in zip(theta, delta))
+
+        mean, standard_error, pairs = match.play(plus, minus, seeds)
+        theta = [max(value + a_k * mean / (2 * c_k * d), 0.0)
+                 for value, d in zip(theta, delta)]
+
+        if verbose:
+            values = ", ".join(f"{value:.3f}" for value in theta)
+            print(f"iteration {k + 1}: score {mean:+.3f} ± "
+                  f"{standard_error:.3f} over {pairs} pairs, "
+                  f"theta = ({values}), "
+                  f"{time.perf_counter() - start_time:.1f}s")
+    return tuple(theta)
+
+
+def _derive_seeds(seed: int) -> Iterator[int]:
+    # a distinct, reproducible seed for every game pair of the run
+    rng = random.Random(seed)
+    while True:
+        yield rng.getrandbits(64)
+
+
+def save_coefficients(path: str, ai_name: str, coefficients: Tuple[float, ...],
+                      validation: Optional[Dict[str, float]] = None):
+    with open(path, "w") as file:
+        json.dump({
+            "ai": ai_name,
+            "coefficients": dict(zip(COEFFICIENT_NAMES, coefficients)),
+            "validation": validation,
+        }, file, indent=4)
+
+
+def load_coefficients(path: str) -> Tuple[float, ...]:
+    '''
+    Reads the coefficients written by save_coefficients, in constructor order, e.g. AdvancedHeuristicAI(*load_coefficients(path)).
+    '''
+    with open(path) as file:
+        coefficients = json.load(file)["coefficients"]
+    return tuple(coefficients[name] for name in COEFFICIENT_NAMES)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Tunes the coefficients of a heuristic AI with SPSA over "
+        "paired self-play games.")
+    parser.add_argument("--ai", choices=sorted(AI_CLASSES),
+                        default="AdvancedHeuristicAI")
+    parser.add_argument("--start", type=float, nargs=3, default=(1.0, 1.0, 5.0),
+                        metavar=COEFFICIENT_NAMES, help="the starting coefficients")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--max-pairs", type=int, default=256,
+                        help="the most game pairs per comparison")
+    parser.add_argument("--validation-pairs", type=int, default=2000,
+                        help="the most game pairs of the final comparison "
+                        "against the start")
+    parser.add_argument("--workers", type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="best_coefficients.json")
+    args = parser.parse_args()
+
+    with multiprocessing.Pool(args.workers) as pool:
+        match = SelfPlayMatch(pool, args.ai, max_pairs=args.max_pairs)
+        best = spsa(match, tuple(args.start), args.iterations, args.seed)
+
+        # keep the tuned coefficients only if they beat the starting ones
+        validation_match = SelfPlayMatch(
+            pool, args.ai, batch_pairs=64, max_pairs=args.validation_pairs)
+        mean, standard_error, pairs = validation_match.play(
+            best, tuple(args.start), _derive_seeds(args.seed + 1))
+        print(f"tuned against start: {mean:+.3f} ± {standard_error:.3f} "
+              f"over {pairs} pairs")
+        if mean <= 0:
+            best = tuple(args.start)
+
+    save_coefficients(args.output, args.ai, best, {
+        "score": mean, "standard_error": standard_error, "pairs": pairs})
+    print(f"wrote {args.output}: {dict(zip(COEFFICIENT_NAMES, best))}")
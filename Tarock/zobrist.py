@@ -0,0 +1,53 @@
+import random
+from ALL_CARDS import ALL_CARDS
+
+# Zobrist keys identify positions: the key of a position is the XOR of the
+# keys of its parts, so it can be updated incrementally as moves are made.
+# The keys are drawn from a fixed seed so that they are the same in every
+# process and every run.
+
+NUM_CELLS = 9
+NUM_CARDS = len(ALL_CARDS)
+
+# the most copies of a card a hand can hold
+MAX_HAND_COUNT = 10
+
+_rng = random.Random(20230706)
+
+# ZOBRIST_CELLS[cell][card][owner]: the key of a card owned by a player on
+# a cell, with cells indexed row by row
+ZOBRIST_CELLS = tuple(
+    tuple(tuple(_rng.getrandbits(64) for _ in range(2))
+          for _ in range(NUM_CARDS))
+    for _ in range(NUM_CELLS)
+)
+
+# ZOBRIST_HANDS[player][card][count]: the key of a player holding count
+# copies of a card, holding none contributes nothing
+ZOBRIST_HANDS = tuple(
+    tuple(tuple(_rng.getrandbits(64) if count > 0 else 0 for count in range(
+        MAX_HAND_COUNT + 1)) for _ in range(NUM_CARDS))
+    for _ in range(2)
+)
+
+# the key of player 1 being the next to move
+ZOBRIST_SIDE = _rng.getrandbits(64)
+
+# ZOBRIST_FLIPS[cell][card]: the change of key when the card on a cell
+# changes owner
+ZOBRIST_FLIPS = tuple(
+    tuple(ZOBRIST_CELLS[cell][card][0] ^ ZOBRIST_CELLS[cell]
+          [card][1] for card in range(NUM_CARDS))
+    for cell in range(NUM_CELLS)
+)
+
+# ZOBRIST_HAND_REMOVALS[player][card][count]: the change of key when a
+# player goes from count to count - 1 copies of a card
+ZOBRIST_HAND_REMOVALS = tuple(
+    tuple(
+        tuple(ZOBRIST_HANDS[player][card][count] ^ ZOBRIST_HANDS[player][card]
+              [count - 1] if count > 0 else 0 for count in range(MAX_HAND_COUNT + 1))
+        for card in range(NUM_CARDS)
+    )
+    for player in range(2)
+)